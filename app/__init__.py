@@ -6,6 +6,7 @@ from flask_migrate import Migrate
 
 from config.config import config
 
+from .log import init_logging
 from .models import db, init_db
 
 
@@ -15,9 +16,35 @@ def create_app(config_name="default"):
     # Load configuration
     app.config.from_object(config[config_name])
 
+    # Configure logging (non-blocking queue handler)
+    init_logging(app)
+
     # Initialize database
     init_db(app)
 
+    # Initialize ingest buffer (INGEST_MODE=buffered), live state cache and SSE broker
+    from .services.ingest import init_ingest
+    from .services.live_state import init_live_state
+    from .services.stream import init_stream
+
+    init_ingest(app)
+    init_live_state(app)
+    init_stream(app)
+
+    # Close sessions that stopped receiving samples (SESSION_IDLE_TIMEOUT_SECONDS)
+    # and run queued Google Fit / Health Connect sync jobs (SYNC_WORKER_THREADS).
+    # Started on the first request in one process per host, never in CLI commands
+    from .services.background import init_background_workers
+    from .services.sessions import init_session_sweeper
+    from .services.sync_jobs import init_sync_worker
+
+    init_background_workers(app, [init_session_sweeper, init_sync_worker])
+
+    # Request timing and SQL instrumentation (METRICS_ENABLED)
+    from .metrics import init_metrics
+
+    init_metrics(app)
+
     # Set timezone
     app.timezone = pytz.timezone(app.config["TIMEZONE"])
 
@@ -27,6 +54,11 @@ def create_app(config_name="default"):
     app.register_blueprint(main.bp)
     app.register_blueprint(api.bp, url_prefix="/api")
 
+    # Register CLI commands
+    from .commands import init_commands
+
+    init_commands(app)
+
     @app.context_processor
     def utility_processor():
         def format_datetime(value, format="%Y-%m-%d %H:%M:%S"):
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+rollups_cli = AppGroup("rollups", help="ロールアップテーブルの管理")
+
+
+def _parse_date(ctx, param, value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise click.BadParameter("use YYYY-MM-DD")
+
+
+@rollups_cli.command("rebuild")
+@click.option("--from", "start_date", required=True, callback=_parse_date, help="開始日 (YYYY-MM-DD)")
+@click.option("--to", "end_date", required=True, callback=_parse_date, help="終了日 (YYYY-MM-DD)")
+def rebuild(start_date, end_date):
+    """指定期間のロールアップをデータポイントから作り直す"""
+    from .services.rollups import rebuild_rollups
+
+    count = rebuild_rollups(start_date, end_date)
+    click.echo(f"Rebuilt rollups from {count} data points ({start_date} - {end_date})")
+
+
+sessions_cli = AppGroup("sessions", help="セッションの管理")
+
+
+@sessions_cli.command("sweep")
+@click.option("--timeout", type=int, help="アイドルとみなす秒数（既定はSESSION_IDLE_TIMEOUT_SECONDS）")
+@click.option("--sync/--no-sync", default=None, help="終了したセッションを同期する（既定はSESSION_IDLE_AUTO_SYNC）")
+def sweep(timeout, sync):
+    """アイドル状態の進行中セッションを終了する"""
+    from .services.sessions import close_idle_sessions
+
+    if timeout is None:
+        timeout = current_app.config["SESSION_IDLE_TIMEOUT_SECONDS"]
+    if sync is None:
+        sync = current_app.config["SESSION_IDLE_AUTO_SYNC"]
+    if timeout <= 0:
+        raise click.UsageError("timeout must be positive")
+
+    sessions = close_idle_sessions(timeout, auto_sync=sync)
+    click.echo(f"Closed {len(sessions)} idle session(s)")
+
+
+@sessions_cli.command("purge-raw")
+@click.option("--days", type=int, help="保存する日数（既定はRAW_ARCHIVE_RETENTION_DAYS）")
+def purge_raw(days):
+    """保存期間を過ぎた受信パケットのアーカイブを削除する"""
+    from .services.raw_archive import purge_raw_packets
+
+    if days is None:
+        days = current_app.config["RAW_ARCHIVE_RETENTION_DAYS"]
+    if days <= 0:
+        raise click.UsageError("days must be positive")
+
+    count = purge_raw_packets(days)
+    click.echo(f"Deleted {count} raw packet row(s) older than {days} day(s)")
+
+
+@sessions_cli.command("compact")
+@click.option("--older-than-hours", type=int, help="終了からの経過時間（既定はSESSION_COMPACT_AFTER_HOURS）")
+@click.option("--limit", type=int, help="1回に圧縮するセッション数の上限")
+def compact(older_than_hours, limit):
+    """終了したセッションのデータポイントを列形式のアーカイブに圧縮する"""
+    from .services.point_archive import compact_sessions
+
+    if older_than_hours is None:
+        older_than_hours = current_app.config["SESSION_COMPACT_AFTER_HOURS"]
+    if older_than_hours < 0:
+        raise click.UsageError("older-than-hours must not be negative")
+
+    sessions, points = compact_sessions(older_than_hours, limit)
+    click.echo(f"Compacted {points} data points from {sessions} session(s)")
+
+
+@sessions_cli.command("recompute-stats")
+@click.option("--all", "recompute_all", is_flag=True, help="集計済みのセッションも作り直す")
+def recompute_stats(recompute_all):
+    """終了したセッションの平均・最小/最大・移動時間をデータポイントから集計し直す"""
+    from .services.sessions import recompute_running_stats
+
+    count = recompute_running_stats(recompute_all)
+    click.echo(f"Recomputed statistics for {count} session(s)")
+
+
+sync_cli = AppGroup("sync", help="Google Fit / Health Connectの同期ジョブ")
+
+
+@sync_cli.command("worker")
+@click.option("--threads", type=int, default=2, show_default=True, help="同時に実行するジョブ数")
+@click.option("--once", is_flag=True, help="実行待ちのジョブを1回だけ処理して終了する")
+def sync_worker(threads, once):
+    """同期ジョブを実行するワーカーを起動する"""
+    from .services.sync_jobs import SyncWorker
+
+    if threads <= 0:
+        raise click.UsageError("threads must be positive")
+
+    worker = SyncWorker(current_app._get_current_object(), threads)
+    if once:
+        count = worker.run_once()
+        click.echo(f"Ran {count} sync job(s)")
+        return
+
+    click.echo(f"Sync worker started with {threads} thread(s)")
+    worker.start()
+    worker.wake()
+    worker.join()
+
+
+@sync_cli.command("enqueue")
+@click.option("--from", "start_date", required=True, callback=_parse_date, help="開始日 (YYYY-MM-DD)")
+@click.option("--to", "end_date", required=True, callback=_parse_date, help="終了日 (YYYY-MM-DD)")
+@click.option("--device-id", help="対象のデバイス（省略時は全デバイス）")
+def sync_enqueue(start_date, end_date, device_id):
+    """指定期間の終了済みセッションの同期ジョブを登録する（同期済みのセッションは除く）"""
+    from .models import FitnessSession
+    from .services.sync_jobs import enqueue_sync
+
+    query = FitnessSession.query.filter(
+        FitnessSession.start_time >= start_date,
+        FitnessSession.start_time < end_date + timedelta(days=1),
+        FitnessSession.end_time.isnot(None),
+    )
+    if device_id:
+        query = query.filter_by(device_id=device_id)
+
+    session_ids = [session_id for (session_id,) in query.with_entities(FitnessSession.id)]
+    jobs = [enqueue_sync(session_id) for session_id in session_ids]
+    pending = sum(1 for job in jobs if job.status != job.SUCCEEDED)
+    click.echo(f"Enqueued {pending} sync job(s) for {len(jobs)} session(s)")
+
+
+def init_commands(app):
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(sessions_cli)
+    app.cli.add_command(sync_cli)
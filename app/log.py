@@ -0,0 +1,92 @@
+# app/log.py
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+
+from flask.logging import default_handler
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s"
+
+_listener = None
+_queue_handler = None
+
+
+class DebugRateLimitFilter(logging.Filter):
+    """DEBUGログを呼び出し箇所ごとにサンプリング・レート制限するフィルタ
+
+    呼び出し箇所ごとにsample_rateの割合だけ通し（1.0で全件、0で無し）、
+    さらに1秒あたりrate_limit件（0で無制限）を超えた分を捨てる。
+    レート制限で捨てた件数は次に通したログに付記する。INFO以上は常に通す。
+    """
+
+    def __init__(self, sample_rate=1.0, rate_limit=0):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._sites = {}  # (logger名, 行番号) -> [件数, 窓の開始時刻, 窓内の件数, 破棄数]
+        self.configure(sample_rate, rate_limit)
+
+    def configure(self, sample_rate, rate_limit):
+        self.sample_every = round(1 / sample_rate) if sample_rate > 0 else 0
+        self.rate_limit = rate_limit
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        if not self.sample_every:
+            return False
+
+        with self._lock:
+            site = self._sites.setdefault(
+                (record.name, record.lineno), [0, record.created, 0, 0]
+            )
+            site[0] += 1
+            if (site[0] - 1) % self.sample_every:
+                return False
+            if self.rate_limit:
+                if record.created - site[1] >= 1.0:
+                    site[1], site[2] = record.created, 0
+                if site[2] >= self.rate_limit:
+                    site[3] += 1
+                    return False
+                site[2] += 1
+            suppressed, site[3] = site[3], 0
+
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+def init_logging(app):
+    """appパッケージのロガーを設定
+
+    ログはQueueHandlerでキューに積むだけにし、標準エラーへの書き出しは
+    QueueListenerのスレッドで行う（リクエストのスレッドがログI/Oで待たない）。
+    """
+    global _listener, _queue_handler
+
+    logger = logging.getLogger(__package__)
+    logger.setLevel(app.config["LOG_LEVEL"].upper())
+    logger.removeHandler(default_handler)
+    logger.propagate = False
+
+    if _listener is None:
+        log_queue = queue.SimpleQueue()
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        _listener = logging.handlers.QueueListener(
+            log_queue, handler, respect_handler_level=True
+        )
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        _queue_handler = logging.handlers.QueueHandler(log_queue)
+        _queue_handler.addFilter(DebugRateLimitFilter())
+        logger.addHandler(_queue_handler)
+
+    for log_filter in _queue_handler.filters:
+        log_filter.configure(
+            app.config["LOG_DEBUG_SAMPLE_RATE"], app.config["LOG_DEBUG_RATE_LIMIT"]
+        )
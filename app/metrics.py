@@ -0,0 +1,191 @@
+# app/metrics.py
+
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+
+from .models import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """ラベルの組ごとに値の分布を保持するPrometheus形式のヒストグラム"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # ラベル値のタプル -> [バケットごとの件数..., 合計, 件数]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            label_text = ",".join(
+                f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels)
+            )
+            prefix = label_text + "," if label_text else ""
+            suffix = "{" + label_text + "}" if label_text else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{suffix} {series[-2]}")
+            lines.append(f"{self.name}_count{suffix} {series[-1]}")
+        return "\n".join(lines)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """リクエストごとの処理時間・SQL・シリアライズ・レスポンスサイズを集計する
+
+    値はワーカープロセスごとに保持する（gunicornの複数ワーカーでは
+    /metrics はリクエストを受けたワーカーの値を返す）。
+    """
+
+    def __init__(self):
+        self.request_duration = Histogram(
+            "fit2go_http_request_duration_seconds",
+            "Time spent handling a request until the response headers are ready.",
+            ("endpoint", "method", "status"),
+            LATENCY_BUCKETS,
+        )
+        self.response_size = Histogram(
+            "fit2go_http_response_size_bytes",
+            "Size of non-streamed response bodies.",
+            ("endpoint",),
+            SIZE_BUCKETS,
+        )
+        self.db_queries = Histogram(
+            "fit2go_db_queries_per_request",
+            "Number of SQL statements executed per request.",
+            ("endpoint",),
+            COUNT_BUCKETS,
+        )
+        self.db_duration = Histogram(
+            "fit2go_db_query_duration_seconds",
+            "Time spent executing SQL statements, per statement.",
+            ("endpoint",),
+            LATENCY_BUCKETS,
+        )
+        self.serialize_duration = Histogram(
+            "fit2go_json_serialize_duration_seconds",
+            "Time spent serializing JSON responses per request.",
+            ("endpoint",),
+            LATENCY_BUCKETS,
+        )
+
+    def render(self):
+        histograms = (
+            self.request_duration,
+            self.response_size,
+            self.db_queries,
+            self.db_duration,
+            self.serialize_duration,
+        )
+        return "\n".join(histogram.render() for histogram in histograms) + "\n"
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """jsonifyのシリアライズ時間をリクエストごとに加算するJSONプロバイダ"""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            if has_request_context() and "metrics_started" in g:
+                g.metrics_serialize_time += time.perf_counter() - started
+
+
+def _endpoint():
+    return request.endpoint or "unmatched"
+
+
+def init_metrics(app):
+    """METRICS_ENABLEDの場合に計測のフックと /metrics を登録"""
+    if not app.config["METRICS_ENABLED"]:
+        return
+
+    metrics = Metrics()
+    app.extensions["metrics"] = metrics
+    app.json = TimedJSONProvider(app)
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["metrics_query_started"] = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context() or "metrics_started" not in g:
+            return
+        elapsed = time.perf_counter() - conn.info["metrics_query_started"]
+        g.metrics_query_count += 1
+        g.metrics_query_time += elapsed
+        metrics.db_duration.observe((_endpoint(),), elapsed)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_query_count = 0
+        g.metrics_query_time = 0.0
+        g.metrics_serialize_time = 0.0
+
+    @app.after_request
+    def record_request(response):
+        if "metrics_started" not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_started
+        endpoint = _endpoint()
+
+        metrics.request_duration.observe(
+            (endpoint, request.method, str(response.status_code)), elapsed
+        )
+        metrics.db_queries.observe((endpoint,), g.metrics_query_count)
+        metrics.serialize_duration.observe((endpoint,), g.metrics_serialize_time)
+        if not response.is_streamed:
+            metrics.response_size.observe((endpoint,), response.calculate_content_length() or 0)
+
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={g.metrics_query_time * 1000:.2f};desc="{g.metrics_query_count} queries", '
+            f"serialize;dur={g.metrics_serialize_time * 1000:.2f}, "
+            f"total;dur={elapsed * 1000:.2f}",
+        )
+        return response
+
+    @app.route("/metrics")
+    def prometheus_metrics():
+        """Prometheusのテキスト形式で計測値を返す"""
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
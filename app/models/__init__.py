@@ -8,4 +8,9 @@ def init_db(app):
     db.init_app(app)
     migrate.init_app(app, db)
 
+from .credential import ServiceCredential
 from .fitness_data import DataPoint, FitnessSession
+from .raw_packet import RawPacket
+from .rollups import DailyRollup, HourlyRollup
+from .session_archive import SessionArchive
+from .sync_job import GoogleFitChunk, SyncJob
@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from . import db
+
+# デバイスごとの認証情報がない場合に使う共通の所有者
+DEFAULT_OWNER = "default"
+
+
+class ServiceCredential(db.Model):
+    """外部サービス（Google Fit / Health Connect）の認証情報（暗号化して保存）"""
+
+    __tablename__ = "service_credentials"
+
+    id = db.Column(db.Integer, primary_key=True)
+    service = db.Column(db.String(30), nullable=False)  # "google_fit" / "health_connect"
+    owner = db.Column(db.String(50), nullable=False, default=DEFAULT_OWNER)  # デバイスID
+    encrypted_data = db.Column(db.Text, nullable=False)  # Fernetトークン
+    expiry = db.Column(db.DateTime)  # アクセストークンの期限（UTC）
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint("service", "owner", name="uq_service_credentials_owner"),
+    )
+
+    def __repr__(self):
+        return f"<ServiceCredential {self.service} - {self.owner}>"
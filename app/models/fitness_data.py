@@ -1,7 +1,11 @@
+import math
 from datetime import datetime
 
 from . import db
 
+# 取り込み時に集計する指標（列名の接頭辞 -> DataPointの列）
+STATS_METRICS = {"speed": "speed_kmh", "rpm": "rpm", "mets": "mets"}
+
 
 class FitnessSession(db.Model):
     __tablename__ = "fitness_sessions"
@@ -10,17 +14,71 @@ class FitnessSession(db.Model):
     device_id = db.Column(db.String(50), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     end_time = db.Column(db.DateTime)
+    last_seen_at = db.Column(db.DateTime)  # 最後にサンプルを受信した時刻（アイドル判定用）
     total_time_seconds = db.Column(db.Integer, default=0)
     total_distance_km = db.Column(db.Float, default=0.0)
     total_calories_kcal = db.Column(db.Float, default=0.0)
     average_speed_kmh = db.Column(db.Float, default=0.0)
     average_rpm = db.Column(db.Float, default=0.0)
     average_mets = db.Column(db.Float, default=0.0)
+    # 取り込み時にサンプルごとに加算する集計値（services/sessions.py update_running_stats）
+    sample_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    speed_sum = db.Column(db.Float, nullable=False, default=0.0, server_default="0")
+    speed_sq_sum = db.Column(db.Float, nullable=False, default=0.0, server_default="0")
+    speed_min = db.Column(db.Float)
+    speed_max = db.Column(db.Float)
+    rpm_sum = db.Column(db.Float, nullable=False, default=0.0, server_default="0")
+    rpm_sq_sum = db.Column(db.Float, nullable=False, default=0.0, server_default="0")
+    rpm_min = db.Column(db.Float)
+    rpm_max = db.Column(db.Float)
+    mets_sum = db.Column(db.Float, nullable=False, default=0.0, server_default="0")
+    mets_sq_sum = db.Column(db.Float, nullable=False, default=0.0, server_default="0")
+    mets_min = db.Column(db.Float)
+    mets_max = db.Column(db.Float)
+    # SESSION_MOVING_SPEED_KMH以上で走っていた時間
+    moving_time_seconds = db.Column(db.Float, nullable=False, default=0.0, server_default="0")
+    last_sample_at = db.Column(db.DateTime)  # 最後に集計したサンプルの時刻
     raw_data = db.Column(db.JSON)  # SQLiteではJSON型を使用
     data_points = db.relationship(
         "DataPoint", backref="session", lazy=True, cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        # カレンダー・ダウンロードの期間検索
+        db.Index("ix_fitness_sessions_start_time", "start_time"),
+        # デバイスごとのアクティブセッション検索（end_time IS NULLの部分インデックス）
+        db.Index(
+            "ix_fitness_sessions_active_device_id",
+            "device_id",
+            postgresql_where=db.text("end_time IS NULL"),
+            sqlite_where=db.text("end_time IS NULL"),
+        ),
+    )
+
+    def _metric_stats(self, metric):
+        count = self.sample_count or 0
+        if not count:
+            return {"avg": None, "min": None, "max": None, "stddev": None}
+        mean = getattr(self, f"{metric}_sum") / count
+        variance = getattr(self, f"{metric}_sq_sum") / count - mean * mean
+        return {
+            "avg": mean,
+            "min": getattr(self, f"{metric}_min"),
+            "max": getattr(self, f"{metric}_max"),
+            "stddev": math.sqrt(max(variance, 0.0)),
+        }
+
+    def stats_to_dict(self):
+        """取り込み時に集計した統計値（追加のクエリなし）"""
+        return {
+            "sample_count": self.sample_count or 0,
+            "moving_time_seconds": self.moving_time_seconds or 0.0,
+            **{
+                column: self._metric_stats(metric)
+                for metric, column in STATS_METRICS.items()
+            },
+        }
+
     def __repr__(self):
         return f"<FitnessSession {self.id} - {self.start_time}>"
 
@@ -40,5 +98,12 @@ class DataPoint(db.Model):
     time_seconds = db.Column(db.Integer)
     mets = db.Column(db.Float)
 
+    __table_args__ = (
+        # セッション単位の時系列取得（履歴・エクスポート・Google Fit）
+        db.Index("ix_data_points_session_id_timestamp", "session_id", "timestamp"),
+        # 日次統計の期間検索
+        db.Index("ix_data_points_timestamp", "timestamp"),
+    )
+
     def __repr__(self):
         return f"<DataPoint {self.id} - {self.timestamp}>"
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from . import db
+
+
+class RawPacket(db.Model):
+    """受信したパケットのアーカイブ（追記のみ。zlib圧縮したJSON配列）
+
+    1行は1回の書き込み（直接モードでは1パケット、バッファモードではフラッシュ単位）。
+    """
+
+    __tablename__ = "raw_packets"
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(
+        db.Integer, db.ForeignKey("fitness_sessions.id"), nullable=False
+    )
+    device_id = db.Column(db.String(50), nullable=False)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    packet_count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (
+        # セッション単位の読み出し
+        db.Index("ix_raw_packets_session_id", "session_id"),
+        # 保存期間を過ぎた行の削除
+        db.Index("ix_raw_packets_received_at", "received_at"),
+    )
+
+    def __repr__(self):
+        return f"<RawPacket {self.id} - session {self.session_id} ({self.packet_count})>"
@@ -0,0 +1,52 @@
+from . import db
+
+
+class RollupMixin:
+    """デバイスごと・期間ごとの集計値（取り込み時に加算で更新）"""
+
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.String(50), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    total_time_seconds = db.Column(db.Integer, nullable=False, default=0)
+    total_distance_km = db.Column(db.Float, nullable=False, default=0.0)
+    total_calories_kcal = db.Column(db.Float, nullable=False, default=0.0)
+    speed_sum = db.Column(db.Float, nullable=False, default=0.0)
+    rpm_sum = db.Column(db.Float, nullable=False, default=0.0)
+    mets_sum = db.Column(db.Float, nullable=False, default=0.0)
+    sample_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def _average(self, total):
+        return total / self.sample_count if self.sample_count else 0.0
+
+    def to_dict(self):
+        return {
+            "device_id": self.device_id,
+            "bucket_start": self.bucket_start.isoformat(),
+            "total_time_seconds": self.total_time_seconds,
+            "total_distance_km": self.total_distance_km,
+            "total_calories_kcal": self.total_calories_kcal,
+            "average_speed_kmh": self._average(self.speed_sum),
+            "average_rpm": self._average(self.rpm_sum),
+            "average_mets": self._average(self.mets_sum),
+            "sample_count": self.sample_count,
+        }
+
+
+class HourlyRollup(RollupMixin, db.Model):
+    __tablename__ = "hourly_rollups"
+    __table_args__ = (
+        db.UniqueConstraint("device_id", "bucket_start", name="uq_hourly_rollups_device_bucket"),
+    )
+
+    def __repr__(self):
+        return f"<HourlyRollup {self.device_id} - {self.bucket_start}>"
+
+
+class DailyRollup(RollupMixin, db.Model):
+    __tablename__ = "daily_rollups"
+    __table_args__ = (
+        db.UniqueConstraint("device_id", "bucket_start", name="uq_daily_rollups_device_bucket"),
+    )
+
+    def __repr__(self):
+        return f"<DailyRollup {self.device_id} - {self.bucket_start}>"
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from . import db
+
+
+class SessionArchive(db.Model):
+    """終了したセッションのデータポイントを列ごとにまとめて圧縮したもの
+
+    圧縮後はdata_pointsの行を削除し、読み出しはservices/point_archive.pyが復元する。
+    """
+
+    __tablename__ = "session_archives"
+
+    session_id = db.Column(
+        db.Integer, db.ForeignKey("fitness_sessions.id"), primary_key=True
+    )
+    point_count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SessionArchive session {self.session_id} ({self.point_count} points)>"
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+from . import db
+
+# サービスごとの同期状態
+SERVICE_PENDING = "pending"
+SERVICE_SUCCEEDED = "succeeded"
+SERVICE_FAILED = "failed"
+SERVICE_SKIPPED = "skipped"  # 未認証などで同期しない
+
+
+class SyncJob(db.Model):
+    """セッションを外部サービス（Google Fit / Health Connect）と同期するジョブ"""
+
+    __tablename__ = "sync_jobs"
+
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(
+        db.Integer, db.ForeignKey("fitness_sessions.id"), nullable=False
+    )
+    # "セッションID:データセットID"（進行中のセッションは"セッションID:active"）。
+    # 同じセッション・期間のジョブは1件にまとめる
+    idempotency_key = db.Column(db.String(100), nullable=False, unique=True)
+    status = db.Column(db.String(20), nullable=False, default=PENDING)
+    services = db.Column(db.JSON, nullable=False)  # サービス名 -> {status, error, response}
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    next_run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    __table_args__ = (
+        # ワーカーが実行待ちのジョブを探す
+        db.Index("ix_sync_jobs_status_next_run_at", "status", "next_run_at"),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "services": self.services,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at else None,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+    def __repr__(self):
+        return f"<SyncJob {self.id} - session {self.session_id} {self.status}>"
+
+
+class GoogleFitChunk(db.Model):
+    """Google Fitへアップロード済みのチャンク（データ型×時間枠）。再試行時はここから再開する"""
+
+    __tablename__ = "google_fit_chunks"
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(
+        db.Integer, db.ForeignKey("fitness_sessions.id"), nullable=False
+    )
+    data_type = db.Column(db.String(100), nullable=False)
+    start_time_ns = db.Column(db.BigInteger, nullable=False)  # 時間枠の開始
+    dataset_id = db.Column(db.String(50), nullable=False)
+    points = db.Column(db.Integer, nullable=False)
+    uploaded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "session_id", "data_type", "start_time_ns", name="uq_google_fit_chunks_window"
+        ),
+    )
+
+    def __repr__(self):
+        return f"<GoogleFitChunk session {self.session_id} {self.data_type} {self.dataset_id}>"
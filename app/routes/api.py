@@ -1,11 +1,32 @@
+import gzip
 import json
-from datetime import datetime
-
-from flask import Blueprint, current_app, jsonify, request
-
-from ..models import DataPoint, FitnessSession, db
+import logging
+import math
+from datetime import datetime, time, timedelta
+from time import perf_counter
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+
+from ..models import FitnessSession, SyncJob, db
+from ..services.bulk_import import POINT_FIELDS, import_ndjson, import_session
+from ..services.export import iter_csv_zip_export, iter_json_export
+from ..services.frames import FRAMES_MIMETYPE, FrameError, decode_frames
+from ..services.ingest import (
+    IngestBufferFull,
+    get_or_create_active_session,
+    parse_point_time,
+    point_values,
+    publish_sample,
+    store_samples,
+)
+from ..services.live_state import get_live_state, load_current_state
+from ..services.point_archive import load_points_page
+from ..services.raw_archive import iter_raw_packets
+from ..services.rollups import RollupAccumulator
+from ..services.sessions import notify_session_ended
 
 bp = Blueprint("api", __name__)
+logger = logging.getLogger(__name__)
 
 
 @bp.before_request
@@ -23,98 +44,143 @@ def verify_token():
 
 @bp.route("/data", methods=["POST"])
 def receive_data():
-    """M5Stackからのデータ受信"""
-    if not request.is_json:
-        return jsonify({"error": "Content-Type must be application/json"}), 400
+    """M5Stackからのデータ受信
+
+    application/json（1サンプル）のほか、application/x-fit2go-frames
+    （services/frames.pyのバイナリフレーム、複数サンプルをまとめて送れる）を受け付ける。
+    """
+    if request.mimetype == FRAMES_MIMETYPE:
+        try:
+            device_id, packets = decode_frames(request.get_data())
+        except FrameError as e:
+            return jsonify({"error": str(e)}), 400
+    elif not request.is_json:
+        return (
+            jsonify(
+                {"error": f"Content-Type must be application/json or {FRAMES_MIMETYPE}"}
+            ),
+            400,
+        )
 
     try:
-        data = request.get_json()
-        print("\n=== Received M5Stack Data ===")
-        print("Speed:", data.get("speed_kmh", 0), "km/h")
-        print("RPM:", data.get("rpm", 0))
-        print("Session Time:", data.get("session_time_s", 0), "seconds")
-        print("Session Distance:", data.get("session_dist_km", 0), "km")
-        print("Session Calories:", data.get("session_cal_kcal", 0), "kcal")
-        print("Raw data:", data)  # 生データの出力を追加
-        print("==========================\n")
-
-        device_id = data.get("device_id")
+        if request.is_json:
+            data = request.get_json()
+            device_id = data.get("device_id")
+            packets = [data]
         if not device_id:
             return jsonify({"error": "device_id is required"}), 400
 
-        # アクティブなセッションを取得または新規作成
-        session = FitnessSession.query.filter_by(device_id=device_id, end_time=None).first()
-
-        if not session:
-            session = FitnessSession(
-                device_id=device_id,
-                start_time=datetime.utcnow(),
-                total_time_seconds=data.get("total_time_s", 0),
-                total_distance_km=data.get("total_dist_km", 0.0),
-                total_calories_kcal=data.get("total_cal_kcal", 0.0),
-                average_speed_kmh=data.get("speed_kmh", 0.0),
-                average_rpm=data.get("rpm", 0.0),
-                average_mets=data.get("mets", 0.0),
-                raw_data=data
-            )
-            db.session.add(session)
-            db.session.flush()
-            print("Created new session:", session.id)
+        logger.debug(
+            "Received %d sample(s) from %s: speed=%s km/h rpm=%s session_time=%s s "
+            "session_dist=%s km session_cal=%s kcal raw=%s",
+            len(packets),
+            device_id,
+            packets[-1].get("speed_kmh", 0),
+            packets[-1].get("rpm", 0),
+            packets[-1].get("session_time_s", 0),
+            packets[-1].get("session_dist_km", 0),
+            packets[-1].get("session_cal_kcal", 0),
+            packets[-1],
+        )
 
-        # データポイントの作成
-        timestamp = datetime.utcnow()
-        if "timestamp_ms" in data:
+        rows = [point_values(packet) for packet in packets]
+
+        # バッファリングモードではキューに積んだ時点で応答する
+        buffer = current_app.extensions.get("ingest_buffer")
+        if buffer is not None:
             try:
-                timestamp = datetime.fromtimestamp(data["timestamp_ms"] / 1000.0)
-            except (ValueError, TypeError):
-                pass
-
-        data_point = DataPoint(
-            session_id=session.id,
-            timestamp=timestamp,
-            speed_kmh=data.get("speed_kmh", 0.0),
-            rpm=data.get("rpm", 0.0),
-            distance_km=data.get("session_dist_km", 0.0),
-            calories_kcal=data.get("session_cal_kcal", 0.0),
-            time_seconds=int(data.get("session_time_s", 0)),
-            mets=data.get("mets", 0.0)
-        )
-        db.session.add(data_point)
-        print("\n=== Saving Data Point ===")
-        print("Session ID:", session.id)
-        print("Timestamp:", timestamp)
-        print("Speed:", data_point.speed_kmh, "km/h")
-        print("RPM:", data_point.rpm)
-        print("Distance:", data_point.distance_km, "km")
-        print("Calories:", data_point.calories_kcal, "kcal")
-        print("Time:", data_point.time_seconds, "seconds")
-        print("=======================\n")
-
-        # セッションデータの更新
-        session.total_time_seconds = data.get("total_time_s", session.total_time_seconds)
-        session.total_distance_km = data.get("total_dist_km", session.total_distance_km)
-        session.total_calories_kcal = data.get("total_cal_kcal", session.total_calories_kcal)
-        session.average_speed_kmh = data.get("speed_kmh", session.average_speed_kmh)
-        session.average_rpm = data.get("rpm", session.average_rpm)
-        session.average_mets = data.get("mets", session.average_mets)
-        session.raw_data = data
+                if not buffer.has_room(len(rows)):
+                    raise IngestBufferFull()
+                for packet, row in zip(packets, rows):
+                    session_id, start_time = buffer.enqueue(device_id, packet, row)
+                    publish_sample(device_id, session_id, start_time, packet, row)
+            except IngestBufferFull:
+                # 書き込みが追いついていない。デバイス側で時間をおいて再送してもらう
+                response = jsonify({"error": "Ingest buffer is full, retry later"})
+                response.headers["Retry-After"] = str(math.ceil(buffer.flush_interval))
+                return response, 503
+            return (
+                jsonify(
+                    {"status": "queued", "session_id": session_id, "samples": len(rows)}
+                ),
+                202,
+            )
+
+        # アクティブなセッションを取得または新規作成
+        session = get_or_create_active_session(device_id, packets[0])
+
+        # データポイントの保存とセッションデータの更新。ロールアップの増分に使う
+        # 直前のサンプルはライブ状態から取り、無い場合だけDBから読む
+        previous = get_live_state().last_sample(device_id, session.id)
+        store_samples(session, packets, rows, previous=previous)
 
         db.session.commit()
-        return jsonify({"status": "success", "session_id": session.id}), 200
+        logger.debug(
+            "Saved %d data point(s) to session %s: last=%s", len(rows), session.id, rows[-1]
+        )
+
+        # ダッシュボード向けに最新の状態をキャッシュし、SSEで配信
+        for packet, row in zip(packets, rows):
+            publish_sample(device_id, session.id, session.start_time, packet, row)
+        return (
+            jsonify({"status": "success", "session_id": session.id, "samples": len(rows)}),
+            200,
+        )
 
     except Exception as e:
         db.session.rollback()
-        print("Error saving data:", str(e))
+        logger.exception("Error saving data")
         return jsonify({"error": str(e)}), 500
 
 
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def _request_body_stream():
+    """リクエストボディのストリーム（Content-Encoding: gzipなら展開しながら読む）"""
+    if request.content_encoding == "gzip":
+        return gzip.GzipFile(fileobj=request.stream, mode="rb")
+    return request.stream
+
+
+def _upload_response(results, started):
+    elapsed = perf_counter() - started
+    rows = sum(result.get("points", 0) for result in results)
+    return {
+        "status": "success",
+        "results": results,
+        "rows_inserted": rows,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
 @bp.route("/upload", methods=["POST"])
 def upload_data():
-    """SDカードのデータをアップロード"""
+    """SDカードのデータをアップロード
+
+    application/json（device_idとsessionsを持つ1つのオブジェクト）のほか、
+    大きなバックログ向けにapplication/x-ndjson（1行1セッション）を受け付ける。
+    どちらもContent-Encoding: gzipで圧縮して送れる。
+    """
+    if request.mimetype == NDJSON_MIMETYPE:
+        return _upload_ndjson()
+
     if not request.is_json:
-        return jsonify({"error": "Content-Type must be application/json"}), 400
+        return (
+            jsonify(
+                {"error": f"Content-Type must be application/json or {NDJSON_MIMETYPE}"}
+            ),
+            400,
+        )
 
-    data = request.get_json()
+    if request.content_encoding == "gzip":
+        try:
+            data = json.load(_request_body_stream())
+        except (OSError, EOFError, ValueError) as e:
+            return jsonify({"error": f"Invalid gzip JSON body: {e}"}), 400
+    else:
+        data = request.get_json()
     device_id = data.get("device_id")
     sessions = data.get("sessions", [])
 
@@ -122,45 +188,11 @@ def upload_data():
         return jsonify({"error": "device_id and sessions are required"}), 400
 
     results = []
+    rollups = RollupAccumulator()
+    started = perf_counter()
     for session_data in sessions:
         try:
-            # セッションの作成または更新
-            session = FitnessSession(
-                device_id=device_id,
-                start_time=datetime.fromisoformat(session_data.get("start_time")),
-                end_time=datetime.fromisoformat(session_data.get("end_time")),
-                total_time_seconds=session_data.get("total_time_seconds", 0),
-                total_distance_km=session_data.get("total_distance_km", 0.0),
-                total_calories_kcal=session_data.get("total_calories_kcal", 0.0),
-                average_speed_kmh=session_data.get("average_speed_kmh", 0.0),
-                average_rpm=session_data.get("average_rpm", 0.0),
-                average_mets=session_data.get("average_mets", 0.0),
-                raw_data=session_data,
-            )
-            db.session.add(session)
-            db.session.flush()  # セッションIDを取得するためにフラッシュ
-
-            # データポイントの作成
-            for point_data in session_data.get("data_points", []):
-                data_point = DataPoint(
-                    session_id=session.id,
-                    timestamp=datetime.fromisoformat(point_data.get("timestamp")),
-                    speed_kmh=point_data.get("speed_kmh", 0.0),
-                    rpm=point_data.get("rpm", 0.0),
-                    distance_km=point_data.get("distance_km", 0.0),
-                    calories_kcal=point_data.get("calories_kcal", 0.0),
-                    time_seconds=point_data.get("time_seconds", 0),
-                    mets=point_data.get("mets", 0.0),
-                )
-                db.session.add(data_point)
-
-            results.append(
-                {
-                    "status": "success",
-                    "session_id": session.id,
-                    "start_time": session.start_time.isoformat(),
-                }
-            )
+            results.append(import_session(device_id, session_data, rollups))
         except Exception as e:
             results.append(
                 {
@@ -171,32 +203,45 @@ def upload_data():
             )
 
     try:
+        rollups.apply()
         db.session.commit()
-        return jsonify({"status": "success", "results": results}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+    return jsonify(_upload_response(results, started)), 200
+
 
-# app/routes/api.pyに追加
+def _upload_ndjson():
+    """改行区切りJSONのボディを読みながら、セッションごとに取り込んでコミット"""
+    results = []
+    started = perf_counter()
+    try:
+        for result in import_ndjson(
+            _request_body_stream(), device_id=request.args.get("device_id")
+        ):
+            results.append(result)
+    except (OSError, EOFError) as e:
+        # 展開できないgzipや途中で切れたボディ。それまでのセッションはコミット済み
+        response = _upload_response(results, started)
+        response.update({"status": "error", "error": f"Invalid request body: {e}"})
+        return jsonify(response), 400
+
+    return jsonify(_upload_response(results, started)), 200
 
 
 @bp.route("/download", methods=["GET"])
 def download_data():
     """フィットネスデータをダウンロードするためのエンドポイント"""
-    import json
-    import os
-    import tempfile
-    from datetime import datetime, time, timedelta
-    import pandas as pd
-    from flask import send_file, make_response
-
     # クエリパラメータの取得
-    format_type = request.args.get("format", "json")
+    format_type = request.args.get("format", "json").lower()
     start_date_str = request.args.get("start_date")
     end_date_str = request.args.get("end_date")
     device_id = request.args.get("device_id")
 
+    if format_type not in ("json", "csv"):
+        return jsonify({"error": 'Unsupported format. Use "json" or "csv"'}), 400
+
     # 日付バリデーション
     try:
         if start_date_str:
@@ -215,127 +260,19 @@ def download_data():
     except ValueError:
         return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
 
-    # クエリ構築とデータ取得
-    query = FitnessSession.query.filter(
-        FitnessSession.start_time.between(start_date, end_date)
-    )
-    if device_id:
-        query = query.filter(FitnessSession.device_id == device_id)
-    sessions = query.all()
-
-    # データの準備
-    result = []
-    for session in sessions:
-        session_data = {
-            "id": session.id,
-            "device_id": session.device_id,
-            "start_time": session.start_time.isoformat(),
-            "end_time": session.end_time.isoformat() if session.end_time else None,
-            "total_time_seconds": session.total_time_seconds,
-            "total_distance_km": session.total_distance_km,
-            "total_calories_kcal": session.total_calories_kcal,
-            "average_speed_kmh": session.average_speed_kmh,
-            "average_rpm": session.average_rpm,
-            "average_mets": session.average_mets,
-            "data_points": [],
-        }
-
-        data_points = (
-            DataPoint.query.filter_by(session_id=session.id)
-            .order_by(DataPoint.timestamp)
-            .all()
+    # 全件をメモリに載せず、読み出しながらレスポンスに書き出す
+    if format_type == "json":
+        return Response(
+            stream_with_context(iter_json_export(start_date, end_date, device_id)),
+            mimetype="application/json",
+            headers={"Content-Disposition": "attachment; filename=fitness_data.json"},
         )
 
-        for point in data_points:
-            point_data = {
-                "timestamp": point.timestamp.isoformat(),
-                "speed_kmh": point.speed_kmh,
-                "rpm": point.rpm,
-                "distance_km": point.distance_km,
-                "calories_kcal": point.calories_kcal,
-                "time_seconds": point.time_seconds,
-                "mets": point.mets,
-            }
-            session_data["data_points"].append(point_data)
-
-        result.append(session_data)
-
-    if format_type.lower() == "json":
-        # JSONとして返す
-        response = make_response(jsonify(result))
-        response.headers["Content-Disposition"] = "attachment; filename=fitness_data.json"
-        return response
-
-    elif format_type.lower() == "csv":
-        # セッションデータをDataFrameに変換
-        sessions_data = []
-        points_data = []
-        
-        for s in result:
-            sessions_data.append({
-                "session_id": s["id"],
-                "device_id": s["device_id"],
-                "start_time": s["start_time"],
-                "end_time": s["end_time"],
-                "total_time_seconds": s["total_time_seconds"],
-                "total_distance_km": s["total_distance_km"],
-                "total_calories_kcal": s["total_calories_kcal"],
-                "average_speed_kmh": s["average_speed_kmh"],
-                "average_rpm": s["average_rpm"],
-                "average_mets": s["average_mets"],
-            })
-            
-            for p in s["data_points"]:
-                points_data.append({
-                    "session_id": s["id"],
-                    "timestamp": p["timestamp"],
-                    "speed_kmh": p["speed_kmh"],
-                    "rpm": p["rpm"],
-                    "distance_km": p["distance_km"],
-                    "calories_kcal": p["calories_kcal"],
-                    "time_seconds": p["time_seconds"],
-                    "mets": p["mets"],
-                })
-
-        sessions_df = pd.DataFrame(sessions_data)
-        points_df = pd.DataFrame(points_data) if points_data else pd.DataFrame()
-
-        # 一時ファイルを作成
-        temp_dir = tempfile.mkdtemp()
-        try:
-            sessions_file = os.path.join(temp_dir, "sessions.csv")
-            points_file = os.path.join(temp_dir, "data_points.csv")
-            zip_file = os.path.join(temp_dir, "fitness_data.zip")
-
-            # CSVファイルを保存
-            sessions_df.to_csv(sessions_file, index=False)
-            if not points_df.empty:
-                points_df.to_csv(points_file, index=False)
-
-            # ZIPファイルに圧縮
-            import zipfile
-            with zipfile.ZipFile(zip_file, "w") as zipf:
-                zipf.write(sessions_file, arcname="sessions.csv")
-                if not points_df.empty:
-                    zipf.write(points_file, arcname="data_points.csv")
-
-            return send_file(
-                zip_file,
-                mimetype="application/zip",
-                as_attachment=True,
-                download_name="fitness_data.zip"
-            )
-
-        finally:
-            # 一時ファイルの削除を試みる（エラーは無視）
-            try:
-                import shutil
-                shutil.rmtree(temp_dir, ignore_errors=True)
-            except:
-                pass
-
-    else:
-        return jsonify({"error": 'Unsupported format. Use "json" or "csv"'}), 400
+    return Response(
+        stream_with_context(iter_csv_zip_export(start_date, end_date, device_id)),
+        mimetype="application/zip",
+        headers={"Content-Disposition": "attachment; filename=fitness_data.zip"},
+    )
 
 
 @bp.route("/sessions/<int:session_id>/end", methods=["POST"])
@@ -344,9 +281,15 @@ def end_session(session_id):
     from ..services.google_fit import end_fitness_session
 
     auto_sync = request.args.get("auto_sync", "true").lower() == "true"
+    # バッファ中のサンプルを書き出してから終了する
+    buffer = current_app.extensions.get("ingest_buffer")
+    if buffer is not None:
+        buffer.flush()
+
     result = end_fitness_session(session_id, auto_sync=auto_sync)
 
     if result["success"]:
+        notify_session_ended(db.session.get(FitnessSession, session_id))
         return jsonify(result), 200
     else:
         return jsonify({"error": result["error"]}), 400
@@ -354,24 +297,54 @@ def end_session(session_id):
 
 @bp.route("/sessions/<int:session_id>/sync", methods=["POST"])
 def sync_session(session_id):
-    """セッションを手動でヘルスサービスと同期"""
-    from ..services.google_fit import sync_session_to_services
-
-    result = sync_session_to_services(session_id)
-    return jsonify(result), 200 if any(r["success"] for r in result.values()) else 400
+    """セッションを手動でヘルスサービスと同期（同期ジョブを登録して202を返す）"""
+    from ..services.sync_jobs import enqueue_sync
+
+    FitnessSession.query.get_or_404(session_id)
+    job = enqueue_sync(session_id)
+    return jsonify({"success": True, "session_id": session_id, "sync_job_id": job.id}), 202
+
+
+@bp.route("/sync-jobs/<int:job_id>", methods=["GET"])
+def get_sync_job(job_id):
+    """同期ジョブの状態を取得"""
+    job = SyncJob.query.get_or_404(job_id)
+    return jsonify(job.to_dict())
+
+
+def _point_fields(value):
+    """fields=のカンマ区切りをデータポイントの列に変換（timestampは常に先頭に含める）"""
+    if not value:
+        return list(POINT_FIELDS)
+    requested = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in POINT_FIELDS]
+    if unknown:
+        raise ValueError(
+            f"Unknown fields: {', '.join(unknown)}. Use {', '.join(POINT_FIELDS)}"
+        )
+    return ["timestamp"] + [field for field in dict.fromkeys(requested) if field != "timestamp"]
 
 
 @bp.route("/sessions/<int:session_id>", methods=["GET"])
 def get_session(session_id):
-    """特定のセッションの詳細を取得"""
+    """特定のセッションの詳細を取得
+
+    データポイントは時刻順にlimit件ずつ返す。続きはレスポンスのnext_after_tsを
+    after_tsに指定して取得する。fields=timestamp,speed_kmhのように列を絞れるほか、
+    include_points=falseでセッションの情報だけを返す。
+    """
     session = FitnessSession.query.get_or_404(session_id)
-    
-    # データポイントを取得
-    data_points = (
-        DataPoint.query.filter_by(session_id=session_id)
-        .order_by(DataPoint.timestamp)
-        .all()
-    )
+
+    include_points = request.args.get("include_points", "true").lower() != "false"
+    try:
+        fields = _point_fields(request.args.get("fields"))
+        after_ts = request.args.get("after_ts")
+        if after_ts:
+            after_ts = parse_point_time(after_ts)
+        limit = request.args.get("limit", current_app.config["SESSION_POINTS_PAGE_SIZE"], type=int)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    limit = max(1, min(limit, current_app.config["SESSION_POINTS_MAX_PAGE_SIZE"]))
 
     session_data = {
         "id": session.id,
@@ -384,59 +357,55 @@ def get_session(session_id):
         "average_speed_kmh": session.average_speed_kmh,
         "average_rpm": session.average_rpm,
         "average_mets": session.average_mets,
+        "stats": session.stats_to_dict(),
         "raw_data": session.raw_data,
-        "data_points": [
-            {
-                "timestamp": point.timestamp.isoformat(),
-                "speed_kmh": point.speed_kmh,
-                "rpm": point.rpm,
-                "distance_km": point.distance_km,
-                "calories_kcal": point.calories_kcal,
-                "time_seconds": point.time_seconds,
-                "mets": point.mets
-            }
-            for point in data_points
-        ]
     }
-
+    if not include_points:
+        return jsonify(session_data)
+
+    # データポイントを取得（圧縮済みのセッションはアーカイブから復元）
+    data_points, next_after_ts = load_points_page(session_id, fields, after_ts or None, limit)
+    session_data.update(
+        {
+            "data_points": [
+                dict(zip(fields, point), timestamp=point[0].isoformat())
+                for point in data_points
+            ],
+            "next_after_ts": next_after_ts.isoformat() if next_after_ts else None,
+            "has_more": next_after_ts is not None,
+        }
+    )
     return jsonify(session_data)
 
 
+@bp.route("/sessions/<int:session_id>/raw", methods=["GET"])
+def get_session_raw_packets(session_id):
+    """アーカイブした受信パケットをNDJSONで返す（RAW_ARCHIVE_ENABLEDの間に受信した分）"""
+    FitnessSession.query.get_or_404(session_id)
+
+    def generate():
+        for packet in iter_raw_packets(session_id):
+            yield json.dumps(packet) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
 @bp.route("/api/sessions/current")
 def get_current_session():
     """現在進行中のセッションデータを取得"""
-    session = FitnessSession.query.filter_by(end_time=None).first()
-    if not session:
+    response_data = load_current_state(request.args.get("device_id"))
+    if not response_data:
         return jsonify({"status": "no_active_session"})
 
-    # 最新のデータポイントを取得
-    latest_point = (
-        DataPoint.query.filter_by(session_id=session.id)
-        .order_by(DataPoint.timestamp.desc())
-        .first()
+    logger.debug(
+        "Dashboard metrics: session_dist=%s km session_cal=%s kcal session_time=%s s "
+        "total_dist=%s km total_cal=%s kcal total_time=%s s",
+        response_data["session_dist_km"],
+        response_data["session_cal_kcal"],
+        response_data["session_time_s"],
+        response_data["total_distance_km"],
+        response_data["total_calories_kcal"],
+        response_data["total_time_seconds"],
     )
 
-    response_data = {
-        "session_id": session.id,
-        "start_time": session.start_time.isoformat(),
-        "total_time_seconds": session.total_time_seconds,
-        "total_distance_km": session.total_distance_km,
-        "total_calories_kcal": session.total_calories_kcal,
-        "current_speed_kmh": latest_point.speed_kmh if latest_point else 0,
-        "current_rpm": latest_point.rpm if latest_point else 0,
-        "current_mets": latest_point.mets if latest_point else 0,
-        "session_time_s": latest_point.time_seconds if latest_point else 0,
-        "session_dist_km": latest_point.distance_km if latest_point else 0,
-        "session_cal_kcal": latest_point.calories_kcal if latest_point else 0
-    }
-
-    print("\n=== Dashboard Metrics ===")
-    print("Session Distance:", response_data["session_dist_km"], "km")
-    print("Session Calories:", response_data["session_cal_kcal"], "kcal")
-    print("Session Time:", response_data["session_time_s"], "seconds")
-    print("Total Distance:", response_data["total_distance_km"], "km")
-    print("Total Calories:", response_data["total_calories_kcal"], "kcal")
-    print("Total Time:", response_data["total_time_seconds"], "seconds")
-    print("======================\n")
-
     return jsonify(response_data)
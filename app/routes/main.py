@@ -1,24 +1,56 @@
 import json
+import logging
+import queue
 from datetime import datetime, timedelta
 
+import numpy as np
 import pytz
-from flask import Blueprint, current_app, jsonify, render_template, request, redirect, url_for
-from sqlalchemy import func
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    url_for,
+)
+from sqlalchemy import Integer, cast, extract, func, select
+from sqlalchemy.orm import defer
 
 from ..models import DataPoint, FitnessSession, db
+from ..services.downsample import downsample_indices
 from ..services.google_fit import (
     get_authorization_url,
+    get_credentials,
     handle_callback,
     upload_fitness_session,
 )
+from ..services.ingest import parse_point_time
+from ..services.live_state import load_active_states, load_current_state
+from ..services.point_archive import archived_interval_totals
+from ..services.rollups import query_rollups, sum_rollups
+from ..services.series import (
+    MAX_SERIES_POINTS,
+    SERIES_METRICS,
+    SERIES_MODES,
+    session_series,
+)
+from ..services.sessions import get_active_session
+from ..services.stream import format_event, get_stream_broker
 
 bp = Blueprint("main", __name__)
+logger = logging.getLogger(__name__)
+
+# /api/sessions/daily で指定できる集計間隔（分）
+DAILY_STATS_INTERVALS = (1, 5, 15, 60)
 
 
 @bp.route("/")
 def index():
     """ダッシュボードのメインページを表示"""
-    return render_template("index.html")
+    google_fit_connected = get_credentials(request.args.get("device_id")) is not None
+    return render_template("index.html", google_fit_connected=google_fit_connected)
 
 
 @bp.route("/calendar")
@@ -29,33 +61,65 @@ def calendar():
 
 @bp.route("/api/sessions/current")
 def get_current_session():
-    """現在進行中のセッションデータを取得"""
-    session = FitnessSession.query.filter_by(end_time=None).first()
-    if not session:
+    """現在進行中のセッションデータを取得（device_id省略時は最後に更新されたデバイス）"""
+    # 受信時に更新されるキャッシュから返すため、通常はDBにアクセスしない
+    state = load_current_state(request.args.get("device_id"))
+    if not state:
         return jsonify({"status": "no_active_session"})
 
-    # 最新のデータポイントを取得
-    latest_point = (
-        DataPoint.query.filter_by(session_id=session.id)
-        .order_by(DataPoint.timestamp.desc())
-        .first()
-    )
+    return jsonify(state)
 
-    return jsonify(
-        {
-            "session_id": session.id,
-            "start_time": session.start_time.isoformat(),
-            "total_time_seconds": session.total_time_seconds,
-            "total_distance_km": session.total_distance_km,
-            "total_calories_kcal": session.total_calories_kcal,
-            "current_speed_kmh": latest_point.speed_kmh if latest_point else 0,
-            "current_rpm": latest_point.rpm if latest_point else 0,
-            "current_mets": latest_point.mets if latest_point else 0,
-            # セッションの現在の値を追加
-            "session_time_s": latest_point.time_seconds if latest_point else 0,
-            "session_dist_km": latest_point.distance_km if latest_point else 0,
-            "session_cal_kcal": latest_point.calories_kcal if latest_point else 0
-        }
+
+@bp.route("/api/sessions/active")
+def get_active_sessions():
+    """進行中のセッションをデバイスごとに取得（複数台のダッシュボード用）"""
+    return jsonify(load_active_states())
+
+
+@bp.route("/api/stream")
+def stream():
+    """新しいサンプルをServer-Sent Eventsで配信"""
+    device_id = request.args.get("device_id")
+    try:
+        last_event_id = int(
+            request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or 0
+        )
+    except ValueError:
+        last_event_id = 0
+
+    broker = get_stream_broker()
+    heartbeat = current_app.config["STREAM_HEARTBEAT_SECONDS"]
+    retry_ms = current_app.config["STREAM_RETRY_MS"]
+
+    def generate():
+        subscription = broker.subscribe(device_id)
+        try:
+            yield f"retry: {retry_ms}\n\n"
+
+            # 再接続時は取りこぼしたイベントを再送
+            sent_id = last_event_id
+            if last_event_id:
+                for event in broker.replay(last_event_id, device_id):
+                    sent_id = event["id"]
+                    yield format_event(event)
+
+            while True:
+                try:
+                    event = subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event["id"] <= sent_id:
+                    continue
+                sent_id = event["id"]
+                yield format_event(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -68,54 +132,88 @@ def get_daily_stats():
     except ValueError:
         return jsonify({"error": "Invalid date format"}), 400
 
+    interval = request.args.get("interval", 15, type=int)  # minutes
+    if interval not in DAILY_STATS_INTERVALS:
+        return jsonify({"error": "interval must be one of 1, 5, 15, 60"}), 400
+    device_id = request.args.get("device_id")
+
     # 指定された日の期間を設定
     start_time = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
     end_time = start_time + timedelta(days=1)
 
-    # 15分単位でデータを集計
-    interval = 15  # minutes
+    # 0時からの経過分を間隔で割った値をバケット番号として1回のGROUP BYで集計
+    minute_of_day = cast(extract("hour", DataPoint.timestamp), Integer) * 60 + cast(
+        extract("minute", DataPoint.timestamp), Integer
+    )
+    bucket = (minute_of_day // interval).label("bucket")
+
+    query = (
+        db.session.query(
+            bucket,
+            func.avg(DataPoint.speed_kmh).label("avg_speed"),
+            func.avg(DataPoint.rpm).label("avg_rpm"),
+            func.sum(DataPoint.distance_km).label("total_distance"),
+            func.sum(DataPoint.calories_kcal).label("total_calories"),
+            func.count(DataPoint.id).label("point_count"),
+        )
+        .filter(DataPoint.timestamp >= start_time)
+        .filter(DataPoint.timestamp < end_time)
+    )
+    if device_id:
+        query = query.join(FitnessSession, DataPoint.session_id == FitnessSession.id)
+        query = query.filter(FitnessSession.device_id == device_id)
+
+    # 平均は件数で重み付けした合計に直し、圧縮済みのセッションの集計と合算する
+    totals = archived_interval_totals(start_time, end_time, interval, device_id)
+    for row in query.group_by("bucket").all():
+        values = totals.setdefault(
+            row.bucket,
+            {
+                "speed_sum": 0.0,
+                "rpm_sum": 0.0,
+                "total_distance": 0.0,
+                "total_calories": 0.0,
+                "point_count": 0,
+            },
+        )
+        values["speed_sum"] += float(row.avg_speed or 0) * row.point_count
+        values["rpm_sum"] += float(row.avg_rpm or 0) * row.point_count
+        values["total_distance"] += float(row.total_distance or 0)
+        values["total_calories"] += float(row.total_calories or 0)
+        values["point_count"] += row.point_count
+
+    # データの無い間隔は0で埋める
     stats = []
-    
-    # 24時間分の15分間隔のデータを生成
-    for hour in range(24):
-        for minute in range(0, 60, interval):
-            interval_start = start_time + timedelta(hours=hour, minutes=minute)
-            interval_end = interval_start + timedelta(minutes=interval)
-            
-            # 各時間間隔のデータを集計
-            data = (
-                db.session.query(
-                    func.avg(DataPoint.speed_kmh).label("avg_speed"),
-                    func.avg(DataPoint.rpm).label("avg_rpm"),
-                    func.sum(DataPoint.distance_km).label("total_distance"),
-                    func.sum(DataPoint.calories_kcal).label("total_calories"),
-                    func.count(DataPoint.id).label("point_count"),
-                )
-                .filter(DataPoint.timestamp >= interval_start)
-                .filter(DataPoint.timestamp < interval_end)
-                .first()
-            )
-            
+    for index in range(24 * 60 // interval):
+        interval_start = start_time + timedelta(minutes=index * interval)
+        data = totals.get(index)
+        if data is None:
             stats.append({
                 "time": interval_start.isoformat(),
-                "avg_speed": float(data.avg_speed) if data.avg_speed else 0,
-                "avg_rpm": float(data.avg_rpm) if data.avg_rpm else 0,
-                "total_distance": float(data.total_distance) if data.total_distance else 0,
-                "total_calories": float(data.total_calories) if data.total_calories else 0,
-                "point_count": data.point_count,
+                "avg_speed": 0,
+                "avg_rpm": 0,
+                "total_distance": 0,
+                "total_calories": 0,
+                "point_count": 0,
             })
+            continue
+
+        stats.append({
+            "time": interval_start.isoformat(),
+            "avg_speed": data["speed_sum"] / data["point_count"],
+            "avg_rpm": data["rpm_sum"] / data["point_count"],
+            "total_distance": data["total_distance"],
+            "total_calories": data["total_calories"],
+            "point_count": data["point_count"],
+        })
 
     return jsonify(stats)
 
 
 @bp.route("/api/sessions/cumulative")
 def get_cumulative_stats():
-    """累積統計データを取得"""
-    stats = db.session.query(
-        func.sum(FitnessSession.total_time_seconds).label("total_time"),
-        func.sum(FitnessSession.total_distance_km).label("total_distance"),
-        func.sum(FitnessSession.total_calories_kcal).label("total_calories"),
-    ).first()
+    """累積統計データを取得（日次ロールアップの合計）"""
+    stats = sum_rollups(device_id=request.args.get("device_id"))
 
     return jsonify(
         {
@@ -130,11 +228,27 @@ def get_cumulative_stats():
     )
 
 
+@bp.route("/api/rollups/<granularity>")
+def get_rollups(granularity):
+    """時間別（hour）・日別（day）のロールアップを取得"""
+    if granularity not in ("hour", "day"):
+        return jsonify({"error": "granularity must be hour or day"}), 400
+
+    try:
+        start = datetime.strptime(request.args["start"], "%Y-%m-%d")
+        end = datetime.strptime(request.args["end"], "%Y-%m-%d") + timedelta(days=1)
+    except (KeyError, ValueError):
+        return jsonify({"error": "start and end are required (YYYY-MM-DD)"}), 400
+
+    rollups = query_rollups(granularity, start, end, request.args.get("device_id"))
+    return jsonify([rollup.to_dict() for rollup in rollups])
+
+
 @bp.route("/connect/google-fit")
 def connect_google_fit():
-    """Google Fitとの連携を開始"""
+    """Google Fitとの連携を開始（?device_id=でデバイス専用の連携）"""
     # 認証URLを取得してリダイレクト
-    auth_url = get_authorization_url()
+    auth_url = get_authorization_url(request.args.get("device_id"))
     return redirect(auth_url)
 
 
@@ -173,10 +287,12 @@ def get_fit2go_calendar_data():
     except (ValueError, AttributeError):
         return jsonify({"error": "Invalid date format"}), 400
 
-    # セッションデータを取得
-    sessions = FitnessSession.query.filter(
-        FitnessSession.start_time.between(start, end)
-    ).all()
+    # セッションデータを取得（イベントに使わないraw_dataは読み込まない）
+    sessions = (
+        FitnessSession.query.options(defer(FitnessSession.raw_data))
+        .filter(FitnessSession.start_time.between(start, end))
+        .all()
+    )
 
     events = []
     for session in sessions:
@@ -192,6 +308,9 @@ def get_fit2go_calendar_data():
                 "avg_speed": session.average_speed_kmh,
                 "avg_rpm": session.average_rpm,
                 "avg_mets": session.average_mets,
+                "max_speed": session.speed_max,
+                "moving_time": session.moving_time_seconds,
+                "stats": session.stats_to_dict(),
             }
         })
 
@@ -225,14 +344,19 @@ def get_daily_source_data(source, date):
 
     if source == "fit2go":
         # Fit2Goのデータを取得
-        sessions = FitnessSession.query.filter(
-            FitnessSession.start_time.between(start_time, end_time)
-        ).all()
+        sessions = (
+            FitnessSession.query.options(defer(FitnessSession.raw_data))
+            .filter(FitnessSession.start_time.between(start_time, end_time))
+            .all()
+        )
+
+        # 合計は日次ロールアップから取得
+        totals = sum_rollups(start_time, end_time)
 
         daily_data = {
-            "total_time_seconds": sum(s.total_time_seconds or 0 for s in sessions),
-            "total_distance_km": sum(s.total_distance_km or 0 for s in sessions),
-            "total_calories_kcal": sum(s.total_calories_kcal or 0 for s in sessions),
+            "total_time_seconds": int(totals.total_time or 0),
+            "total_distance_km": float(totals.total_distance or 0),
+            "total_calories_kcal": float(totals.total_calories or 0),
             "sessions": [
                 {
                     "id": s.id,
@@ -244,6 +368,9 @@ def get_daily_source_data(source, date):
                     "avg_speed": s.average_speed_kmh,
                     "avg_rpm": s.average_rpm,
                     "avg_mets": s.average_mets,
+                    "max_speed": s.speed_max,
+                    "moving_time": s.moving_time_seconds,
+                    "stats": s.stats_to_dict(),
                 }
                 for s in sessions
             ],
@@ -274,13 +401,31 @@ def get_daily_source_data(source, date):
 
 @bp.route("/api/sessions/history")
 def get_session_history():
-    """直近30分間のセッションデータを取得"""
-    # 現在のアクティブセッションを取得
-    session = FitnessSession.query.filter_by(end_time=None).first()
+    """直近30分間のセッションデータを取得
+
+    since（ISO形式の時刻）またはsince_id（データポイントID）を指定すると、
+    それより新しいポイントと次回用のカーソルだけを返す。
+    max_pointsを指定すると、超えた分をmode（lttb/minmax）で間引く。
+    device_idを指定すると、そのデバイスの進行中セッションを対象にする。
+    """
+    try:
+        since = request.args.get("since")
+        since = parse_point_time(since) if since else None
+        since_id = request.args.get("since_id", type=int)
+        max_points = request.args.get("max_points", type=int)
+    except ValueError:
+        return jsonify({"error": "Invalid since parameter"}), 400
+    mode = request.args.get("mode", "lttb")
+    if mode not in SERIES_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(SERIES_MODES)}"}), 400
+    incremental = since is not None or since_id is not None
+
+    # 現在のアクティブセッションを取得（device_id省略時は最も新しいセッション）
+    session = get_active_session(request.args.get("device_id"))
     if not session:
-        print("\n=== Session History ===")
-        print("No active session found")
-        print("=====================\n")
+        logger.debug("Session history: no active session found")
+        if incremental:
+            return jsonify({"points": [], "cursor": {"since": None, "since_id": None}})
         return jsonify([])
 
     # 現在時刻から30分前までのデータを取得（ローカル時間で処理）
@@ -288,27 +433,59 @@ def get_session_history():
     end_time = now
     start_time = end_time - timedelta(minutes=30)
 
-    # データポイントを取得
-    data_points = (
-        DataPoint.query.filter_by(session_id=session.id)
-        .filter(DataPoint.timestamp >= start_time)
-        .filter(DataPoint.timestamp <= end_time)
-        .order_by(DataPoint.timestamp.asc())
-        .all()
+    # データポイントを取得（ORMオブジェクトを作らず列だけを読み出す）
+    query = (
+        select(
+            DataPoint.id,
+            DataPoint.timestamp,
+            DataPoint.speed_kmh,
+            DataPoint.rpm,
+            DataPoint.distance_km,
+            DataPoint.calories_kcal,
+            DataPoint.time_seconds,
+            DataPoint.mets,
+        )
+        .where(DataPoint.session_id == session.id)
+        .where(DataPoint.timestamp >= max(start_time, since or start_time))
+        .where(DataPoint.timestamp <= end_time)
+        .order_by(DataPoint.timestamp.asc(), DataPoint.id.asc())
+    )
+    if since is not None:
+        query = query.where(DataPoint.timestamp > since)
+    if since_id is not None:
+        query = query.where(DataPoint.id > since_id)
+    data_points = db.session.execute(query).all()
+
+    logger.debug(
+        "Session history: session=%s range=%s..%s points=%d",
+        session.id,
+        start_time,
+        end_time,
+        len(data_points),
     )
 
-    print("\n=== Session History ===")
-    print(f"Session ID: {session.id}")
-    print(f"Time range: {start_time} to {end_time}")
-    print(f"Number of data points: {len(data_points)}")
+    # カーソルは間引く前の最後のポイントを指す
+    cursor = {
+        "since": since.isoformat() if since else None,
+        "since_id": since_id,
+    }
     if data_points:
-        print(f"First point: Speed={data_points[0].speed_kmh}km/h, RPM={data_points[0].rpm}")
-        print(f"Last point: Speed={data_points[-1].speed_kmh}km/h, RPM={data_points[-1].rpm}")
-    print("=====================\n")
+        cursor = {
+            "since": data_points[-1].timestamp.isoformat(),
+            "since_id": data_points[-1].id,
+        }
+
+    if max_points and len(data_points) > max_points:
+        x = np.array([point.timestamp.timestamp() for point in data_points])
+        y = np.array([point.speed_kmh or 0.0 for point in data_points])
+        data_points = [
+            data_points[i] for i in downsample_indices(x, y, max_points, mode)
+        ]
 
     # タイムスタンプをISOフォーマットで返す
     result = [
         {
+            "id": point.id,
             "timestamp": point.timestamp.isoformat(),
             "speed_kmh": point.speed_kmh,
             "rpm": point.rpm,
@@ -320,4 +497,34 @@ def get_session_history():
         for point in data_points
     ]
 
+    if incremental:
+        return jsonify({"points": result, "cursor": cursor})
     return jsonify(result)
+
+
+@bp.route("/api/sessions/<int:session_id>/series")
+def get_session_series(session_id):
+    """グラフ表示用に間引いたセッションの系列を取得
+
+    metric（既定はspeed_kmh）をpoints点（既定500）以内にmode（lttb/minmax）で間引く。
+    終了したセッションの結果はサーバー側にキャッシュし、ブラウザにもキャッシュさせる。
+    """
+    session = FitnessSession.query.options(defer(FitnessSession.raw_data)).get_or_404(
+        session_id
+    )
+
+    metric = request.args.get("metric", "speed_kmh")
+    if metric not in SERIES_METRICS:
+        return jsonify({"error": f"metric must be one of {', '.join(SERIES_METRICS)}"}), 400
+    mode = request.args.get("mode", "lttb")
+    if mode not in SERIES_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(SERIES_MODES)}"}), 400
+    points = request.args.get("points", 500, type=int)
+    if not 3 <= points <= MAX_SERIES_POINTS:
+        return jsonify({"error": f"points must be between 3 and {MAX_SERIES_POINTS}"}), 400
+
+    series = session_series(session, metric, points, mode)
+    response = jsonify(dict(series, session_id=session.id))
+    if session.end_time is not None:
+        response.headers["Cache-Control"] = "private, max-age=3600"
+    return response
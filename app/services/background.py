@@ -0,0 +1,65 @@
+# app/services/background.py
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# リーダーになれなかったプロセスがロックを取り直す間隔（秒）
+LEADER_RETRY_SECONDS = 60
+
+
+def _acquire_leader_lock(app):
+    """ホスト内で1プロセスだけが取れるロックを取得（取れた場合True）
+
+    ロックファイルはインスタンスフォルダに置き、プロセスが終了するまで保持する。
+    fcntlが使えない環境やファイルを作れない場合は、このプロセスで起動する。
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return True
+
+    path = os.path.join(app.instance_path, "background-workers.lock")
+    try:
+        os.makedirs(app.instance_path, exist_ok=True)
+        lock_file = open(path, "a")
+    except OSError:
+        logger.warning("Cannot create %s; starting background workers in this process", path)
+        return True
+
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    app.extensions["background_lock"] = lock_file
+    return True
+
+
+def init_background_workers(app, starters):
+    """最初のリクエストでstarters（appを受け取る関数）を1回だけ呼ぶよう登録
+
+    flask db upgradeやflask sync workerなどのCLIはリクエストを処理しないため起動しない。
+    gunicornの複数ワーカーでは、ロックを取れた1プロセスだけが起動し、
+    それ以外のプロセスはLEADER_RETRY_SECONDSごとにロックを取り直す。
+    """
+    lock = threading.Lock()
+    state = {"started": False, "next_try": 0.0}
+
+    @app.before_request
+    def start_background_workers():
+        if state["started"] or time.monotonic() < state["next_try"]:
+            return
+        with lock:
+            if state["started"] or time.monotonic() < state["next_try"]:
+                return
+            if not _acquire_leader_lock(app):
+                state["next_try"] = time.monotonic() + LEADER_RETRY_SECONDS
+                return
+            state["started"] = True
+            for start in starters:
+                start(app)
+            logger.info("Started background workers in process %s", os.getpid())
@@ -0,0 +1,180 @@
+# app/services/bulk_import.py
+
+import csv
+import io
+import json
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import insert
+
+from ..models import DataPoint, FitnessSession, db
+from .rollups import RollupAccumulator
+from .sessions import update_running_stats
+
+POINT_FIELDS = (
+    "timestamp",
+    "speed_kmh",
+    "rpm",
+    "distance_km",
+    "calories_kcal",
+    "time_seconds",
+    "mets",
+)
+POINT_DEFAULTS = {
+    "speed_kmh": 0.0,
+    "rpm": 0.0,
+    "distance_km": 0.0,
+    "calories_kcal": 0.0,
+    "time_seconds": 0,
+    "mets": 0.0,
+}
+# executemanyで1回に送る行数
+BATCH_SIZE = 5000
+
+
+def parse_points(points_data):
+    """データポイントのリストをDataPointの列値（辞書）のリストに変換"""
+    return [
+        {
+            "timestamp": datetime.fromisoformat(point.get("timestamp")),
+            **{field: point.get(field, default) for field, default in POINT_DEFAULTS.items()},
+        }
+        for point in points_data
+    ]
+
+
+def find_duplicate_session(device_id, start_time, end_time):
+    """同じデバイス・同じ期間で取り込み済みのセッションを探す"""
+    return FitnessSession.query.filter_by(
+        device_id=device_id, start_time=start_time, end_time=end_time
+    ).first()
+
+
+def insert_points(session_id, rows):
+    """データポイントを一括で挿入（PostgreSQLはCOPY、それ以外はexecutemany）"""
+    if not rows:
+        return
+    if db.session.get_bind().dialect.name == "postgresql":
+        _copy_points(session_id, rows)
+        return
+
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(
+            insert(DataPoint),
+            [dict(row, session_id=session_id) for row in rows[start : start + BATCH_SIZE]],
+        )
+
+
+def _copy_points(session_id, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([session_id] + [row[field] for field in POINT_FIELDS])
+    buffer.seek(0)
+
+    # セッションと同じトランザクションのDBAPIコネクションを使う
+    connection = db.session.connection().connection
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY data_points (session_id, {}) FROM STDIN WITH (FORMAT csv)".format(
+                ", ".join(POINT_FIELDS)
+            ),
+            buffer,
+        )
+
+
+def import_session(device_id, session_data, rollups=None):
+    """1セッション分を取り込み、結果を返す（コミットは呼び出し側）
+
+    同じデバイス・開始/終了時刻のセッションが既にあれば取り込まずに
+    duplicateとして返すため、再アップロードしても重複しない。
+    """
+    start_time = datetime.fromisoformat(session_data.get("start_time"))
+    end_time = datetime.fromisoformat(session_data.get("end_time"))
+
+    duplicate = find_duplicate_session(device_id, start_time, end_time)
+    if duplicate:
+        return {
+            "status": "duplicate",
+            "session_id": duplicate.id,
+            "start_time": duplicate.start_time.isoformat(),
+            "points": 0,
+        }
+
+    rows = parse_points(session_data.get("data_points", []))
+
+    session = FitnessSession(
+        device_id=device_id,
+        start_time=start_time,
+        end_time=end_time,
+        total_time_seconds=session_data.get("total_time_seconds", 0),
+        total_distance_km=session_data.get("total_distance_km", 0.0),
+        total_calories_kcal=session_data.get("total_calories_kcal", 0.0),
+        average_speed_kmh=session_data.get("average_speed_kmh", 0.0),
+        average_rpm=session_data.get("average_rpm", 0.0),
+        average_mets=session_data.get("average_mets", 0.0),
+        # データポイントはdata_pointsテーブルに入るため、raw_dataにはヘッダーだけを残す
+        raw_data={k: v for k, v in session_data.items() if k != "data_points"},
+    )
+    # 平均値・最小/最大・移動時間はデータポイントから集計する（無ければ上の値のまま）
+    update_running_stats(session, rows, current_app.config["SESSION_MOVING_SPEED_KMH"])
+    db.session.add(session)
+    db.session.flush()  # セッションIDを取得するためにフラッシュ
+
+    insert_points(session.id, rows)
+    if rollups is not None and rows:
+        rollups.add_samples(device_id, rows)
+    elif rollups is not None:
+        rollups.add_session_totals(
+            device_id,
+            start_time,
+            session.total_time_seconds,
+            session.total_distance_km,
+            session.total_calories_kcal,
+        )
+
+    return {
+        "status": "success",
+        "session_id": session.id,
+        "start_time": session.start_time.isoformat(),
+        "points": len(rows),
+    }
+
+
+def import_ndjson(lines, device_id=None):
+    """改行区切りJSONのセッションを1行ずつ取り込み、結果を順にyieldする
+
+    各行が1セッション（import_sessionと同じ形式）。start_timeを持たない行は
+    ヘッダーとして扱い、そのdevice_idを以降の行の既定値にする。
+    セッションごとにコミットするため、メモリ使用量は1セッション分に収まる。
+    """
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        record = {}
+        try:
+            record = json.loads(line)
+            if "start_time" not in record:
+                device_id = record.get("device_id", device_id)
+                continue
+            session_device_id = record.get("device_id", device_id)
+            if not session_device_id:
+                raise ValueError("device_id is required")
+
+            rollups = RollupAccumulator()
+            result = import_session(session_device_id, record, rollups)
+            rollups.apply()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            result = {
+                "status": "error",
+                "error": str(e),
+                "start_time": record.get("start_time") if isinstance(record, dict) else None,
+            }
+
+        result["line"] = line_number
+        yield result
@@ -0,0 +1,78 @@
+# app/services/credentials.py
+
+import base64
+import hashlib
+import json
+import logging
+from functools import lru_cache
+
+from cryptography.fernet import Fernet, InvalidToken
+from flask import current_app
+
+from ..models import ServiceCredential, db
+from ..models.credential import DEFAULT_OWNER
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=4)
+def _fernet(key):
+    return Fernet(key)
+
+
+def _cipher():
+    """CREDENTIALS_ENCRYPTION_KEY（未設定の場合はSECRET_KEYから導出）の暗号器"""
+    key = current_app.config["CREDENTIALS_ENCRYPTION_KEY"]
+    if not key:
+        digest = hashlib.sha256(current_app.config["SECRET_KEY"].encode()).digest()
+        key = base64.urlsafe_b64encode(digest).decode()
+    return _fernet(key)
+
+
+def encrypt(data):
+    return _cipher().encrypt(json.dumps(data).encode()).decode()
+
+
+def decrypt(token):
+    return json.loads(_cipher().decrypt(token.encode()))
+
+
+def find_credential(service, device_id=None):
+    """デバイスの認証情報を取得（なければ共通の認証情報）"""
+    owners = [DEFAULT_OWNER] if device_id is None else [device_id, DEFAULT_OWNER]
+    rows = ServiceCredential.query.filter(
+        ServiceCredential.service == service, ServiceCredential.owner.in_(owners)
+    ).all()
+    rows.sort(key=lambda row: owners.index(row.owner))
+    return rows[0] if rows else None
+
+
+def load_credentials(service, device_id=None):
+    """(所有者, 復号した認証情報)を返す。ない場合や復号できない場合は(None, None)"""
+    row = find_credential(service, device_id)
+    if row is None:
+        return None, None
+    try:
+        return row.owner, decrypt(row.encrypted_data)
+    except InvalidToken:
+        # 暗号鍵を変更した場合など。再連携が必要
+        logger.warning("Cannot decrypt %s credentials for %s", service, row.owner)
+        return None, None
+
+
+def save_credentials(service, data, owner=DEFAULT_OWNER, expiry=None):
+    """認証情報を暗号化して保存（既存の場合は更新）し、コミットする"""
+    row = ServiceCredential.query.filter_by(service=service, owner=owner).first()
+    if row is None:
+        row = ServiceCredential(service=service, owner=owner)
+        db.session.add(row)
+    row.encrypted_data = encrypt(data)
+    row.expiry = expiry
+    db.session.commit()
+    return row
+
+
+def delete_credentials(service, owner=DEFAULT_OWNER):
+    deleted = ServiceCredential.query.filter_by(service=service, owner=owner).delete()
+    db.session.commit()
+    return deleted
@@ -0,0 +1,63 @@
+# app/services/downsample.py
+
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Bucketsで残す点のインデックスを返す
+
+    x, yは同じ長さの数値配列（xは昇順）。先頭と末尾の点は必ず残す。
+    各バケット内の三角形面積の計算はNumPyでまとめて行う。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # 先頭・末尾を除いた点をthreshold-2個のバケットに分割
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        area = np.abs(
+            (x[selected] - avg_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (avg_y - y[selected])
+        )
+        selected = start + int(np.argmax(area))
+        indices[bucket + 1] = selected
+
+    return indices
+
+
+def minmax_indices(y, buckets):
+    """各バケットの最小値・最大値の点のインデックスを時系列順で返す"""
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= buckets * 2:
+        return np.arange(n)
+
+    bucket_ids = (np.arange(n) * buckets) // n
+    # バケット順・値順に並べ、各バケットの先頭（最小）と末尾（最大）を取る
+    order = np.lexsort((y, bucket_ids))
+    sorted_ids = bucket_ids[order]
+    firsts = np.searchsorted(sorted_ids, np.arange(buckets), side="left")
+    lasts = np.searchsorted(sorted_ids, np.arange(buckets), side="right") - 1
+    return np.unique(np.concatenate([order[firsts], order[lasts]]))
+
+
+def downsample_indices(x, y, points, mode="lttb"):
+    """modeに応じてlttbまたはminmaxで残す点のインデックスを返す"""
+    if mode == "minmax":
+        return minmax_indices(y, max(points // 2, 1))
+    return lttb_indices(x, y, points)
@@ -0,0 +1,223 @@
+# app/services/export.py
+
+import csv
+import io
+import json
+import zipfile
+from datetime import datetime
+
+from sqlalchemy import select
+
+from ..models import DataPoint, FitnessSession, SessionArchive, db
+from .point_archive import columns_to_tuples, decode_points
+
+# サーバーサイドカーソルから一度に取り出す行数
+YIELD_PER = 2000
+# レスポンスに書き出すチャンクの目安サイズ（バイト）
+CHUNK_SIZE = 64 * 1024
+
+SESSION_COLUMNS = (
+    FitnessSession.id,
+    FitnessSession.device_id,
+    FitnessSession.start_time,
+    FitnessSession.end_time,
+    FitnessSession.total_time_seconds,
+    FitnessSession.total_distance_km,
+    FitnessSession.total_calories_kcal,
+    FitnessSession.average_speed_kmh,
+    FitnessSession.average_rpm,
+    FitnessSession.average_mets,
+)
+POINT_COLUMNS = (
+    DataPoint.timestamp,
+    DataPoint.speed_kmh,
+    DataPoint.rpm,
+    DataPoint.distance_km,
+    DataPoint.calories_kcal,
+    DataPoint.time_seconds,
+    DataPoint.mets,
+)
+SESSION_FIELDS = [column.key for column in SESSION_COLUMNS]
+POINT_FIELDS = [column.key for column in POINT_COLUMNS]
+
+
+def _session_criteria(start_date, end_date, device_id=None):
+    criteria = [FitnessSession.start_time.between(start_date, end_date)]
+    if device_id:
+        criteria.append(FitnessSession.device_id == device_id)
+    return criteria
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _stream(statement):
+    """サーバーサイドカーソルでyield_per行ずつ読み出す"""
+    return db.session.execute(statement.execution_options(yield_per=YIELD_PER))
+
+
+def _archived_points(blob):
+    """圧縮済みセッションのデータポイントをPOINT_FIELDS順のタプルで返す"""
+    return columns_to_tuples(decode_points(blob), POINT_FIELDS)
+
+
+def iter_json_export(start_date, end_date, device_id=None):
+    """セッションとデータポイントをJSON配列として逐次生成
+
+    セッションとデータポイントを結合した1本のクエリをセッションID・時刻順に
+    読み出し、セッションの切り替わりでオブジェクトを閉じる。
+    """
+    # 圧縮済みのセッションはデータポイントの代わりにアーカイブが1行で結合される
+    statement = (
+        select(*SESSION_COLUMNS, *POINT_COLUMNS, SessionArchive.data.label("archive"))
+        .outerjoin(DataPoint, DataPoint.session_id == FitnessSession.id)
+        .outerjoin(SessionArchive, SessionArchive.session_id == FitnessSession.id)
+        .where(*_session_criteria(start_date, end_date, device_id))
+        .order_by(FitnessSession.id, DataPoint.timestamp)
+    )
+
+    buffer = ["["]
+    size = 1
+    current_id = None
+    first_point = True
+    for row in _stream(statement):
+        mapping = row._mapping
+        if mapping["id"] != current_id:
+            if current_id is not None:
+                buffer.append("]},")
+            current_id = mapping["id"]
+            first_point = True
+            header = json.dumps({field: _value(mapping[field]) for field in SESSION_FIELDS})
+            buffer.append(header[:-1] + ', "data_points": [')
+            size += len(buffer[-1])
+
+        if mapping["archive"] is not None:
+            points = _archived_points(mapping["archive"])
+        elif mapping["timestamp"] is not None:
+            points = [tuple(mapping[field] for field in POINT_FIELDS)]
+        else:
+            points = []
+
+        for values in points:
+            point = json.dumps(
+                {field: _value(value) for field, value in zip(POINT_FIELDS, values)}
+            )
+            buffer.append(point if first_point else "," + point)
+            size += len(point) + 1
+            first_point = False
+
+            if size >= CHUNK_SIZE:
+                yield "".join(buffer)
+                buffer, size = [], 0
+
+    if current_id is not None:
+        buffer.append("]}")
+    buffer.append("]")
+    yield "".join(buffer)
+
+
+def _iter_point_rows(criteria):
+    """(session_id, *POINT_FIELDS)の行をセッションID・時刻順に返す
+
+    data_pointsの行を読み出しながら、圧縮済みのセッションをセッションID順に差し込む。
+    """
+    archived = iter(
+        db.session.execute(
+            select(SessionArchive.session_id)
+            .join(FitnessSession, SessionArchive.session_id == FitnessSession.id)
+            .where(*criteria)
+            .order_by(SessionArchive.session_id)
+        ).scalars().all()
+    )
+
+    def archived_rows(session_id):
+        blob = db.session.execute(
+            select(SessionArchive.data).where(SessionArchive.session_id == session_id)
+        ).scalar_one()
+        for values in _archived_points(blob):
+            yield (session_id, *values)
+
+    next_archived = next(archived, None)
+    points = (
+        select(DataPoint.session_id, *POINT_COLUMNS)
+        .join(FitnessSession, DataPoint.session_id == FitnessSession.id)
+        .where(*criteria)
+        .order_by(DataPoint.session_id, DataPoint.timestamp)
+    )
+    for row in _stream(points):
+        while next_archived is not None and next_archived < row.session_id:
+            yield from archived_rows(next_archived)
+            next_archived = next(archived, None)
+        yield row
+    while next_archived is not None:
+        yield from archived_rows(next_archived)
+        next_archived = next(archived, None)
+
+
+class _ChunkWriter:
+    """ZipFileの書き込み先として使う、シーク不可の出力バッファ"""
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self._chunks)
+        self._chunks, self.size = [], 0
+        return data
+
+
+def iter_csv_zip_export(start_date, end_date, device_id=None):
+    """sessions.csvとdata_points.csvを含むZIPを逐次生成
+
+    ZIPはシーク不可のストリームとして書き出すため、一時ファイルを使わない。
+    data_points.csvはデータポイントが1件以上ある場合のみ含める。
+    """
+    criteria = _session_criteria(start_date, end_date, device_id)
+    out = _ChunkWriter()
+
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        # セッション一覧
+        sessions = (
+            select(*SESSION_COLUMNS).where(*criteria).order_by(FitnessSession.id)
+        )
+        with io.TextIOWrapper(
+            zf.open("sessions.csv", "w", force_zip64=True), encoding="utf-8", newline=""
+        ) as text:
+            writer = csv.writer(text, lineterminator="\n")
+            writer.writerow(["session_id"] + SESSION_FIELDS[1:])
+            for row in _stream(sessions):
+                writer.writerow([_value(value) for value in row])
+                if out.size >= CHUNK_SIZE:
+                    yield out.pop()
+
+        # データポイント（セッションと結合した1本のクエリと圧縮済みのセッション）
+        text = None
+        writer = None
+        for row in _iter_point_rows(criteria):
+            if text is None:
+                text = io.TextIOWrapper(
+                    zf.open("data_points.csv", "w", force_zip64=True),
+                    encoding="utf-8",
+                    newline="",
+                )
+                writer = csv.writer(text, lineterminator="\n")
+                writer.writerow(["session_id"] + POINT_FIELDS)
+            writer.writerow([_value(value) for value in row])
+            if out.size >= CHUNK_SIZE:
+                yield out.pop()
+        if text is not None:
+            text.close()
+
+    yield out.pop()
@@ -0,0 +1,84 @@
+# app/services/frames.py
+
+import struct
+
+FRAMES_MIMETYPE = "application/x-fit2go-frames"
+MAGIC = b"F2GF"
+VERSION = 1
+
+# ヘッダー: マジック, バージョン, device_idのバイト長, サンプル数（この後にdevice_id）
+HEADER = struct.Struct("<4sBBH")
+# 1サンプル（リトルエンディアン、44バイト）
+FRAME = struct.Struct("<QffIfffIff")
+FRAME_FIELDS = (
+    "timestamp_ms",
+    "speed_kmh",
+    "rpm",
+    "session_time_s",
+    "session_dist_km",
+    "session_cal_kcal",
+    "mets",
+    "total_time_s",
+    "total_dist_km",
+    "total_cal_kcal",
+)
+
+
+class FrameError(ValueError):
+    """バイナリフレームの形式が不正"""
+
+
+def encode_frames(device_id, packets):
+    """receive_dataと同じキーを持つパケットのリストをバイナリフレームに変換
+
+    無いキーは0として詰める。timestamp_msの0は「未指定」を表す。
+    """
+    device = device_id.encode("utf-8")
+    if len(device) > 255:
+        raise FrameError("device_id is too long")
+    if len(packets) > 0xFFFF:
+        raise FrameError("too many samples in one request")
+
+    body = bytearray(HEADER.pack(MAGIC, VERSION, len(device), len(packets)))
+    body += device
+    for packet in packets:
+        body += FRAME.pack(*(packet.get(field, 0) for field in FRAME_FIELDS))
+    return bytes(body)
+
+
+def decode_frames(body):
+    """バイナリフレームを(device_id, パケットのリスト)に変換
+
+    パケットはJSONで受信した場合と同じキーの辞書になるため、
+    以降の処理（point_values, store_samplesなど）をそのまま使える。
+    timestamp_msが0のサンプルはキーを省き、JSONと同じく受信時刻を使わせる。
+    """
+    if len(body) < HEADER.size:
+        raise FrameError("frame header is truncated")
+    magic, version, device_length, count = HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise FrameError("invalid frame magic")
+    if version != VERSION:
+        raise FrameError(f"unsupported frame version: {version}")
+
+    offset = HEADER.size + device_length
+    if len(body) != offset + count * FRAME.size:
+        raise FrameError(
+            f"expected {count} samples ({offset + count * FRAME.size} bytes), "
+            f"got {len(body)} bytes"
+        )
+    if count == 0:
+        raise FrameError("no samples in request")
+
+    try:
+        device_id = body[HEADER.size : offset].decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise FrameError("device_id is not valid UTF-8") from e
+
+    packets = []
+    for values in FRAME.iter_unpack(body[offset:]):
+        packet = dict(zip(FRAME_FIELDS, values), device_id=device_id)
+        if not packet["timestamp_ms"]:
+            del packet["timestamp_ms"]
+        packets.append(packet)
+    return device_id, packets
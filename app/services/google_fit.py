@@ -1,16 +1,31 @@
 # app/services/google_fit.py
 
 import json
+import logging
 import os
-from datetime import datetime, timezone
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from time import perf_counter
 
+import httplib2
 import requests
 from flask import current_app, redirect, request, session, url_for
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request as AuthRequest
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
 
+from ..models.credential import DEFAULT_OWNER
+from .credentials import load_credentials, save_credentials
+
+logger = logging.getLogger(__name__)
+
 # Google Fit APIのスコープ
 SCOPES = [
     "https://www.googleapis.com/auth/fitness.activity.read",
@@ -18,21 +33,90 @@ SCOPES = [
 ]
 
 
-def get_google_fit_service():
-    """Google Fit APIのサービスオブジェクトを取得"""
-    credentials = get_credentials()
+# データ型ごとのデータソース: キー -> (データ型名, フィールド名)
+DATA_TYPES = {
+    "rpm": ("com.google.cycling.wheel_revolution.rpm", "rpm"),
+    "speed": ("com.google.speed", "speed"),
+    "calories": ("com.google.calories.expended", "calories"),
+}
+
+NANOS = 1_000_000_000
+
+AUTH_URI = "https://accounts.google.com/o/oauth2/auth"
+TOKEN_URI = "https://oauth2.googleapis.com/token"
+
+# スレッドごとのHTTP接続（httplib2はスレッドセーフではない）
+_transports = threading.local()
+
+
+@lru_cache(maxsize=None)
+def _discovery_document():
+    """ライブラリ同梱のFitness APIのディスカバリードキュメント（ネットワークから取得しない）"""
+    return json.loads(get_static_doc("fitness", "v1"))
+
+
+def authorized_http(credentials):
+    """認証情報を付けたHTTPクライアント。接続はスレッドごとに使い回す"""
+    if not hasattr(_transports, "http"):
+        _transports.http = httplib2.Http()
+    return AuthorizedHttp(credentials, http=_transports.http)
+
+
+def refresh_if_expiring(credentials, owner=None):
+    """アクセストークンの期限がGOOGLE_TOKEN_REFRESH_MARGIN_SECONDS以内なら先に更新する
+
+    アップロードの途中で期限切れにならないよう、並列アップロードを始める前に呼ぶ。
+    ownerを指定すると更新したトークンを保存する。更新した場合はTrueを返す。
+    """
+    if not credentials.refresh_token:
+        return False
+    margin = timedelta(seconds=current_app.config["GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS"])
+    # google-authのexpiryはタイムゾーンなしのUTC
+    expiring = credentials.expiry is not None and (
+        credentials.expiry - margin <= datetime.utcnow()
+    )
+    if credentials.token and not expiring:
+        return False
+
+    credentials.refresh(AuthRequest())
+    if owner is not None:
+        store_credentials(credentials, owner)
+    return True
+
+
+def get_google_fit_service(credentials=None):
+    """Google Fit APIのサービスオブジェクトを取得（省略時は共通の認証情報を使用）
+
+    GOOGLE_FIT_API_ENDPOINTを設定すると、そのURLにリクエストを送る（ローカルのスタブ等）。
+    """
+    credentials = credentials or get_credentials()
     if not credentials:
         return None
 
-    return build("fitness", "v1", credentials=credentials)
+    endpoint = current_app.config["GOOGLE_FIT_API_ENDPOINT"]
+    return build_from_document(
+        _discovery_document(),
+        http=authorized_http(credentials),
+        client_options={"api_endpoint": endpoint} if endpoint else None,
+    )
 
 
-def get_credentials():
-    """保存されたGoogle認証情報を取得"""
-    if "google_credentials" not in session:
-        return None
+def get_credentials(device_id=None):
+    """保存されたGoogle認証情報を取得（デバイスの認証情報がなければ共通の認証情報）"""
+    return load_google_credentials(device_id)[1]
+
+
+def load_google_credentials(device_id=None):
+    """(所有者, Google認証情報)を取得。未連携の場合は(None, None)"""
+    owner, creds_data = load_credentials("google_fit", device_id)
+    if creds_data is None:
+        return None, None
+    return owner, credentials_from_dict(creds_data)
+
 
-    creds_data = json.loads(session["google_credentials"])
+def credentials_from_dict(creds_data):
+    """保存形式の辞書からGoogle認証情報を復元"""
+    expiry = creds_data.get("expiry")
     return Credentials(
         token=creds_data["token"],
         refresh_token=creds_data["refresh_token"],
@@ -40,99 +124,95 @@ def get_credentials():
         client_id=current_app.config["GOOGLE_CLIENT_ID"],
         client_secret=current_app.config["GOOGLE_CLIENT_SECRET"],
         scopes=creds_data["scopes"],
+        expiry=datetime.fromisoformat(expiry) if expiry else None,
     )
 
 
-def store_credentials(credentials):
-    """Google認証情報をセッションに保存"""
-    session["google_credentials"] = json.dumps(
-        {
-            "token": credentials.token,
-            "refresh_token": credentials.refresh_token,
-            "token_uri": credentials.token_uri,
-            "scopes": credentials.scopes,
-        }
+def store_credentials(credentials, owner=DEFAULT_OWNER):
+    """Google認証情報を暗号化してサーバー側に保存（ownerはデバイスID）"""
+    save_credentials(
+        "google_fit", credentials_to_dict(credentials), owner, credentials.expiry
     )
 
 
-def get_authorization_url():
-    """Google認証のURLを取得"""
+def credentials_to_dict(credentials):
+    """Google認証情報を保存形式の辞書に変換"""
+    return {
+        "token": credentials.token,
+        "refresh_token": credentials.refresh_token,
+        "token_uri": credentials.token_uri,
+        "scopes": credentials.scopes,
+        "expiry": credentials.expiry.isoformat() if credentials.expiry else None,
+    }
+
+
+@lru_cache(maxsize=8)
+def _client_config(client_id, client_secret, redirect_uri):
+    return {
+        "web": {
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "auth_uri": AUTH_URI,
+            "token_uri": TOKEN_URI,
+            "redirect_uris": [redirect_uri],
+        }
+    }
+
+
+def _oauth_flow(**kwargs):
+    """OAuthフローを作成
+
+    クライアント設定はキャッシュして使い回す。Flowはユーザーごとのstateや
+    PKCEのcode_verifierを持つため、リクエストごとに作成する。
+    """
+    redirect_uri = url_for("main.google_fit_callback", _external=True)
     flow = Flow.from_client_config(
-        {
-            "web": {
-                "client_id": current_app.config["GOOGLE_CLIENT_ID"],
-                "client_secret": current_app.config["GOOGLE_CLIENT_SECRET"],
-                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                "token_uri": "https://oauth2.googleapis.com/token",
-                "redirect_uris": [url_for("main.google_fit_callback", _external=True)],
-            }
-        },
+        _client_config(
+            current_app.config["GOOGLE_CLIENT_ID"],
+            current_app.config["GOOGLE_CLIENT_SECRET"],
+            redirect_uri,
+        ),
         scopes=SCOPES,
+        **kwargs,
     )
+    flow.redirect_uri = redirect_uri
+    return flow
 
-    flow.redirect_uri = url_for("main.google_fit_callback", _external=True)
+
+def get_authorization_url(device_id=None):
+    """Google認証のURLを取得（device_idを指定するとそのデバイス専用の認証情報として保存）"""
+    flow = _oauth_flow()
     authorization_url, state = flow.authorization_url(
         access_type="offline", include_granted_scopes="true"
     )
 
     session["google_auth_state"] = state
+    # コールバックで同じcode_verifierを使う必要がある
+    session["google_code_verifier"] = flow.code_verifier
+    session["google_auth_owner"] = device_id or DEFAULT_OWNER
     return authorization_url
 
 
 def handle_callback(request):
     """認証コールバックを処理してトークンを取得"""
-    state = session.get("google_auth_state", "")
-
-    flow = Flow.from_client_config(
-        {
-            "web": {
-                "client_id": current_app.config["GOOGLE_CLIENT_ID"],
-                "client_secret": current_app.config["GOOGLE_CLIENT_SECRET"],
-                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                "token_uri": "https://oauth2.googleapis.com/token",
-                "redirect_uris": [url_for("main.google_fit_callback", _external=True)],
-            }
-        },
-        scopes=SCOPES,
-        state=state,
+    flow = _oauth_flow(
+        state=session.get("google_auth_state", ""),
+        code_verifier=session.pop("google_code_verifier", None),
+        autogenerate_code_verifier=False,
     )
 
-    flow.redirect_uri = url_for("main.google_fit_callback", _external=True)
-
     # コードを使用してフローを完了し、認証情報を取得
     authorization_response = request.url
     flow.fetch_token(authorization_response=authorization_response)
 
     credentials = flow.credentials
-    store_credentials(credentials)
+    store_credentials(credentials, session.pop("google_auth_owner", DEFAULT_OWNER))
 
     return credentials
 
 
-def upload_fitness_session(session_id):
-    """フィットネスセッションをGoogle Fitにアップロード"""
-    from ..models import DataPoint, FitnessSession
-
-    # セッションの取得
-    fitness_session = FitnessSession.query.get(session_id)
-    if not fitness_session:
-        return {"success": False, "error": "Session not found"}
-
-    # データポイントの取得
-    data_points = (
-        DataPoint.query.filter_by(session_id=session_id)
-        .order_by(DataPoint.timestamp)
-        .all()
-    )
-    if not data_points:
-        return {"success": False, "error": "No data points found for this session"}
-
-    # Google Fitサービスの取得
-    service = get_google_fit_service()
-    if not service:
-        return {"success": False, "error": "Not authenticated with Google Fit"}
-
-    # 開始時間と終了時間をnanoseconds単位のタイムスタンプに変換
+def session_time_range_nanos(fitness_session):
+    """セッションの開始・終了時刻（ナノ秒）。Google FitのデータセットIDに使用"""
     start_time_nanos = int(
         fitness_session.start_time.replace(tzinfo=timezone.utc).timestamp() * 1e9
     )
@@ -142,101 +222,273 @@ def upload_fitness_session(session_id):
         .timestamp()
         * 1e9
     )
+    return start_time_nanos, end_time_nanos
 
-    # データソースID（アプリケーション固有）
-    data_source_id = (
-        f"raw:com.cycling:fit2go_dashboard:{current_app.config['APP_ID']}:cycling"
-    )
 
-    # サイクリングのデータセットを作成
-    cycling_data = {
-        "dataSourceId": data_source_id,
-        "minStartTimeNs": start_time_nanos,
-        "maxEndTimeNs": end_time_nanos,
-        "point": [],
-    }
+def session_dataset_id(fitness_session):
+    """Google FitのデータセットID（"開始ns-終了ns"）"""
+    return "{}-{}".format(*session_time_range_nanos(fitness_session))
 
-    # データポイントを追加
-    for point in data_points:
-        point_time_nanos = int(
-            point.timestamp.replace(tzinfo=timezone.utc).timestamp() * 1e9
-        )
 
-        # サイクリングのデータポイント
-        cycling_data["point"].append(
-            {
-                "startTimeNanos": point_time_nanos,
-                "endTimeNanos": point_time_nanos + int(1e9),  # 1秒間のデータポイント
-                "dataTypeName": "com.google.cycling.wheel_revolution.rpm",
-                "value": [{"fpVal": point.rpm}],
-            }
-        )
-
-        # 速度のデータポイント
-        cycling_data["point"].append(
-            {
-                "startTimeNanos": point_time_nanos,
-                "endTimeNanos": point_time_nanos + int(1e9),
-                "dataTypeName": "com.google.speed",
-                "value": [{"fpVal": point.speed_kmh / 3.6}],  # km/h から m/s に変換
-            }
+def ensure_data_sources(service):
+    """アプリのデータソースをデータ型ごとに取得（なければ作成）し、キー -> データソースIDを返す"""
+    app_id = current_app.config["APP_ID"]
+    stream_name = f"fit2go_dashboard:{app_id}:cycling"
+    sources = {}
+    for key, (data_type, field) in DATA_TYPES.items():
+        existing = (
+            service.users()
+            .dataSources()
+            .list(userId="me", dataTypeName=data_type)
+            .execute()
+            .get("dataSource", [])
         )
-
-        # カロリーのデータポイント (累積)
-        if point.calories_kcal > 0:
-            cycling_data["point"].append(
+        for source in existing:
+            if (
+                source.get("dataStreamName") == stream_name
+                and source["dataType"]["name"] == data_type
+            ):
+                sources[key] = source["dataStreamId"]
+                break
+        else:
+            created = (
+                service.users()
+                .dataSources()
+                .create(
+                    userId="me",
+                    body={
+                        "dataStreamName": stream_name,
+                        "type": "raw",
+                        "application": {"name": "fit2go_dashboard", "version": app_id},
+                        "dataType": {
+                            "name": data_type,
+                            "field": [{"name": field, "format": "floatPoint"}],
+                        },
+                    },
+                )
+                .execute()
+            )
+            sources[key] = created["dataStreamId"]
+    return sources
+
+
+def build_chunks(fitness_session, rows, chunk_seconds):
+    """サンプルをデータ型ごと・時間枠ごとのチャンクに分割する
+
+    rowsは(timestamp, rpm, speed_kmh, calories_kcal)の時刻順のリスト。
+    時間枠はセッション開始時刻を起点にchunk_seconds秒ごとに区切るため、
+    再試行しても同じチャンクになる。
+    """
+    session_start_ns, _ = session_time_range_nanos(fitness_session)
+    chunk_ns = chunk_seconds * NANOS
+    chunks = {}
+    for timestamp, rpm, speed_kmh, calories_kcal in rows:
+        point_ns = int(timestamp.replace(tzinfo=timezone.utc).timestamp() * 1e9)
+        window_ns = session_start_ns + (point_ns - session_start_ns) // chunk_ns * chunk_ns
+        values = {
+            "rpm": rpm,
+            "speed": speed_kmh / 3.6 if speed_kmh is not None else None,  # km/h から m/s に変換
+            # カロリーは累積値。0のサンプルは送らない
+            "calories": calories_kcal if calories_kcal else None,
+        }
+        for key, value in values.items():
+            if value is None:
+                continue
+            chunk = chunks.setdefault((key, window_ns), [])
+            chunk.append(
                 {
-                    "startTimeNanos": point_time_nanos,
-                    "endTimeNanos": point_time_nanos + int(1e9),
-                    "dataTypeName": "com.google.calories.expended",
-                    "value": [{"fpVal": point.calories_kcal}],
+                    "startTimeNanos": point_ns,
+                    "endTimeNanos": point_ns + NANOS,  # 1秒間のデータポイント
+                    "dataTypeName": DATA_TYPES[key][0],
+                    "value": [{"fpVal": value}],
                 }
             )
 
+    return [
+        {
+            "data_type": key,
+            "start_time_ns": window_ns,
+            "dataset_id": f"{points[0]['startTimeNanos']}-{points[-1]['endTimeNanos']}",
+            "points": points,
+        }
+        for (key, window_ns), points in sorted(chunks.items(), key=lambda item: item[0][1])
+    ]
+
+
+@lru_cache(maxsize=None)
+def _upload_executor(threads):
+    """チャンクのアップロード用スレッドプール
+
+    プロセス内で共有し、スレッドごとのHTTP接続を同期のたびに作り直さないようにする。
+    """
+    return ThreadPoolExecutor(max_workers=threads, thread_name_prefix="google-fit")
+
+
+def _http_error_result(error):
+    # レート制限とサーバーエラーは再試行する
+    status = error.resp.status
+    return {
+        "success": False,
+        "error": str(error),
+        "retryable": status == 429 or status >= 500,
+    }
+
+
+def upload_fitness_session(session_id, credentials=None):
+    """フィットネスセッションをGoogle Fitにアップロード
+
+    データ型ごと・GOOGLE_FIT_CHUNK_SECONDSごとのチャンクに分け、
+    GOOGLE_FIT_UPLOAD_THREADS並列でアップロードする。
+    アップロード済みのチャンクはgoogle_fit_chunksに記録し、再試行時は残りだけを送る。
+    credentialsを省略した場合はセッションのデバイスの保存済み認証情報を使用する。
+    """
+    from ..models import FitnessSession, GoogleFitChunk, db
+    from .point_archive import load_points
+
+    # セッションの取得
+    fitness_session = db.session.get(FitnessSession, session_id)
+    if not fitness_session:
+        return {"success": False, "error": "Session not found"}
+
+    # データポイントの取得（圧縮済みのセッションはアーカイブから復元）
+    rows = load_points(session_id, ("timestamp", "rpm", "speed_kmh", "calories_kcal"))
+    if not rows:
+        return {"success": False, "error": "No data points found for this session"}
+
+    # Google Fitサービスの取得
+    owner = None
+    if credentials is None:
+        owner, credentials = load_google_credentials(fitness_session.device_id)
+    service = get_google_fit_service(credentials)
+    if not service:
+        return {
+            "success": False,
+            "error": "Not authenticated with Google Fit",
+            "skipped": True,
+        }
+
+    started = perf_counter()
     try:
-        # データをGoogle Fitにアップロード
-        response = (
-            service.users()
-            .dataSources()
-            .datasets()
-            .patch(
+        refresh_if_expiring(credentials, owner)
+        sources = ensure_data_sources(service)
+    except HttpError as error:
+        return _http_error_result(error)
+    except RefreshError as error:
+        return {"success": False, "error": f"Token refresh failed: {error}", "retryable": False}
+
+    chunks = build_chunks(
+        fitness_session, rows, current_app.config["GOOGLE_FIT_CHUNK_SECONDS"]
+    )
+    uploaded = {
+        (chunk.data_type, chunk.start_time_ns)
+        for chunk in GoogleFitChunk.query.filter_by(session_id=session_id)
+    }
+    pending = [
+        chunk
+        for chunk in chunks
+        if (chunk["data_type"], chunk["start_time_ns"]) not in uploaded
+    ]
+
+    def upload_chunk(chunk):
+        data_source_id = sources[chunk["data_type"]]
+        min_ns, max_ns = chunk["dataset_id"].split("-")
+        try:
+            service.users().dataSources().datasets().patch(
                 userId="me",
                 dataSourceId=data_source_id,
-                datasetId=f"{start_time_nanos}-{end_time_nanos}",
-                body=cycling_data,
+                datasetId=chunk["dataset_id"],
+                body={
+                    "dataSourceId": data_source_id,
+                    "minStartTimeNs": int(min_ns),
+                    "maxEndTimeNs": int(max_ns),
+                    "point": chunk["points"],
+                },
+            ).execute(http=authorized_http(credentials))
+            return None
+        except HttpError as error:
+            return _http_error_result(error)
+        except Exception as e:
+            return {"success": False, "error": str(e), "retryable": True}
+
+    failures = []
+    points_uploaded = 0
+    if pending:
+        executor = _upload_executor(current_app.config["GOOGLE_FIT_UPLOAD_THREADS"])
+        for chunk, failure in zip(pending, executor.map(upload_chunk, pending)):
+            if failure:
+                failures.append(failure)
+                continue
+            points_uploaded += len(chunk["points"])
+            db.session.add(
+                GoogleFitChunk(
+                    session_id=session_id,
+                    data_type=chunk["data_type"],
+                    start_time_ns=chunk["start_time_ns"],
+                    dataset_id=chunk["dataset_id"],
+                    points=len(chunk["points"]),
+                )
             )
-            .execute()
-        )
+        db.session.commit()
 
-        return {"success": True, "response": response}
-    except HttpError as error:
-        return {"success": False, "error": str(error)}
+    elapsed = perf_counter() - started
+    stats = {
+        "chunks": len(chunks),
+        "chunks_uploaded": len(pending) - len(failures),
+        "chunks_resumed": len(chunks) - len(pending),
+        "chunks_failed": len(failures),
+        "points_uploaded": points_uploaded,
+        "elapsed_seconds": round(elapsed, 3),
+        "points_per_second": round(points_uploaded / elapsed, 1) if elapsed > 0 else None,
+    }
+    logger.info(
+        "Google Fit upload for session %s: %d/%d chunks (%d resumed, %d failed), "
+        "%d points in %.2fs",
+        session_id,
+        stats["chunks_uploaded"],
+        len(chunks),
+        stats["chunks_resumed"],
+        stats["chunks_failed"],
+        points_uploaded,
+        elapsed,
+    )
+
+    if failures:
+        return {
+            "success": False,
+            "error": failures[0]["error"],
+            "retryable": any(failure["retryable"] for failure in failures),
+            "stats": stats,
+        }
+    return {"success": True, "stats": stats}
 
 
 def end_fitness_session(session_id, auto_sync=True):
-    """フィットネスセッションを終了し、必要に応じて同期する"""
+    """フィットネスセッションを終了し、必要に応じて同期ジョブを登録する
+
+    同期はジョブキュー（services/sync_jobs.py）で非同期に行い、
+    登録したジョブのIDをsync_job_idとして返す。
+    """
     import datetime
 
     from ..models import FitnessSession, db
+    from .sessions import finalize_sessions
+    from .sync_jobs import enqueue_sync
 
     session = FitnessSession.query.get(session_id)
     if not session:
         return {"success": False, "error": "Session not found"}
 
-    # セッションを終了
+    # セッションを終了し、取り込み時の集計値から平均値を確定
     session.end_time = datetime.datetime.now(datetime.timezone.utc)
+    finalize_sessions([session])
 
     try:
         db.session.commit()
 
-        # 自動同期が有効な場合、Google FitとHealth Connectに同期
+        # 自動同期が有効な場合、Google FitとHealth Connectへの同期ジョブを登録
         if auto_sync:
-            sync_result = sync_session_to_services(session_id)
-            return {
-                "success": True,
-                "session_id": session_id,
-                "sync_result": sync_result,
-            }
+            job = enqueue_sync(session_id)
+            return {"success": True, "session_id": session_id, "sync_job_id": job.id}
 
         return {"success": True, "session_id": session_id}
     except Exception as e:
@@ -244,42 +496,24 @@ def end_fitness_session(session_id, auto_sync=True):
         return {"success": False, "error": str(e)}
 
 
-def sync_session_to_services(session_id):
-    """セッションをGoogle FitとHealth Connectに同期"""
-    results = {
-        "google_fit": {"success": False, "error": None},
-        "health_connect": {"success": False, "error": None},
-    }
-
-    try:
-        # Google Fitへの同期
-        gfit_result = upload_fitness_session(session_id)
-        results["google_fit"] = gfit_result
-    except Exception as e:
-        results["google_fit"]["error"] = str(e)
-
-    try:
-        # Health Connectへの同期
-        hc_result = upload_to_health_connect(session_id)
-        results["health_connect"] = hc_result
-    except Exception as e:
-        results["health_connect"]["error"] = str(e)
-
-    return results
-
-
-def upload_to_health_connect(session_id):
+def upload_to_health_connect(session_id, credentials=None):
     """Health Connectにフィットネスデータをアップロード"""
-    from ..models import DataPoint, FitnessSession
+    from ..models import FitnessSession
 
     # セッションの取得
-    session = FitnessSession.query.get(session_id)
-    if not session:
+    fitness_session = FitnessSession.query.get(session_id)
+    if not fitness_session:
         return {"success": False, "error": "Session not found"}
 
     # Health Connect APIの認証情報を取得
-    if "health_connect_credentials" not in session:
-        return {"success": False, "error": "Not authenticated with Health Connect"}
+    if credentials is None:
+        _, credentials = load_credentials("health_connect", fitness_session.device_id)
+    if not credentials:
+        return {
+            "success": False,
+            "error": "Not authenticated with Health Connect",
+            "skipped": True,
+        }
 
     try:
         # Health Connect APIにデータをアップロード
@@ -0,0 +1,367 @@
+# app/services/ingest.py
+
+import atexit
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import insert
+
+from ..models import DataPoint, FitnessSession, db
+from .live_state import get_live_state
+from .raw_archive import archive_packets, summary_due
+from .rollups import RollupAccumulator, latest_point_values
+from .sessions import (
+    finalize_sessions,
+    get_active_session,
+    is_idle,
+    notify_session_ended,
+    update_running_stats,
+)
+from .stream import get_stream_broker
+
+logger = logging.getLogger(__name__)
+
+
+def parse_timestamp(data):
+    """パケットのtimestamp_msをdatetimeに変換（無い場合は受信時刻）"""
+    timestamp = datetime.utcnow()
+    if "timestamp_ms" in data:
+        try:
+            timestamp = datetime.fromtimestamp(data["timestamp_ms"] / 1000.0)
+        except (ValueError, TypeError):
+            pass
+    return timestamp
+
+
+def parse_point_time(value):
+    """ISO形式の時刻をDataPoint.timestampと同じ形式（サーバーのローカル時刻、naive）に変換
+
+    タイムゾーン付き（Zや+09:00）はローカル時刻に直す。解釈できない場合はValueError。
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def point_values(data):
+    """パケットからDataPointの列値を組み立てる（session_idは含まない）"""
+    return {
+        "timestamp": parse_timestamp(data),
+        "speed_kmh": data.get("speed_kmh", 0.0),
+        "rpm": data.get("rpm", 0.0),
+        "distance_km": data.get("session_dist_km", 0.0),
+        "calories_kcal": data.get("session_cal_kcal", 0.0),
+        "time_seconds": int(data.get("session_time_s", 0)),
+        "mets": data.get("mets", 0.0),
+    }
+
+
+def serialize_point(row):
+    """DataPointの列値をJSON用の辞書に変換"""
+    return {
+        "timestamp": row["timestamp"].isoformat(),
+        "speed_kmh": row["speed_kmh"],
+        "rpm": row["rpm"],
+        "distance_km": row["distance_km"],
+        "calories_kcal": row["calories_kcal"],
+        "time_seconds": row["time_seconds"],
+        "mets": row["mets"],
+    }
+
+
+def publish_sample(device_id, session_id, start_time, data, row):
+    """最新の状態をライブキャッシュに書き込み、SSEの購読者に配信"""
+    state = get_live_state().update(device_id, session_id, start_time, data, row)
+    get_stream_broker().publish(device_id, dict(state, point=serialize_point(row)))
+
+
+def get_or_create_active_session(device_id, data):
+    """デバイスのアクティブなセッションを取得、無ければ新規作成
+
+    最後の受信からSESSION_IDLE_TIMEOUT_SECONDSを超えたセッションは終了し、
+    新しいセッションを作成する。
+    """
+    session = get_active_session(device_id)
+    if session and is_idle(session, current_app.config["SESSION_IDLE_TIMEOUT_SECONDS"]):
+        finalize_sessions([session])
+        logger.info(
+            "Closed idle session %s for device %s before starting a new one",
+            session.id,
+            device_id,
+        )
+        notify_session_ended(session)
+        session = None
+    if session:
+        return session
+
+    now = datetime.utcnow()
+    session = FitnessSession(
+        device_id=device_id,
+        start_time=now,
+        last_seen_at=now,
+        total_time_seconds=data.get("total_time_s", 0),
+        total_distance_km=data.get("total_dist_km", 0.0),
+        total_calories_kcal=data.get("total_cal_kcal", 0.0),
+        average_speed_kmh=data.get("speed_kmh", 0.0),
+        average_rpm=data.get("rpm", 0.0),
+        average_mets=data.get("mets", 0.0),
+        raw_data=data,
+    )
+    db.session.add(session)
+    db.session.flush()
+    logger.info("Created new session %s for device %s", session.id, device_id)
+    return session
+
+
+def store_samples(session, packets, rows=None, rollups=None, previous=None):
+    """サンプルを複数行INSERTで保存し、セッションの集計値を1回だけ更新
+
+    ロールアップの増分はrollups（RollupAccumulator）に加える。省略した場合は
+    この呼び出しの中で加算まで行う。previousは直前に保存したサンプルの累積値
+    （latest_point_valuesと同じ形）で、呼び出し側が覚えていない場合だけDBから読む。
+    コミットは呼び出し側で行う。
+    """
+    if rows is None:
+        rows = [point_values(data) for data in packets]
+    if not rows:
+        return
+
+    if previous is None:
+        previous = latest_point_values(session.id)
+    db.session.execute(
+        insert(DataPoint), [dict(row, session_id=session.id) for row in rows]
+    )
+
+    if rollups is None:
+        accumulator = RollupAccumulator()
+        accumulator.add_samples(session.device_id, rows, previous)
+        accumulator.apply()
+    else:
+        rollups.add_samples(session.device_id, rows, previous)
+
+    # 平均値などはサンプルごとに集計値へ加算し、累計は最後のパケットの値を使用
+    update_running_stats(session, rows, current_app.config["SESSION_MOVING_SPEED_KMH"])
+    data = packets[-1]
+    session.total_time_seconds = data.get("total_time_s", session.total_time_seconds)
+    session.total_distance_km = data.get("total_dist_km", session.total_distance_km)
+    session.total_calories_kcal = data.get("total_cal_kcal", session.total_calories_kcal)
+    # raw_dataは最後のパケットの控え。毎秒書き換えないようRAW_SUMMARY_INTERVAL_SECONDSごとに更新
+    if summary_due(session.id, current_app.config["RAW_SUMMARY_INTERVAL_SECONDS"]):
+        session.raw_data = data
+    session.last_seen_at = datetime.utcnow()
+
+    if current_app.config["RAW_ARCHIVE_ENABLED"]:
+        archive_packets(session, packets)
+
+
+class IngestBufferFull(Exception):
+    """書き込みバッファが上限（INGEST_BUFFER_MAX_PENDING）に達している"""
+
+
+class IngestBuffer:
+    """受信サンプルをプロセス内に溜め、まとめてコミットする書き込みバッファ
+
+    サイズ（INGEST_BUFFER_MAX_SIZE）または時間（INGEST_FLUSH_INTERVAL_SECONDS）
+    のどちらかに達するとフラッシュする。フラッシュではセッションごとに
+    複数行INSERTとセッション集計の更新を1回ずつ行い、セッションごとにコミットする。
+    失敗したセッションの分だけを戻して再試行し、INGEST_FLUSH_MAX_RETRIES回続けて
+    失敗した分はエラーログに書き出して破棄する。未書き込みの件数が
+    INGEST_BUFFER_MAX_PENDINGに達している間はenqueueがIngestBufferFullを送出する。
+    プロセス終了時（atexit）には残りを必ず書き出す。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_size = 500
+        self.max_pending = 10000
+        self.max_retries = 5
+        self.flush_interval = 2.0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # session_id -> [(packet, row), ...]
+        self._size = 0
+        self._failures = {}  # session_id -> 続けて失敗した回数
+        self._sessions = {}  # device_id -> (session_id, start_time)
+        self._last_written = {}  # session_id -> 最後に書き込んだサンプルの列値
+        self._last_enqueued = {}  # device_id -> 最後にenqueueした時刻（monotonic）
+        self.idle_timeout = 0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_size = app.config["INGEST_BUFFER_MAX_SIZE"]
+        self.max_pending = app.config["INGEST_BUFFER_MAX_PENDING"]
+        self.max_retries = app.config["INGEST_FLUSH_MAX_RETRIES"]
+        self.flush_interval = app.config["INGEST_FLUSH_INTERVAL_SECONDS"]
+        self.idle_timeout = app.config["SESSION_IDLE_TIMEOUT_SECONDS"]
+        app.extensions["ingest_buffer"] = self
+
+        self._thread = threading.Thread(
+            target=self._run, name="ingest-buffer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def enqueue(self, device_id, data, row=None):
+        """サンプルをバッファに追加し、書き込み先の(セッションID, 開始時刻)を返す
+
+        リクエストコンテキスト内で呼び出すこと（新規セッションの作成に使用）。
+        バッファが上限に達している場合はIngestBufferFullを送出する。
+        """
+        if not self.has_room():
+            raise IngestBufferFull(self._size)
+        if row is None:
+            row = point_values(data)
+        session_id, start_time = self._session_ref(device_id, data)
+
+        with self._lock:
+            self._pending.setdefault(session_id, []).append((data, row))
+            self._size += 1
+            full = self._size >= self.max_size
+
+        if full:
+            self._wakeup.set()
+        return session_id, start_time
+
+    def has_room(self, count=1):
+        """count件を追加してもINGEST_BUFFER_MAX_PENDINGを超えないか"""
+        with self._lock:
+            return self._size + count <= self.max_pending
+
+    def forget(self, session_id):
+        """終了したセッションをデバイスのキャッシュから外す"""
+        with self._lock:
+            for device_id, (cached_id, _) in list(self._sessions.items()):
+                if cached_id == session_id:
+                    del self._sessions[device_id]
+        self._last_written.pop(session_id, None)
+
+    def flush(self):
+        """溜まっているサンプルをセッションごとに書き出し、書き込んだ件数を返す"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._size = self._pending, {}, 0
+            if not pending:
+                return 0
+
+            written = 0
+            with self.app.app_context():
+                for session_id, items in pending.items():
+                    try:
+                        written_id, count = self._write(session_id, items)
+                        db.session.commit()
+                    except Exception:
+                        db.session.rollback()
+                        logger.exception(
+                            "Failed to flush %d buffered samples for session %s",
+                            len(items),
+                            session_id,
+                        )
+                        self._retry_later(session_id, items)
+                        continue
+                    self._failures.pop(session_id, None)
+                    if count:
+                        self._last_written[written_id] = items[-1][1]
+                    written += count
+            return written
+
+    def stop(self):
+        """フラッシュスレッドを停止し、残りのサンプルを書き出す"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _session_ref(self, device_id, data):
+        now = time.monotonic()
+        with self._lock:
+            ref = self._sessions.get(device_id)
+            last_enqueued = self._last_enqueued.get(device_id, now)
+            self._last_enqueued[device_id] = now
+        if ref is not None and not (self.idle_timeout and now - last_enqueued > self.idle_timeout):
+            return ref
+        if ref is not None:
+            # アイドル後の最初のサンプル。DB側で終了判定と新規作成を行う
+            self.flush()
+
+        session = get_or_create_active_session(device_id, data)
+        db.session.commit()
+        ref = (session.id, session.start_time)
+        with self._lock:
+            self._sessions[device_id] = ref
+        return ref
+
+    def _write(self, session_id, items):
+        """1セッション分のサンプルを書き込み、(書き込んだセッションID, 件数)を返す
+
+        コミットは呼び出し側。
+        """
+        session = db.session.get(FitnessSession, session_id)
+        if session is None:
+            logger.warning(
+                "Dropping %d buffered samples for missing session %s",
+                len(items),
+                session_id,
+            )
+            return session_id, 0
+
+        if session.end_time is not None:
+            # 他のワーカーで終了済みの場合は、デバイスの現在のセッションに書き込む
+            device_id = session.device_id
+            session = get_or_create_active_session(device_id, items[0][0])
+            with self._lock:
+                self._sessions[device_id] = (session.id, session.start_time)
+
+        packets = [packet for packet, _ in items]
+        rows = [row for _, row in items]
+        rollups = RollupAccumulator()
+        # 直前のサンプルはこのプロセスで書き込んだ分を使い、覚えていない場合だけDBから読む
+        previous = self._last_written.get(session.id)
+        store_samples(session, packets, rows, rollups, previous)
+        rollups.apply()
+        return session.id, len(rows)
+
+    def _retry_later(self, session_id, items):
+        """失敗したセッションの分をキューの先頭に戻す（上限回数を超えたら破棄）"""
+        failures = self._failures.get(session_id, 0) + 1
+        if failures >= self.max_retries:
+            self._failures.pop(session_id, None)
+            logger.error(
+                "Discarding %d buffered samples for session %s after %d failed flushes: %s",
+                len(items),
+                session_id,
+                failures,
+                json.dumps([packet for packet, _ in items], default=str),
+            )
+            return
+
+        self._failures[session_id] = failures
+        with self._lock:
+            self._pending[session_id] = items + self._pending.get(session_id, [])
+            self._size += len(items)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            self.flush()
+
+
+def init_ingest(app):
+    """INGEST_MODEがbufferedの場合に書き込みバッファを起動"""
+    if app.config["INGEST_MODE"] == "buffered":
+        IngestBuffer(app)
@@ -0,0 +1,294 @@
+# app/services/live_state.py
+
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# DBから組み立てた結果（進行中のセッションが無い場合を含む）のキーに使う、デバイス省略時の値
+ANY_DEVICE = "*"
+
+
+class MemoryLiveStateBackend:
+    """プロセス内の辞書に保持するバックエンド（既定）"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._states = {}
+        self._fallbacks = {}  # key -> (期限, 値)
+        self._lock = threading.Lock()
+
+    def set(self, device_id, state):
+        with self._lock:
+            self._states[device_id] = state
+
+    def get(self, device_id):
+        with self._lock:
+            state = self._states.get(device_id)
+            if state is not None and self._expired(state):
+                del self._states[device_id]
+                return None
+            return state
+
+    def all(self):
+        with self._lock:
+            for device_id, state in list(self._states.items()):
+                if self._expired(state):
+                    del self._states[device_id]
+            return list(self._states.values())
+
+    def delete(self, device_id):
+        with self._lock:
+            self._states.pop(device_id, None)
+
+    def get_fallback(self, key):
+        """set_fallbackで保存した値を(見つかったか, 値)で返す"""
+        with self._lock:
+            entry = self._fallbacks.get(key)
+            if entry is None or entry[0] < time.time():
+                self._fallbacks.pop(key, None)
+                return False, None
+            return True, entry[1]
+
+    def set_fallback(self, key, value, ttl):
+        with self._lock:
+            self._fallbacks[key] = (time.time() + ttl, value)
+
+    def delete_fallback(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._fallbacks.pop(key, None)
+
+    def _expired(self, state):
+        return time.time() - state["updated_at"] > self.ttl
+
+
+class RedisLiveStateBackend:
+    """Redisに保持するバックエンド（複数のgunicornワーカーで状態を共有）"""
+
+    def __init__(self, url, ttl, prefix="fit2go:live:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError(
+                "LIVE_STATE_BACKEND=redis requires the 'redis' package"
+            ) from e
+
+        self.ttl = ttl
+        self.prefix = prefix
+        self.fallback_prefix = prefix + "fallback:"
+        self._redis = redis.Redis.from_url(url)
+
+    def set(self, device_id, state):
+        self._redis.setex(self.prefix + device_id, int(self.ttl), json.dumps(state))
+
+    def get(self, device_id):
+        value = self._redis.get(self.prefix + device_id)
+        return json.loads(value) if value else None
+
+    def all(self):
+        keys = [
+            key
+            for key in self._redis.scan_iter(match=self.prefix + "*")
+            if not key.decode().startswith(self.fallback_prefix)
+        ]
+        if not keys:
+            return []
+        return [json.loads(value) for value in self._redis.mget(keys) if value]
+
+    def delete(self, device_id):
+        self._redis.delete(self.prefix + device_id)
+
+    def get_fallback(self, key):
+        value = self._redis.get(self.fallback_prefix + key)
+        if value is None:
+            return False, None
+        return True, json.loads(value)["value"]
+
+    def set_fallback(self, key, value, ttl):
+        self._redis.setex(self.fallback_prefix + key, max(int(ttl), 1), json.dumps({"value": value}))
+
+    def delete_fallback(self, *keys):
+        self._redis.delete(*[self.fallback_prefix + key for key in keys])
+
+
+class LiveStateCache:
+    """デバイスごとの最新サンプルを保持するキャッシュ
+
+    receive_dataが書き込み、/api/sessions/current が読み出す。
+    最終更新からLIVE_STATE_STALE_SECONDSを超えた状態はstaleとして返し、
+    LIVE_STATE_TTL_SECONDSを超えた状態は破棄する。
+    キャッシュに無くDBから組み立てた結果（進行中のセッションが無いことも含む）は
+    LIVE_STATE_FALLBACK_TTL_SECONDSの間保持し、その間のポーリングはDBを読まない。
+    """
+
+    def __init__(self, backend, stale_after, fallback_ttl=0):
+        self.backend = backend
+        self.stale_after = stale_after
+        self.fallback_ttl = fallback_ttl
+
+    def update(self, device_id, session_id, start_time, data, row):
+        """受信したサンプルで状態を更新し、保存した状態を返す"""
+        state = {
+            "session_id": session_id,
+            "device_id": device_id,
+            "start_time": start_time.isoformat(),
+            "total_time_seconds": data.get("total_time_s", 0),
+            "total_distance_km": data.get("total_dist_km", 0.0),
+            "total_calories_kcal": data.get("total_cal_kcal", 0.0),
+            "current_speed_kmh": row["speed_kmh"],
+            "current_rpm": row["rpm"],
+            "current_mets": row["mets"],
+            "session_time_s": row["time_seconds"],
+            "session_dist_km": row["distance_km"],
+            "session_cal_kcal": row["calories_kcal"],
+            "updated_at": time.time(),
+        }
+        self.backend.set(device_id, state)
+        if self.fallback_ttl:
+            self.backend.delete_fallback(device_id, ANY_DEVICE)
+        return state
+
+    def get(self, device_id=None):
+        """デバイス（省略時は最後に更新されたデバイス）の状態を返す"""
+        if device_id is not None:
+            state = self.backend.get(device_id)
+        else:
+            states = self.backend.all()
+            state = max(states, key=lambda s: s["updated_at"]) if states else None
+
+        if state is None:
+            return None
+        state = dict(state)
+        state["stale"] = time.time() - state["updated_at"] > self.stale_after
+        return state
+
+    def last_sample(self, device_id, session_id):
+        """セッションで最後に受信したサンプルの累積値（無ければNone）
+
+        ロールアップの増分の計算に使う。キーはlatest_point_valuesと同じ。
+        """
+        state = self.backend.get(device_id)
+        if state is None or state["session_id"] != session_id:
+            return None
+        return {
+            "time_seconds": state["session_time_s"],
+            "distance_km": state["session_dist_km"],
+            "calories_kcal": state["session_cal_kcal"],
+        }
+
+    def get_fallback(self, device_id=None):
+        """DBから組み立てた結果を(見つかったか, 状態)で返す"""
+        if not self.fallback_ttl:
+            return False, None
+        return self.backend.get_fallback(device_id or ANY_DEVICE)
+
+    def set_fallback(self, device_id, state):
+        if self.fallback_ttl:
+            self.backend.set_fallback(device_id or ANY_DEVICE, state, self.fallback_ttl)
+
+    def discard_session(self, session_id):
+        """終了したセッションの状態を削除"""
+        for state in self.backend.all():
+            if state["session_id"] == session_id:
+                self.backend.delete(state["device_id"])
+                if self.fallback_ttl:
+                    self.backend.delete_fallback(state["device_id"], ANY_DEVICE)
+
+
+def init_live_state(app):
+    """LIVE_STATE_BACKENDに応じてキャッシュを初期化"""
+    ttl = app.config["LIVE_STATE_TTL_SECONDS"]
+    if app.config["LIVE_STATE_BACKEND"] == "redis":
+        backend = RedisLiveStateBackend(app.config["LIVE_STATE_REDIS_URL"], ttl)
+    else:
+        backend = MemoryLiveStateBackend(ttl)
+        # gunicornはWEB_CONCURRENCYをワーカー数の既定値に使う
+        if int(os.environ.get("WEB_CONCURRENCY", 1) or 1) > 1:
+            logger.warning(
+                "LIVE_STATE_BACKEND=memory is per worker; with %s workers, polls on "
+                "workers that did not receive the sample fall back to the database. "
+                "Use LIVE_STATE_BACKEND=redis to share the live state.",
+                os.environ["WEB_CONCURRENCY"],
+            )
+    app.extensions["live_state"] = LiveStateCache(
+        backend,
+        app.config["LIVE_STATE_STALE_SECONDS"],
+        app.config["LIVE_STATE_FALLBACK_TTL_SECONDS"],
+    )
+
+
+def get_live_state():
+    """現在のアプリのライブ状態キャッシュを取得"""
+    return current_app.extensions["live_state"]
+
+
+def load_current_state(device_id=None):
+    """キャッシュから現在のセッション状態を取得（無ければDBから組み立てる）
+
+    DBから組み立てた結果は、セッションが無い場合も含めて短時間キャッシュする。
+    """
+    from .sessions import get_active_session
+
+    cache = get_live_state()
+    state = cache.get(device_id)
+    if state is not None:
+        return state
+
+    found, state = cache.get_fallback(device_id)
+    if found:
+        return state
+
+    session = get_active_session(device_id)
+    state = _state_from_db(session) if session else None
+    cache.set_fallback(device_id, state)
+    return state
+
+
+def load_active_states():
+    """進行中のセッションすべての状態をデバイスID順で取得（複数台のグリッド表示用）"""
+    from .sessions import list_active_sessions
+
+    cache = get_live_state()
+    states = []
+    for session in list_active_sessions():
+        state = cache.get(session.device_id)
+        if state is None or state["session_id"] != session.id:
+            state = _state_from_db(session)
+        states.append(state)
+    return states
+
+
+def _state_from_db(session):
+    """キャッシュに無いセッションの状態を最新のデータポイントから組み立てる"""
+    from ..models import DataPoint
+
+    # 最新のデータポイントを取得
+    latest_point = (
+        DataPoint.query.filter_by(session_id=session.id)
+        .order_by(DataPoint.timestamp.desc())
+        .first()
+    )
+
+    return {
+        "session_id": session.id,
+        "device_id": session.device_id,
+        "start_time": session.start_time.isoformat(),
+        "total_time_seconds": session.total_time_seconds,
+        "total_distance_km": session.total_distance_km,
+        "total_calories_kcal": session.total_calories_kcal,
+        "current_speed_kmh": latest_point.speed_kmh if latest_point else 0,
+        "current_rpm": latest_point.rpm if latest_point else 0,
+        "current_mets": latest_point.mets if latest_point else 0,
+        # セッションの現在の値を追加
+        "session_time_s": latest_point.time_seconds if latest_point else 0,
+        "session_dist_km": latest_point.distance_km if latest_point else 0,
+        "session_cal_kcal": latest_point.calories_kcal if latest_point else 0,
+        "updated_at": None,
+        "stale": True,
+    }
@@ -0,0 +1,365 @@
+# app/services/point_archive.py
+
+import logging
+import struct
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+
+from ..models import DataPoint, FitnessSession, SessionArchive, db
+from .bulk_import import POINT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# ヘッダー: マジック, バージョン, ポイント数
+MAGIC = b"F2GA"
+VERSION = 1
+HEADER = struct.Struct("<4sBI")
+
+FLOAT_FIELDS = ("speed_kmh", "rpm", "distance_km", "calories_kcal", "mets")
+# time_secondsのNULLを表す値
+INT_NULL = np.iinfo(np.int32).min
+# float32の有効桁数。復元時にこの桁で丸めて20.100000381のような値を返さない
+FLOAT32_DIGITS = 7
+
+
+class ArchiveError(ValueError):
+    """アーカイブの形式が不正"""
+
+
+def encode_points(rows):
+    """データポイント（POINT_FIELDS順のタプル）を列形式に圧縮する
+
+    timestampはマイクロ秒、time_secondsは秒の差分（int64）、実数はfloat32（NULLはNaN）
+    で列ごとに並べ、全体をzlibで圧縮する。1秒間隔のサンプルでは差分がほぼ一定になり、
+    圧縮後はほとんど場所を取らない。
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(POINT_FIELDS)
+    values = dict(zip(POINT_FIELDS, columns))
+
+    timestamps = np.array(values["timestamp"], dtype="datetime64[us]").astype(np.int64)
+    parts = [np.diff(timestamps, prepend=np.int64(0)).tobytes()]
+    for field in FLOAT_FIELDS:
+        column = [np.nan if value is None else value for value in values[field]]
+        parts.append(np.array(column, dtype=np.float32).tobytes())
+    seconds = [INT_NULL if value is None else value for value in values["time_seconds"]]
+    parts.append(np.diff(np.array(seconds, dtype=np.int64), prepend=np.int64(0)).tobytes())
+
+    return HEADER.pack(MAGIC, VERSION, len(timestamps)) + zlib.compress(b"".join(parts))
+
+
+def decode_points(blob):
+    """encode_pointsの逆。フィールド名 -> NumPy配列の辞書を返す
+
+    timestampはdatetime64[us]、実数はfloat64（NULLはNaN）、time_secondsはint64（NULLはINT_NULL）。
+    """
+    if len(blob) < HEADER.size:
+        raise ArchiveError("archive is truncated")
+    magic, version, count = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION:
+        raise ArchiveError("unsupported archive format")
+
+    body = zlib.decompress(blob[HEADER.size :])
+    expected = count * (8 + 4 * len(FLOAT_FIELDS) + 8)
+    if len(body) != expected:
+        raise ArchiveError("archive size does not match point count")
+
+    columns = {}
+    offset = count * 8
+    columns["timestamp"] = np.cumsum(np.frombuffer(body, np.int64, count)).astype(
+        "datetime64[us]"
+    )
+    for field in FLOAT_FIELDS:
+        column = np.frombuffer(body, np.float32, count, offset).astype(np.float64)
+        columns[field] = _round_float32(column)
+        offset += count * 4
+    columns["time_seconds"] = np.cumsum(np.frombuffer(body, np.int64, count, offset))
+    return columns
+
+
+def _float32_decimals(column):
+    """_round_float32で丸める小数点以下の桁数（有限値が無ければNone）"""
+    finite = column[np.isfinite(column)]
+    if not finite.size:
+        return None
+    magnitude = int(np.floor(np.log10(max(np.abs(finite).max(), 1.0)))) + 1
+    return max(FLOAT32_DIGITS - magnitude, 0)
+
+
+def _round_float32(column):
+    decimals = _float32_decimals(column)
+    return column if decimals is None else np.round(column, decimals)
+
+
+def columns_to_tuples(columns, fields=POINT_FIELDS):
+    """decode_pointsの結果をPythonの値のタプル（fields順）のリストに変換"""
+    converted = []
+    for field in fields:
+        column = columns[field]
+        if field == "timestamp":
+            converted.append(column.tolist())
+        elif field == "time_seconds":
+            converted.append([None if value == INT_NULL else value for value in column.tolist()])
+        else:
+            converted.append([None if value != value else value for value in column.tolist()])
+    return list(zip(*converted))
+
+
+def _archive_blob(session_id):
+    """圧縮済みのセッションならアーカイブのデータ、そうでなければNone"""
+    return db.session.execute(
+        select(SessionArchive.data).where(SessionArchive.session_id == session_id)
+    ).scalar()
+
+
+def _query_points(session_id, fields):
+    return db.session.execute(
+        select(*[getattr(DataPoint, field) for field in fields])
+        .where(DataPoint.session_id == session_id)
+        .order_by(DataPoint.timestamp, DataPoint.id)
+    ).all()
+
+
+def load_points(session_id, fields=POINT_FIELDS):
+    """セッションのデータポイントを時刻順にタプル（fields順）のリストで返す
+
+    圧縮済みのセッションはアーカイブ1行から復元し、それ以外はdata_pointsから読み出す。
+    """
+    blob = _archive_blob(session_id)
+    if blob is not None:
+        return columns_to_tuples(decode_points(blob), fields)
+    return _query_points(session_id, fields)
+
+
+def load_point_columns(session_id, fields=POINT_FIELDS):
+    """load_pointsと同じ順のデータポイントをフィールド名 -> NumPy配列の辞書で返す
+
+    配列の型とNULLの表し方はdecode_pointsと同じ。
+    """
+    blob = _archive_blob(session_id)
+    if blob is not None:
+        columns = decode_points(blob)
+        return {field: columns[field] for field in fields}
+    return _rows_to_columns(_query_points(session_id, fields), fields)
+
+
+def _rows_to_columns(rows, fields):
+    """タプルの行をdecode_pointsと同じ形式の列（NumPy配列）に変換"""
+    values = list(zip(*rows)) if rows else [()] * len(fields)
+    columns = {}
+    for field, column in zip(fields, values):
+        if field == "timestamp":
+            columns[field] = np.array(column, dtype="datetime64[us]")
+        elif field == "time_seconds":
+            columns[field] = np.array(
+                [INT_NULL if value is None else value for value in column], dtype=np.int64
+            )
+        else:
+            columns[field] = np.array(
+                [np.nan if value is None else value for value in column], dtype=np.float64
+            )
+    return columns
+
+
+def _cut_page(rows, limit, load_tied):
+    """limit+1行からページを切り出し、(ページ, 次のカーソル)を返す
+
+    カーソルは時刻なので、同じ時刻の行はページをまたがせない。
+    1ページ分すべてが同じ時刻の場合だけ、その時刻の行をload_tiedでまとめて返す。
+    """
+    if len(rows) <= limit:
+        return rows, None
+    boundary = rows[limit][0]
+    page = rows[:limit]
+    while page and page[-1][0] == boundary:
+        page.pop()
+    if not page:
+        page = load_tied(boundary)
+    return page, page[-1][0]
+
+
+def load_points_page(session_id, fields=POINT_FIELDS, after_ts=None, limit=1000):
+    """after_tsより後のデータポイントを時刻順に最大limit件返す（キーセットページング）
+
+    fieldsの先頭はtimestampであること。(タプルのリスト, 次ページのafter_ts)を返し、
+    最後のページでは次のafter_tsがNoneになる。
+    """
+    blob = _archive_blob(session_id)
+    if blob is not None:
+        columns = decode_points(blob)
+        timestamps = columns["timestamp"]
+        start = 0
+        if after_ts is not None:
+            start = int(np.searchsorted(timestamps, np.datetime64(after_ts, "us"), "right"))
+
+        def archived_slice(selector):
+            return columns_to_tuples(
+                {field: columns[field][selector] for field in fields}, fields
+            )
+
+        def archived_tied(boundary):
+            return archived_slice(timestamps == np.datetime64(boundary, "us"))
+
+        return _cut_page(archived_slice(slice(start, start + limit + 1)), limit, archived_tied)
+
+    statement = select(*[getattr(DataPoint, field) for field in fields]).where(
+        DataPoint.session_id == session_id
+    )
+
+    def tied(boundary):
+        return db.session.execute(
+            statement.where(DataPoint.timestamp == boundary).order_by(DataPoint.id)
+        ).all()
+
+    if after_ts is not None:
+        statement = statement.where(DataPoint.timestamp > after_ts)
+    rows = db.session.execute(
+        statement.order_by(DataPoint.timestamp, DataPoint.id).limit(limit + 1)
+    ).all()
+    return _cut_page(rows, limit, tied)
+
+
+def iter_archives_between(start, end, device_id=None):
+    """[start, end)と期間が重なる圧縮済みセッションの(セッションID, デバイスID, 復元した列)を返す"""
+    statement = (
+        select(FitnessSession.id, FitnessSession.device_id, SessionArchive.data)
+        .join(SessionArchive, SessionArchive.session_id == FitnessSession.id)
+        .where(FitnessSession.start_time < end, FitnessSession.end_time >= start)
+        .order_by(FitnessSession.id)
+    )
+    if device_id:
+        statement = statement.where(FitnessSession.device_id == device_id)
+    for session_id, session_device_id, blob in db.session.execute(
+        statement.execution_options(yield_per=50)
+    ):
+        yield session_id, session_device_id, decode_points(blob)
+
+
+def archived_interval_totals(start, end, interval_minutes, device_id=None):
+    """圧縮済みセッションの[start, end)のポイントをinterval_minutes分ごとに集計する
+
+    バケット番号（startからの経過分 // interval_minutes）-> 合計値の辞書を返す。
+    """
+    origin = np.datetime64(start, "us")
+    totals = {}
+    for _, _, columns in iter_archives_between(start, end, device_id):
+        timestamps = columns["timestamp"]
+        mask = (timestamps >= origin) & (timestamps < np.datetime64(end, "us"))
+        if not mask.any():
+            continue
+        buckets = ((timestamps[mask] - origin) // np.timedelta64(interval_minutes, "m")).astype(
+            np.int64
+        )
+        counts = np.bincount(buckets)
+        sums = {
+            name: np.bincount(buckets, weights=np.nan_to_num(columns[field][mask]))
+            for name, field in (
+                ("speed_sum", "speed_kmh"),
+                ("rpm_sum", "rpm"),
+                ("total_distance", "distance_km"),
+                ("total_calories", "calories_kcal"),
+            )
+        }
+        for bucket in np.flatnonzero(counts):
+            values = totals.setdefault(
+                int(bucket), {**dict.fromkeys(sums, 0.0), "point_count": 0}
+            )
+            values["point_count"] += int(counts[bucket])
+            for name, column in sums.items():
+                values[name] += float(column[bucket])
+    return totals
+
+
+def _verify_round_trip(session_id, blob, rows):
+    """アーカイブを復元し、元の行と一致するか確かめる（一致しなければArchiveError）
+
+    timestampとtime_secondsは完全一致、実数はfloat32の精度の範囲で比較する。
+    """
+    decoded = decode_points(blob)
+    original = _rows_to_columns(rows, POINT_FIELDS)
+    if len(decoded["timestamp"]) != len(rows):
+        raise ArchiveError(f"archive of session {session_id} has the wrong point count")
+
+    for field in ("timestamp", "time_seconds"):
+        if not np.array_equal(decoded[field], original[field]):
+            raise ArchiveError(f"archive of session {session_id} changes {field}")
+    for field in FLOAT_FIELDS:
+        expected = original[field]
+        # float32への変換の誤差と、復元時の丸め（最大で最下位の桁の半分）まで許容する
+        decimals = _float32_decimals(expected.astype(np.float32).astype(np.float64))
+        atol = 0.0 if decimals is None else 0.5 * 10.0**-decimals
+        if not np.allclose(
+            decoded[field],
+            expected,
+            rtol=np.finfo(np.float32).eps,
+            atol=atol,
+            equal_nan=True,
+        ):
+            raise ArchiveError(f"archive of session {session_id} changes {field}")
+
+
+def compact_session(session_id):
+    """終了したセッションのデータポイントをアーカイブに移す（コミットは呼び出し側）
+
+    圧縮したデータを復元して全ての値が元の行と一致することを確かめてから
+    data_pointsの行を削除する。
+    移したポイント数を返す。
+    """
+    rows = db.session.execute(
+        select(*[getattr(DataPoint, field) for field in POINT_FIELDS])
+        .where(DataPoint.session_id == session_id)
+        .order_by(DataPoint.timestamp, DataPoint.id)
+    ).all()
+    if not rows:
+        return 0
+
+    blob = encode_points(rows)
+    _verify_round_trip(session_id, blob, rows)
+
+    db.session.execute(
+        insert(SessionArchive).values(
+            session_id=session_id,
+            point_count=len(rows),
+            data=blob,
+            created_at=datetime.utcnow(),
+        )
+    )
+    db.session.execute(delete(DataPoint).where(DataPoint.session_id == session_id))
+    return len(rows)
+
+
+def compact_sessions(older_than_hours, limit=None, now=None):
+    """終了からolder_than_hours時間以上経ったセッションを1件ずつ圧縮してコミットする
+
+    (圧縮したセッション数, ポイント数)を返す。
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=older_than_hours)
+    statement = (
+        select(FitnessSession.id)
+        .where(FitnessSession.end_time.isnot(None), FitnessSession.end_time < cutoff)
+        .where(
+            ~select(SessionArchive.session_id)
+            .where(SessionArchive.session_id == FitnessSession.id)
+            .exists()
+        )
+        .where(select(DataPoint.id).where(DataPoint.session_id == FitnessSession.id).exists())
+        .order_by(FitnessSession.id)
+    )
+    if limit:
+        statement = statement.limit(limit)
+    session_ids = db.session.execute(statement).scalars().all()
+
+    sessions = points = 0
+    for session_id in session_ids:
+        try:
+            count = compact_session(session_id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception("Failed to compact session %s", session_id)
+            continue
+        sessions += 1
+        points += count
+    return sessions, points
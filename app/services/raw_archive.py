@@ -0,0 +1,69 @@
+# app/services/raw_archive.py
+
+import json
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert
+
+from ..models import RawPacket, db
+
+# セッションID -> raw_dataを最後に書き込んだ時刻（monotonic）
+_summary_written = {}
+_summary_lock = threading.Lock()
+
+
+def summary_due(session_id, interval):
+    """セッションのraw_data（最後のパケット）を書き込む時期ならTrue
+
+    最後の書き込みからinterval秒経つまではFalseを返し、セッション行の
+    JSON列を毎秒書き換えないようにする（時刻はプロセスごとに管理）。
+    """
+    now = time.monotonic()
+    with _summary_lock:
+        last = _summary_written.get(session_id)
+        if last is not None and now - last < interval:
+            return False
+        _summary_written[session_id] = now
+        return True
+
+
+def forget_session(session_id):
+    with _summary_lock:
+        _summary_written.pop(session_id, None)
+
+
+def archive_packets(session, packets):
+    """パケットを圧縮してアーカイブに追記（コミットは呼び出し側で行う）"""
+    payload = json.dumps(packets, separators=(",", ":")).encode()
+    db.session.execute(
+        insert(RawPacket).values(
+            session_id=session.id,
+            device_id=session.device_id,
+            received_at=datetime.utcnow(),
+            packet_count=len(packets),
+            data=zlib.compress(payload),
+        )
+    )
+
+
+def iter_raw_packets(session_id, batch_size=500):
+    """セッションのアーカイブ済みパケットを受信順に返す"""
+    rows = db.session.execute(
+        db.select(RawPacket.data)
+        .where(RawPacket.session_id == session_id)
+        .order_by(RawPacket.id)
+        .execution_options(yield_per=batch_size)
+    ).scalars()
+    for data in rows:
+        yield from json.loads(zlib.decompress(data))
+
+
+def purge_raw_packets(retention_days, now=None):
+    """保存期間を過ぎたアーカイブを削除してコミットし、削除した行数を返す"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    result = db.session.execute(delete(RawPacket).where(RawPacket.received_at < cutoff))
+    db.session.commit()
+    return result.rowcount
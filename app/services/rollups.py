@@ -0,0 +1,266 @@
+# app/services/rollups.py
+
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import delete, func, select
+
+from ..models import DailyRollup, DataPoint, FitnessSession, HourlyRollup, SessionArchive, db
+
+# 1サンプルごとに加算する列
+SUM_COLUMNS = (
+    "total_time_seconds",
+    "total_distance_km",
+    "total_calories_kcal",
+    "speed_sum",
+    "rpm_sum",
+    "mets_sum",
+    "sample_count",
+)
+
+GRANULARITIES = {
+    "hour": (HourlyRollup, lambda ts: ts.replace(minute=0, second=0, microsecond=0)),
+    "day": (DailyRollup, lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0)),
+}
+
+
+def _delta(current, previous):
+    """累積値の増分（カウンタがリセットされた場合は現在値）"""
+    current = current or 0
+    if previous is None:
+        return current
+    delta = current - previous
+    return delta if delta >= 0 else current
+
+
+class RollupAccumulator:
+    """サンプルの増分を(粒度, デバイス, バケット)ごとに集計し、まとめて加算する"""
+
+    def __init__(self):
+        self.buckets = {}
+
+    def add(self, device_id, row, previous=None):
+        """1サンプルを加える
+
+        previousは同じセッションの直前のサンプル（time_seconds, distance_km,
+        calories_kcal）。Noneの場合はセッションの先頭として扱う。
+        """
+        previous = previous or {}
+        increments = {
+            "total_time_seconds": int(
+                _delta(row["time_seconds"], previous.get("time_seconds"))
+            ),
+            "total_distance_km": _delta(row["distance_km"], previous.get("distance_km")),
+            "total_calories_kcal": _delta(
+                row["calories_kcal"], previous.get("calories_kcal")
+            ),
+            "speed_sum": row["speed_kmh"] or 0.0,
+            "rpm_sum": row["rpm"] or 0.0,
+            "mets_sum": row["mets"] or 0.0,
+            "sample_count": 1,
+        }
+        self._add_increments(device_id, row["timestamp"], increments)
+
+    def add_session_totals(self, device_id, timestamp, time_seconds, distance_km, calories_kcal):
+        """データポイントの無いセッションの合計を開始時刻のバケットに加える"""
+        self._add_increments(
+            device_id,
+            timestamp,
+            {
+                "total_time_seconds": int(time_seconds or 0),
+                "total_distance_km": distance_km or 0.0,
+                "total_calories_kcal": calories_kcal or 0.0,
+            },
+        )
+
+    def _add_increments(self, device_id, timestamp, increments):
+        for model, truncate in GRANULARITIES.values():
+            key = (model, device_id, truncate(timestamp))
+            bucket = self.buckets.setdefault(key, dict.fromkeys(SUM_COLUMNS, 0))
+            for column, value in increments.items():
+                bucket[column] += value
+
+    def add_samples(self, device_id, rows, previous=None):
+        """同じセッションの連続したサンプルを加える"""
+        for row in rows:
+            self.add(device_id, row, previous)
+            previous = row
+
+    def apply(self):
+        """集計した増分をロールアップテーブルに加算（コミットは呼び出し側）"""
+        by_model = {}
+        for (model, device_id, bucket_start), values in self.buckets.items():
+            by_model.setdefault(model, []).append(
+                dict(values, device_id=device_id, bucket_start=bucket_start)
+            )
+        for model, rows in by_model.items():
+            _upsert_add(model, rows)
+        self.buckets = {}
+
+
+def _upsert_add(model, rows):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        _upsert_add_fallback(model, rows)
+        return
+
+    statement = insert(model).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=["device_id", "bucket_start"],
+        set_={
+            column: getattr(model.__table__.c, column) + statement.excluded[column]
+            for column in SUM_COLUMNS
+        },
+    )
+    db.session.execute(statement)
+
+
+def _upsert_add_fallback(model, rows):
+    for values in rows:
+        rollup = model.query.filter_by(
+            device_id=values["device_id"], bucket_start=values["bucket_start"]
+        ).first()
+        if rollup is None:
+            db.session.add(model(**values))
+            continue
+        for column in SUM_COLUMNS:
+            setattr(rollup, column, getattr(rollup, column) + values[column])
+
+
+def latest_point_values(session_id):
+    """セッションの最新のデータポイントの累積値を取得（無ければNone）"""
+    row = db.session.execute(
+        select(DataPoint.time_seconds, DataPoint.distance_km, DataPoint.calories_kcal)
+        .where(DataPoint.session_id == session_id)
+        .order_by(DataPoint.timestamp.desc())
+        .limit(1)
+    ).first()
+    return dict(row._mapping) if row else None
+
+
+def rebuild_rollups(start_date, end_date):
+    """指定期間（両端の日を含む）のロールアップをデータポイントから作り直す
+
+    圧縮済みのセッション（services/point_archive.py）も含める。データポイントの無い
+    セッションは、取り込み時と同じくセッションの合計を開始時刻のバケットに加える。
+    """
+    start = datetime.combine(start_date, time.min)
+    end = datetime.combine(end_date + timedelta(days=1), time.min)
+
+    for model, _ in GRANULARITIES.values():
+        db.session.execute(
+            delete(model).where(model.bucket_start >= start, model.bucket_start < end)
+        )
+
+    # 期間外の直前のポイントとの差分も取れるよう、対象セッション全体でLAGを計算する
+    session_ids = (
+        select(DataPoint.session_id)
+        .where(DataPoint.timestamp >= start, DataPoint.timestamp < end)
+        .distinct()
+    )
+    window = {
+        "partition_by": DataPoint.session_id,
+        "order_by": (DataPoint.timestamp, DataPoint.id),
+    }
+    lagged = (
+        select(
+            FitnessSession.device_id,
+            DataPoint.timestamp,
+            DataPoint.speed_kmh,
+            DataPoint.rpm,
+            DataPoint.mets,
+            DataPoint.time_seconds,
+            DataPoint.distance_km,
+            DataPoint.calories_kcal,
+            func.row_number().over(**window).label("position"),
+            func.lag(DataPoint.time_seconds).over(**window).label("prev_time_seconds"),
+            func.lag(DataPoint.distance_km).over(**window).label("prev_distance_km"),
+            func.lag(DataPoint.calories_kcal).over(**window).label("prev_calories_kcal"),
+        )
+        .join(FitnessSession, DataPoint.session_id == FitnessSession.id)
+        .where(DataPoint.session_id.in_(session_ids))
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(lagged)
+        .where(lagged.c.timestamp >= start, lagged.c.timestamp < end)
+        .execution_options(yield_per=5000)
+    )
+
+    accumulator = RollupAccumulator()
+    count = 0
+    for row in rows:
+        values = row._mapping
+        previous = None
+        if values["position"] > 1:
+            previous = {
+                "time_seconds": values["prev_time_seconds"],
+                "distance_km": values["prev_distance_km"],
+                "calories_kcal": values["prev_calories_kcal"],
+            }
+        accumulator.add(values["device_id"], values, previous)
+        count += 1
+
+    # 圧縮済みのセッションはアーカイブから復元して同じように加算する
+    from .bulk_import import POINT_FIELDS
+    from .point_archive import columns_to_tuples, iter_archives_between
+
+    for _, device_id, columns in iter_archives_between(start, end):
+        previous = None
+        for point in columns_to_tuples(columns):
+            values = dict(zip(POINT_FIELDS, point))
+            if start <= values["timestamp"] < end:
+                accumulator.add(device_id, values, previous)
+                count += 1
+            previous = values
+
+    pointless = db.session.execute(
+        select(FitnessSession).where(
+            FitnessSession.start_time >= start,
+            FitnessSession.start_time < end,
+            ~select(DataPoint.id).where(DataPoint.session_id == FitnessSession.id).exists(),
+            ~select(SessionArchive.session_id)
+            .where(SessionArchive.session_id == FitnessSession.id)
+            .exists(),
+        )
+    ).scalars()
+    for session in pointless:
+        accumulator.add_session_totals(
+            session.device_id,
+            session.start_time,
+            session.total_time_seconds,
+            session.total_distance_km,
+            session.total_calories_kcal,
+        )
+
+    accumulator.apply()
+    db.session.commit()
+    return count
+
+
+def query_rollups(granularity, start, end, device_id=None):
+    """[start, end) のロールアップをバケット順に取得"""
+    model, _ = GRANULARITIES[granularity]
+    query = model.query.filter(model.bucket_start >= start, model.bucket_start < end)
+    if device_id:
+        query = query.filter(model.device_id == device_id)
+    return query.order_by(model.bucket_start, model.device_id).all()
+
+
+def sum_rollups(start=None, end=None, device_id=None):
+    """日次ロールアップから時間・距離・カロリーの合計を取得"""
+    query = db.session.query(
+        func.sum(DailyRollup.total_time_seconds).label("total_time"),
+        func.sum(DailyRollup.total_distance_km).label("total_distance"),
+        func.sum(DailyRollup.total_calories_kcal).label("total_calories"),
+    )
+    if start is not None:
+        query = query.filter(DailyRollup.bucket_start >= start)
+    if end is not None:
+        query = query.filter(DailyRollup.bucket_start < end)
+    if device_id:
+        query = query.filter(DailyRollup.device_id == device_id)
+    return query.first()
@@ -0,0 +1,57 @@
+# app/services/series.py
+
+from functools import lru_cache
+
+import numpy as np
+
+from .downsample import downsample_indices
+from .point_archive import FLOAT_FIELDS, load_point_columns
+
+# /api/sessions/<id>/series で指定できる指標
+SERIES_METRICS = FLOAT_FIELDS
+SERIES_MODES = ("lttb", "minmax")
+# pointsの上限
+MAX_SERIES_POINTS = 5000
+# 終了したセッションの系列をプロセス内に保持する数
+SERIES_CACHE_SIZE = 256
+
+
+def build_series(session_id, metric, points, mode="lttb"):
+    """セッションのmetricを最大points点に間引いた系列を返す
+
+    データポイントをNumPy配列のまま読み出し、downsample_indicesで
+    形を保ったまま間引く（lttbまたはminmax）。NULLの値はNoneで返す。
+    """
+    columns = load_point_columns(session_id, ("timestamp", metric))
+    timestamps = columns["timestamp"]
+    values = columns[metric]
+    total = len(timestamps)
+
+    if total > points:
+        x = timestamps.astype(np.int64) / 1e6
+        indices = downsample_indices(x, np.nan_to_num(values), points, mode)
+        timestamps = timestamps[indices]
+        values = values[indices]
+
+    return {
+        "metric": metric,
+        "mode": mode,
+        "total_points": total,
+        "timestamps": [timestamp.isoformat() for timestamp in timestamps.tolist()],
+        "values": [None if value != value else value for value in values.tolist()],
+    }
+
+
+@lru_cache(maxsize=SERIES_CACHE_SIZE)
+def _cached_series(session_id, metric, points, mode):
+    return build_series(session_id, metric, points, mode)
+
+
+def session_series(session, metric, points, mode="lttb"):
+    """build_seriesの結果。終了したセッションは(セッション, 指標, 点数, mode)ごとにキャッシュする
+
+    戻り値はキャッシュと共有するため、呼び出し側で変更しないこと。
+    """
+    if session.end_time is None:
+        return build_series(session.id, metric, points, mode)
+    return _cached_series(session.id, metric, points, mode)
@@ -0,0 +1,340 @@
+# app/services/sessions.py
+
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, inspect, select, update
+
+from ..models import DataPoint, FitnessSession, db
+from ..models.fitness_data import STATS_METRICS
+
+logger = logging.getLogger(__name__)
+
+# 移動時間に数えるサンプル間隔の上限（秒）。これより空いた区間は受信の途切れとみなす
+MAX_MOVING_GAP_SECONDS = 10
+
+
+def active_sessions_query(device_id=None):
+    """進行中（end_timeがNULL）のセッションのクエリ
+
+    WHERE end_time IS NULLはix_fitness_sessions_active_device_id（部分インデックス）
+    に一致するため、過去のセッションがいくら増えても進行中の行だけを読む。
+    同じデバイスに複数ある場合に結果が一定になるよう、開始が新しい順に並べる。
+    """
+    query = FitnessSession.query.filter(FitnessSession.end_time.is_(None))
+    if device_id is not None:
+        query = query.filter(FitnessSession.device_id == device_id)
+    return query.order_by(FitnessSession.start_time.desc(), FitnessSession.id.desc())
+
+
+def get_active_session(device_id=None):
+    """デバイス（省略時は全デバイスで最も新しい）の進行中セッションを取得"""
+    return active_sessions_query(device_id).first()
+
+
+def list_active_sessions():
+    """進行中のセッションをデバイスごとに1件ずつ、デバイスID順で取得"""
+    sessions = {}
+    for session in active_sessions_query():
+        sessions.setdefault(session.device_id, session)
+    return [sessions[device_id] for device_id in sorted(sessions)]
+
+
+def is_idle(session, timeout, now=None):
+    """最後の受信（無ければ開始時刻）からtimeout秒を超えているか"""
+    if not timeout:
+        return False
+    last_seen = session.last_seen_at or session.start_time
+    return last_seen < (now or datetime.utcnow()) - timedelta(seconds=timeout)
+
+
+def find_idle_sessions(timeout, now=None):
+    """最後の受信からtimeout秒を超えた進行中のセッションを取得"""
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=timeout)
+    last_seen = func.coalesce(FitnessSession.last_seen_at, FitnessSession.start_time)
+    return active_sessions_query().filter(last_seen < cutoff).all()
+
+
+def _summarize_samples(rows, last_at, moving_speed_kmh):
+    """サンプルの件数・合計・二乗和・最小・最大・移動時間・最後の時刻を求める
+
+    last_atは直前に集計したサンプルの時刻（最初のサンプルの移動時間に使う）。
+    """
+    summary = {
+        "count": len(rows),
+        "moving": 0.0,
+        "last_at": None,
+        "metrics": {metric: [0.0, 0.0, None, None] for metric in STATS_METRICS},
+    }
+    for row in rows:
+        for metric, column in STATS_METRICS.items():
+            value = row[column] or 0.0
+            entry = summary["metrics"][metric]
+            entry[0] += value
+            entry[1] += value * value
+            if entry[2] is None or value < entry[2]:
+                entry[2] = value
+            if entry[3] is None or value > entry[3]:
+                entry[3] = value
+
+        timestamp = row["timestamp"]
+        if last_at is not None and (row["speed_kmh"] or 0.0) >= moving_speed_kmh:
+            gap = (timestamp - last_at).total_seconds()
+            if 0 < gap <= MAX_MOVING_GAP_SECONDS:
+                summary["moving"] += gap
+        if last_at is None or timestamp > last_at:
+            last_at = timestamp
+        if summary["last_at"] is None or timestamp > summary["last_at"]:
+            summary["last_at"] = timestamp
+    return summary
+
+
+def _least(column, value):
+    return case((column.is_(None), value), (column > value, value), else_=column)
+
+
+def _greatest(column, value):
+    return case((column.is_(None), value), (column < value, value), else_=column)
+
+
+def update_running_stats(session, rows, moving_speed_kmh):
+    """サンプルをセッションの集計値（件数・合計・二乗和・最小・最大・移動時間）に加える
+
+    1サンプルあたりO(1)で、平均値はsum / countとして毎回更新する。
+    rowsは時刻順のDataPointの列値（point_valuesの戻り値）。コミットは呼び出し側。
+
+    保存済みのセッションには col = col + 増分 のUPDATEで加算するため、複数の
+    ワーカーやフラッシュが同じセッションを同時に更新してもサンプルを取りこぼさない
+    （ロールアップのupsertと同じ考え方）。最小・最大はCASEで比較する。
+    """
+    if not rows:
+        return
+    summary = _summarize_samples(rows, session.last_sample_at, moving_speed_kmh)
+
+    if inspect(session).persistent:
+        _increment_running_stats(session, summary)
+        return
+
+    # まだINSERTしていない（一括取り込み中の）セッションはオブジェクト上で加算する
+    count = (session.sample_count or 0) + summary["count"]
+    session.sample_count = count
+    session.moving_time_seconds = (session.moving_time_seconds or 0.0) + summary["moving"]
+    if session.last_sample_at is None or summary["last_at"] > session.last_sample_at:
+        session.last_sample_at = summary["last_at"]
+    for metric, (total, squares, minimum, maximum) in summary["metrics"].items():
+        total += getattr(session, f"{metric}_sum") or 0.0
+        setattr(session, f"{metric}_sum", total)
+        setattr(
+            session, f"{metric}_sq_sum", (getattr(session, f"{metric}_sq_sum") or 0.0) + squares
+        )
+        current = getattr(session, f"{metric}_min")
+        if current is None or minimum < current:
+            setattr(session, f"{metric}_min", minimum)
+        current = getattr(session, f"{metric}_max")
+        if current is None or maximum > current:
+            setattr(session, f"{metric}_max", maximum)
+    session.average_speed_kmh = session.speed_sum / count
+    session.average_rpm = session.rpm_sum / count
+    session.average_mets = session.mets_sum / count
+
+
+def _increment_running_stats(session, summary):
+    columns = FitnessSession.__table__.c
+    count = func.coalesce(columns.sample_count, 0) + summary["count"]
+    values = {
+        "sample_count": count,
+        "moving_time_seconds": func.coalesce(columns.moving_time_seconds, 0.0)
+        + summary["moving"],
+        "last_sample_at": _greatest(columns.last_sample_at, summary["last_at"]),
+    }
+    for metric, (total, squares, minimum, maximum) in summary["metrics"].items():
+        total_sum = func.coalesce(columns[f"{metric}_sum"], 0.0) + total
+        values[f"{metric}_sum"] = total_sum
+        values[f"{metric}_sq_sum"] = func.coalesce(columns[f"{metric}_sq_sum"], 0.0) + squares
+        values[f"{metric}_min"] = _least(columns[f"{metric}_min"], minimum)
+        values[f"{metric}_max"] = _greatest(columns[f"{metric}_max"], maximum)
+    # SETの右辺は更新前の値を参照するため、平均値も加算後の合計 / 件数になる
+    values["average_speed_kmh"] = values["speed_sum"] / count
+    values["average_rpm"] = values["rpm_sum"] / count
+    values["average_mets"] = values["mets_sum"] / count
+
+    db.session.execute(
+        update(FitnessSession)
+        .where(FitnessSession.id == session.id)
+        .values(values)
+        .execution_options(synchronize_session=False)
+    )
+    # 読み出し時にDBの値を取り直す
+    db.session.expire(session, list(values))
+
+
+def reset_running_stats(session):
+    """集計値を初期状態に戻す（再集計用）"""
+    session.sample_count = 0
+    session.moving_time_seconds = 0.0
+    session.last_sample_at = None
+    for metric in STATS_METRICS:
+        setattr(session, f"{metric}_sum", 0.0)
+        setattr(session, f"{metric}_sq_sum", 0.0)
+        setattr(session, f"{metric}_min", None)
+        setattr(session, f"{metric}_max", None)
+
+
+def recompute_running_stats(recompute_all=False):
+    """保存済みのデータポイントから終了済みセッションの集計値を作り直し、件数を返す
+
+    既定では集計値を持たない（この機能より前に記録した）セッションだけを対象にする。
+    圧縮済みのセッションはアーカイブから復元して集計する。
+    """
+    from .point_archive import load_points
+
+    fields = ("timestamp", *STATS_METRICS.values())
+    moving_speed_kmh = current_app.config["SESSION_MOVING_SPEED_KMH"]
+    query = select(FitnessSession.id).where(FitnessSession.end_time.is_not(None))
+    if not recompute_all:
+        query = query.where(FitnessSession.sample_count == 0)
+    session_ids = db.session.execute(query.order_by(FitnessSession.id)).scalars().all()
+
+    for session_id in session_ids:
+        session = db.session.get(FitnessSession, session_id)
+        rows = [dict(zip(fields, point)) for point in load_points(session_id, fields)]
+        reset_running_stats(session)
+        update_running_stats(session, rows, moving_speed_kmh)
+        db.session.commit()
+    return len(session_ids)
+
+
+def finalize_sessions(sessions):
+    """セッションの終了時刻と平均値を確定（コミットは呼び出し側）
+
+    平均値は取り込み時の集計値（update_running_stats）から求める。集計値を
+    持たない以前のセッションだけ、データポイントを1回のGROUP BYで集計する。
+    終了時刻は最後にサンプルを受信した時刻とする。
+    """
+    if not sessions:
+        return
+    legacy_ids = [session.id for session in sessions if not session.sample_count]
+    averages = {}
+    if legacy_ids:
+        averages = {
+            row.session_id: row
+            for row in db.session.execute(
+                select(
+                    DataPoint.session_id,
+                    func.avg(DataPoint.speed_kmh).label("speed"),
+                    func.avg(DataPoint.rpm).label("rpm"),
+                    func.avg(DataPoint.mets).label("mets"),
+                )
+                .where(DataPoint.session_id.in_(legacy_ids))
+                .group_by(DataPoint.session_id)
+            )
+        }
+
+    for session in sessions:
+        if session.end_time is None:
+            session.end_time = session.last_seen_at or session.start_time
+        if session.sample_count:
+            count = session.sample_count
+            session.average_speed_kmh = session.speed_sum / count
+            session.average_rpm = session.rpm_sum / count
+            session.average_mets = session.mets_sum / count
+            continue
+        row = averages.get(session.id)
+        if row is not None:
+            session.average_speed_kmh = row.speed or 0.0
+            session.average_rpm = row.rpm or 0.0
+            session.average_mets = row.mets or 0.0
+
+
+def notify_session_ended(session):
+    """終了したセッションをライブ状態・SSE・取り込みバッファに反映"""
+    from .live_state import get_live_state
+    from .raw_archive import forget_session
+    from .stream import get_stream_broker
+
+    get_live_state().discard_session(session.id)
+    forget_session(session.id)
+    get_stream_broker().publish(
+        session.device_id, {"session_id": session.id}, event="session_end"
+    )
+    buffer = current_app.extensions.get("ingest_buffer")
+    if buffer is not None:
+        buffer.forget(session.id)
+
+
+def close_idle_sessions(timeout, now=None, auto_sync=False):
+    """アイドル状態の進行中セッションを終了してコミットし、終了したセッションを返す"""
+    sessions = find_idle_sessions(timeout, now)
+    if not sessions:
+        return []
+
+    finalize_sessions(sessions)
+    db.session.commit()
+
+    for session in sessions:
+        logger.info(
+            "Closed idle session %s for device %s (last seen %s)",
+            session.id,
+            session.device_id,
+            session.end_time,
+        )
+        notify_session_ended(session)
+        if auto_sync:
+            _sync_closed_session(session.id)
+    return sessions
+
+
+def _sync_closed_session(session_id):
+    from .sync_jobs import enqueue_sync
+
+    try:
+        enqueue_sync(session_id)
+    except Exception:
+        db.session.rollback()
+        logger.exception("Failed to enqueue sync for idle-closed session %s", session_id)
+
+
+class SessionSweeper:
+    """アイドル状態のセッションを定期的に終了するバックグラウンドスレッド"""
+
+    def __init__(self, app):
+        self.app = app
+        self.timeout = app.config["SESSION_IDLE_TIMEOUT_SECONDS"]
+        self.interval = app.config["SESSION_SWEEP_INTERVAL_SECONDS"]
+        self.auto_sync = app.config["SESSION_IDLE_AUTO_SYNC"]
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+
+    def sweep(self):
+        with self.app.app_context():
+            try:
+                return close_idle_sessions(self.timeout, auto_sync=self.auto_sync)
+            except Exception:
+                db.session.rollback()
+                logger.exception("Failed to close idle sessions")
+                return []
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sweep()
+
+
+def init_session_sweeper(app):
+    """SESSION_IDLE_TIMEOUT_SECONDSとSESSION_SWEEP_INTERVAL_SECONDSが正の場合にスイーパーを開始"""
+    if app.config["SESSION_IDLE_TIMEOUT_SECONDS"] <= 0:
+        return
+    if app.config["SESSION_SWEEP_INTERVAL_SECONDS"] <= 0:
+        return
+    sweeper = SessionSweeper(app)
+    app.extensions["session_sweeper"] = sweeper
+    sweeper.start()
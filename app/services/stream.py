@@ -0,0 +1,183 @@
+# app/services/stream.py
+
+import atexit
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+
+from flask import current_app
+
+
+class UnixSocketFanout:
+    """同一ホスト上のワーカー間でイベントを配る、Unixドメインソケットのファンアウト
+
+    各ワーカーは共有ディレクトリに自分のデータグラムソケットを作り、
+    publish時に他のワーカーのソケットすべてへイベントを送る。
+    応答の無いソケットファイル（終了したワーカー）は送信時に削除する。
+    """
+
+    def __init__(self, directory, on_event):
+        self.directory = directory
+        self.on_event = on_event
+        self.path = None
+        self._recv_sock = None
+        self._send_sock = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """現在のプロセスでソケットを開く（gunicornのfork後にも対応）"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self.path = os.path.join(
+                self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock"
+            )
+            self._recv_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._recv_sock.bind(self.path)
+            self._send_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._send_sock.setblocking(False)
+            self._pid = os.getpid()
+
+            threading.Thread(
+                target=self._receive, args=(self._recv_sock,), name="stream-fanout", daemon=True
+            ).start()
+            atexit.register(self.close)
+
+    def send(self, event):
+        self.ensure_started()
+        payload = json.dumps(event).encode("utf-8")
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".sock") or path == self.path:
+                continue
+            try:
+                self._send_sock.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # 終了したワーカーのソケット
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError:
+                # 受信側のバッファが一杯の場合は取りこぼす（publish側をブロックしない）
+                pass
+
+    def close(self):
+        if self.path and self._pid == os.getpid():
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def _receive(self, sock):
+        while True:
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                return
+            try:
+                self.on_event(json.loads(data))
+            except ValueError:
+                continue
+
+
+class StreamBroker:
+    """SSEの購読者へサンプルを配信するブローカー
+
+    直近のイベントをリングバッファに保持し、再接続時にLast-Event-ID以降を
+    再送する。fanout_dirが指定されている場合は他のワーカーにも配信する。
+    """
+
+    def __init__(self, history_size=600, queue_size=1000, fanout_dir=None):
+        self.queue_size = queue_size
+        self._history = deque(maxlen=history_size)
+        self._subscribers = {}  # queue -> device_id（Noneは全デバイス）
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._fanout = None
+        if fanout_dir and hasattr(socket, "AF_UNIX"):
+            self._fanout = UnixSocketFanout(fanout_dir, self._dispatch)
+
+    def subscribe(self, device_id=None):
+        if self._fanout is not None:
+            self._fanout.ensure_started()
+        subscription = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[subscription] = device_id
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.pop(subscription, None)
+
+    def publish(self, device_id, payload, event="sample"):
+        """イベントをこのワーカーの購読者と他のワーカーに配信"""
+        event = {
+            "id": self._next_id(),
+            "event": event,
+            "device_id": device_id,
+            "data": json.dumps(payload),
+        }
+        self._dispatch(event)
+        if self._fanout is not None:
+            self._fanout.send(event)
+        return event["id"]
+
+    def replay(self, last_event_id, device_id=None):
+        """Last-Event-IDより後のイベントを返す"""
+        with self._lock:
+            events = list(self._history)
+        return [
+            event
+            for event in events
+            if event["id"] > last_event_id
+            and (device_id is None or event["device_id"] == device_id)
+        ]
+
+    def _next_id(self):
+        # ワーカー間で順序を比較できるよう、マイクロ秒単位の時刻をIDにする
+        with self._lock:
+            self._last_id = max(self._last_id + 1, time.time_ns() // 1000)
+            return self._last_id
+
+    def _dispatch(self, event):
+        with self._lock:
+            self._history.append(event)
+            self._last_id = max(self._last_id, event["id"])
+            subscribers = list(self._subscribers.items())
+
+        for subscription, device_id in subscribers:
+            if device_id is not None and device_id != event["device_id"]:
+                continue
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # 読み出しの遅いクライアントは取りこぼす（再接続時にreplayで補う）
+                pass
+
+
+def format_event(event):
+    """イベントをSSEのテキスト形式に変換"""
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {event['data']}\n\n"
+
+
+def init_stream(app):
+    """SSE用のブローカーを初期化"""
+    app.extensions["stream_broker"] = StreamBroker(
+        history_size=app.config["STREAM_HISTORY_SIZE"],
+        fanout_dir=app.config["STREAM_FANOUT_DIR"],
+    )
+
+
+def get_stream_broker():
+    """現在のアプリのSSEブローカーを取得"""
+    return current_app.extensions["stream_broker"]
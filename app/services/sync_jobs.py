@@ -0,0 +1,289 @@
+# app/services/sync_jobs.py
+
+import atexit
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from ..models import FitnessSession, SyncJob, db
+from ..models.sync_job import (
+    SERVICE_FAILED,
+    SERVICE_PENDING,
+    SERVICE_SKIPPED,
+    SERVICE_SUCCEEDED,
+)
+from .google_fit import (
+    session_dataset_id,
+    upload_fitness_session,
+    upload_to_health_connect,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# 同期先のサービス名 -> session_idを受け取るアップロード関数
+# 認証情報はセッションのデバイスの保存済み認証情報（services/credentials.py）を使う
+SERVICES = {
+    "google_fit": upload_fitness_session,
+    "health_connect": upload_to_health_connect,
+}
+
+
+def idempotency_key(fitness_session):
+    """同期ジョブの重複排除キー（"セッションID:データセットID"）
+
+    進行中のセッションはデータセットIDの終了が現在時刻で毎回変わるため、
+    "セッションID:active"として繰り返しの同期要求を1件のジョブにまとめる。
+    """
+    if fitness_session.end_time is None:
+        return f"{fitness_session.id}:active"
+    return f"{fitness_session.id}:{session_dataset_id(fitness_session)}"
+
+
+def enqueue_sync(session_id):
+    """セッションの同期ジョブを登録してコミットし、ジョブを返す
+
+    同じセッション・期間のジョブが既にあればそれを返す。失敗したジョブや、
+    未連携でスキップしたサービスがあるジョブは、成功済みのサービスを除いて再実行する。
+    進行中のセッションのジョブは、実行待ち・実行中ならそのまま返し、終わっていれば
+    その後に受信した分も送るよう全サービスを再実行する。
+    """
+    from flask import current_app
+
+    fitness_session = db.session.get(FitnessSession, session_id)
+    key = idempotency_key(fitness_session)
+
+    job = SyncJob.query.filter_by(idempotency_key=key).first()
+    if job is None:
+        job = SyncJob(
+            session_id=session_id,
+            idempotency_key=key,
+            status=SyncJob.PENDING,
+            services={name: {"status": SERVICE_PENDING} for name in SERVICES},
+            max_attempts=current_app.config["SYNC_JOB_MAX_ATTEMPTS"],
+            next_run_at=datetime.utcnow(),
+        )
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # 同時に登録された場合は先に登録されたジョブを使う
+            db.session.rollback()
+            job = SyncJob.query.filter_by(idempotency_key=key).one()
+    elif fitness_session.end_time is None and job.status in (SyncJob.SUCCEEDED, SyncJob.FAILED):
+        _reset(job, keep_succeeded=False)
+        db.session.commit()
+    elif job.status == SyncJob.FAILED or (
+        job.status == SyncJob.SUCCEEDED
+        and any(state["status"] == SERVICE_SKIPPED for state in job.services.values())
+    ):
+        _reset(job)
+        db.session.commit()
+
+    _wake_worker()
+    return job
+
+
+def _reset(job, keep_succeeded=True):
+    job.status = SyncJob.PENDING
+    job.attempts = 0
+    job.next_run_at = datetime.utcnow()
+    job.services = {
+        name: state
+        if keep_succeeded and state["status"] == SERVICE_SUCCEEDED
+        else {"status": SERVICE_PENDING}
+        for name, state in job.services.items()
+    }
+
+
+def claim_due_jobs(limit, lock_timeout):
+    """実行時刻を過ぎたジョブを取得し、runningにしてIDを返す
+
+    複数のワーカーが同時に取得しても1件は1つのワーカーだけが実行するよう、
+    状態を条件にしたUPDATEの更新件数で取得できたかを判定する。
+    lock_timeout秒を超えてrunningのまま（ワーカーが落ちた）のジョブも再取得する。
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=lock_timeout)
+    claimable = or_(
+        (SyncJob.status == SyncJob.PENDING) & (SyncJob.next_run_at <= now),
+        (SyncJob.status == SyncJob.RUNNING) & (SyncJob.locked_at < stale),
+    )
+    candidates = db.session.execute(
+        db.select(SyncJob.id).where(claimable).order_by(SyncJob.next_run_at).limit(limit)
+    ).scalars().all()
+
+    claimed = []
+    for job_id in candidates:
+        result = db.session.execute(
+            update(SyncJob)
+            .where(SyncJob.id == job_id, claimable)
+            .values(status=SyncJob.RUNNING, locked_at=now)
+        )
+        if result.rowcount == 1:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def run_job(job_id, backoff_seconds=30, max_backoff_seconds=3600):
+    """取得済みのジョブを1回実行し、結果に応じて完了・再試行・失敗にする"""
+    job = db.session.get(SyncJob, job_id)
+    if job is None:
+        return None
+
+    services = dict(job.services)
+    retry = False
+    for name, upload in SERVICES.items():
+        state = services.get(name, {"status": SERVICE_PENDING})
+        if state["status"] in (SERVICE_SUCCEEDED, SERVICE_SKIPPED):
+            continue
+        try:
+            result = upload(job.session_id)
+        except Exception as e:
+            logger.exception("Sync of session %s to %s failed", job.session_id, name)
+            result = {"success": False, "error": str(e), "retryable": True}
+
+        if result.get("success"):
+            services[name] = {"status": SERVICE_SUCCEEDED}
+        elif result.get("skipped"):
+            services[name] = {"status": SERVICE_SKIPPED, "error": result.get("error")}
+        else:
+            services[name] = {"status": SERVICE_FAILED, "error": result.get("error")}
+            retry = retry or result.get("retryable", False)
+        if "stats" in result:
+            services[name]["stats"] = result["stats"]  # 件数・スループット
+
+    job.services = services
+    job.attempts += 1
+    job.locked_at = None
+    errors = [state["error"] for state in services.values() if state["status"] == SERVICE_FAILED]
+    job.last_error = "; ".join(errors) or None
+
+    if not errors:
+        job.status = SyncJob.SUCCEEDED
+    elif retry and job.attempts < job.max_attempts:
+        # 指数バックオフ（±20%のジッター付き）で再試行
+        delay = min(max_backoff_seconds, backoff_seconds * 2 ** (job.attempts - 1))
+        job.status = SyncJob.PENDING
+        job.next_run_at = datetime.utcnow() + timedelta(
+            seconds=delay * random.uniform(0.8, 1.2)
+        )
+    else:
+        job.status = SyncJob.FAILED
+    db.session.commit()
+    logger.info(
+        "Sync job %s for session %s: %s (attempt %d)",
+        job.id,
+        job.session_id,
+        job.status,
+        job.attempts,
+    )
+    return job
+
+
+class SyncWorker:
+    """同期ジョブをポーリングし、スレッドプールで実行するワーカー"""
+
+    def __init__(self, app, threads):
+        self.app = app
+        self.threads = threads
+        self.poll_interval = app.config["SYNC_POLL_INTERVAL_SECONDS"]
+        self.lock_timeout = app.config["SYNC_JOB_LOCK_TIMEOUT_SECONDS"]
+        self.backoff = app.config["SYNC_RETRY_BACKOFF_SECONDS"]
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="sync-job")
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._running = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sync-dispatcher", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self._executor.shutdown(wait=False)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def join(self):
+        self._thread.join()
+
+    def run_once(self):
+        """実行待ちのジョブを1回取得し、完了を待って実行した件数を返す"""
+        count = self.dispatch()
+        self._executor.shutdown(wait=True)
+        return count
+
+    def dispatch(self):
+        """空いているスレッドの数だけジョブを取得して実行を開始し、開始した件数を返す"""
+        with self._lock:
+            free = self.threads - len(self._running)
+        if free <= 0:
+            return 0
+
+        with self.app.app_context():
+            try:
+                job_ids = claim_due_jobs(free, self.lock_timeout)
+            except Exception:
+                db.session.rollback()
+                logger.exception("Failed to claim sync jobs")
+                return 0
+
+        for job_id in job_ids:
+            with self._lock:
+                self._running.add(job_id)
+            self._executor.submit(self._execute, job_id)
+        return len(job_ids)
+
+    def _execute(self, job_id):
+        try:
+            with self.app.app_context():
+                try:
+                    run_job(job_id, self.backoff)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Sync job %s crashed", job_id)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if not self._stopped.is_set():
+                self.dispatch()
+
+
+def _wake_worker():
+    from flask import current_app
+
+    worker = current_app.extensions.get("sync_worker")
+    if worker is not None:
+        worker.wake()
+
+
+def init_sync_worker(app):
+    """SYNC_WORKER_THREADSが正の場合、このプロセス内でワーカーを開始
+
+    Webプロセスではservices/background.pyから最初のリクエストで呼ばれる。
+    0の場合は flask sync worker で別プロセスのワーカーを起動する。
+    """
+    threads = app.config["SYNC_WORKER_THREADS"]
+    if threads <= 0:
+        return
+    worker = SyncWorker(app, threads)
+    app.extensions["sync_worker"] = worker
+    worker.start()
@@ -109,8 +109,14 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // データ取得関数
     async function fetchSessionData(sessionId) {
-        const response = await fetch(`/api/sessions/${sessionId}`);
-        return response.json();
+        // セッション情報と、グラフ幅に合わせてサーバー側で間引いた速度の系列を取得
+        const [session, series] = await Promise.all([
+            fetch(`/api/sessions/${sessionId}?include_points=false`).then(r => r.json()),
+            fetch(`/api/sessions/${sessionId}/series?metric=speed_kmh&points=500`).then(r => r.json())
+        ]);
+        session.timestamps = series.timestamps || [];
+        session.speed = series.values || [];
+        return session;
     }
 
     async function fetchIntegratedHealthData(date) {
@@ -3,6 +3,25 @@ let currentSession = null;
 let historyChart = null;
 let dailyChart = null;
 let activeSessionId = null;
+let historyInitialized = false;
+let historyLoading = false;
+let historyCursor = null;
+
+// 履歴グラフに保持する最大ポイント数（1Hzで30分）
+const MAX_HISTORY_POINTS = 1800;
+
+// ?device_id=... で特定のデバイスだけを表示（省略時は最初に受信したデバイスを追従）
+const deviceId = new URLSearchParams(window.location.search).get('device_id');
+let followedDeviceId = deviceId;
+
+// URLにdevice_idのクエリパラメータを付ける
+function withDevice(url, device = followedDeviceId) {
+    if (!device) {
+        return url;
+    }
+    const separator = url.includes('?') ? '&' : '?';
+    return `${url}${separator}device_id=${encodeURIComponent(device)}`;
+}
 
 // ゲージチャートの設定
 const gaugeLayout = {
@@ -125,14 +144,9 @@ async function endSession(sessionId, autoSync = true) {
             // セッション終了の成功を通知
             showNotification('セッションを終了しました', 'success');
             
-            if (result.sync_result) {
-                // 同期結果の通知
-                if (result.sync_result.google_fit.success) {
-                    showNotification('Google Fitと同期しました', 'success');
-                }
-                if (result.sync_result.health_connect.success) {
-                    showNotification('Health Connectと同期しました', 'success');
-                }
+            if (result.sync_job_id) {
+                // 同期はバックグラウンドで行われるため、ジョブの完了を待って通知
+                watchSyncJob(result.sync_job_id);
             }
             
             // アクティブセッションをリセット
@@ -158,18 +172,11 @@ async function syncSession(sessionId) {
         });
         
         const result = await response.json();
-        if (result.google_fit.success || result.health_connect.success) {
-            if (result.google_fit.success) {
-                showNotification('Google Fitと同期しました', 'success');
-            }
-            if (result.health_connect.success) {
-                showNotification('Health Connectと同期しました', 'success');
-            }
+        if (result.sync_job_id) {
+            showNotification('同期を開始しました', 'info');
+            watchSyncJob(result.sync_job_id);
         } else {
-            const errors = [];
-            if (result.google_fit.error) errors.push(`Google Fit: ${result.google_fit.error}`);
-            if (result.health_connect.error) errors.push(`Health Connect: ${result.health_connect.error}`);
-            showNotification('同期に失敗しました: ' + errors.join(', '), 'error');
+            showNotification('同期に失敗しました: ' + result.error, 'error');
         }
     } catch (error) {
         console.error('Error syncing session:', error);
@@ -177,6 +184,41 @@ async function syncSession(sessionId) {
     }
 }
 
+// 同期ジョブの完了を待って結果を通知
+const SYNC_SERVICE_NAMES = {
+    google_fit: 'Google Fit',
+    health_connect: 'Health Connect'
+};
+const SYNC_POLL_INTERVAL_MS = 3000;
+
+async function watchSyncJob(jobId) {
+    try {
+        const response = await fetch(`/api/sync-jobs/${jobId}`);
+        const job = await response.json();
+
+        // 実行待ち・実行中（再試行待ちを含む）の間はポーリングを続ける
+        if (job.status === 'pending' || job.status === 'running') {
+            setTimeout(() => watchSyncJob(jobId), SYNC_POLL_INTERVAL_MS);
+            return;
+        }
+
+        const errors = [];
+        Object.entries(job.services).forEach(([service, state]) => {
+            const name = SYNC_SERVICE_NAMES[service] || service;
+            if (state.status === 'succeeded') {
+                showNotification(`${name}と同期しました`, 'success');
+            } else if (state.status === 'failed') {
+                errors.push(`${name}: ${state.error}`);
+            }
+        });
+        if (errors.length > 0) {
+            showNotification('同期に失敗しました: ' + errors.join(', '), 'error');
+        }
+    } catch (error) {
+        console.error('Error checking sync job:', error);
+    }
+}
+
 // 通知表示
 function showNotification(message, type = 'info') {
     // Bootstrapのトースト通知を使用
@@ -208,44 +250,42 @@ function showNotification(message, type = 'info') {
     toast.show();
 }
 
-// リアルタイムデータの更新
+// 現在のセッション状態を表示に反映
+function renderCurrentState(data) {
+    // セッションIDを保存
+    activeSessionId = data.session_id;
+
+    // メーターの更新
+    Plotly.update('speed-gauge', {'value': [data.current_speed_kmh]});
+    Plotly.update('rpm-gauge', {'value': [data.current_rpm]});
+    Plotly.update('mets-gauge', {'value': [data.current_mets]});
+
+    // リアルタイムメトリクスの更新（セッションデータ）
+    document.getElementById('current-distance').textContent = 
+        `${(data.session_dist_km || 0).toFixed(2)} km`;
+    document.getElementById('current-calories').textContent = 
+        `${(data.session_cal_kcal || 0).toFixed(1)} kcal`;  // 小数点第一位まで表示
+    document.getElementById('current-time').textContent = 
+        formatTime(data.session_time_s || 0);
+}
+
+// リアルタイムデータの更新（SSE非対応ブラウザ向けのポーリング）
 function updateRealTimeData() {
-    fetch('/api/sessions/current')
+    fetch(withDevice('/api/sessions/current'))
         .then(response => response.json())
         .then(data => {
-            // デバッグ出力を追加
-            console.log('Received session data:', data);
-            
             if (data.status === 'no_active_session') {
                 if (activeSessionId) {
                     // アクティブなセッションが終了された場合
                     endSession(activeSessionId);
                 }
+                followedDeviceId = deviceId;
                 resetDisplays();
                 return;
             }
 
-            // セッションIDを保存
-            activeSessionId = data.session_id;
-
-            // メーターの更新
-            Plotly.update('speed-gauge', {'value': [data.current_speed_kmh]});
-            Plotly.update('rpm-gauge', {'value': [data.current_rpm]});
-            Plotly.update('mets-gauge', {'value': [data.current_mets]});
-
-            // デバッグ出力を追加
-            console.log('Updating metrics:');
-            console.log('Distance:', data.session_dist_km);
-            console.log('Calories:', data.session_cal_kcal);
-            console.log('Time:', data.session_time_s);
-
-            // リアルタイムメトリクスの更新（セッションデータ）
-            document.getElementById('current-distance').textContent = 
-                `${(data.session_dist_km || 0).toFixed(2)} km`;
-            document.getElementById('current-calories').textContent = 
-                `${(data.session_cal_kcal || 0).toFixed(1)} kcal`;  // 小数点第一位まで表示
-            document.getElementById('current-time').textContent = 
-                formatTime(data.session_time_s || 0);
+            followedDeviceId = data.device_id;
+            renderCurrentState(data);
 
             // セッション履歴の更新
             updateSessionHistory();
@@ -256,17 +296,94 @@ function updateRealTimeData() {
         });
 }
 
+// SSEで受信したサンプルの反映
+function handleSample(data) {
+    if (!followedDeviceId) {
+        followedDeviceId = data.device_id;
+    }
+    if (data.device_id !== followedDeviceId) {
+        return;
+    }
+    const sessionChanged = activeSessionId !== data.session_id;
+    renderCurrentState(data);
+
+    // 新しいセッション、または履歴グラフが未描画の場合は履歴を取得し直す
+    if (sessionChanged || !historyInitialized) {
+        updateSessionHistory();
+        return;
+    }
+
+    // 新しいポイントだけをグラフに追加
+    appendHistoryPoints([data.point]);
+}
+
+// /api/stream への接続（切断時はEventSourceがLast-Event-ID付きで再接続する）
+function connectStream() {
+    const source = new EventSource(withDevice('/api/stream', deviceId));
+
+    source.addEventListener('sample', event => {
+        handleSample(JSON.parse(event.data));
+    });
+
+    source.addEventListener('session_end', event => {
+        const data = JSON.parse(event.data);
+        if (data.session_id === activeSessionId) {
+            activeSessionId = null;
+            followedDeviceId = deviceId;
+            resetDisplays();
+        }
+    });
+
+    source.onerror = () => {
+        console.warn('Stream connection lost, reconnecting...');
+    };
+}
+
+// 履歴グラフにポイントを追加
+function appendHistoryPoints(points) {
+    const timestamps = points.map(d => new Date(d.timestamp));
+    Plotly.extendTraces('session-history-plot', {
+        x: [timestamps, timestamps],
+        y: [points.map(d => d.speed_kmh), points.map(d => d.rpm)]
+    }, [0, 1], MAX_HISTORY_POINTS);
+}
+
+// 前回のカーソル以降のポイントだけを取得して追加
+function fetchHistoryDelta() {
+    historyLoading = true;
+
+    fetch(withDevice(`/api/sessions/history?since_id=${historyCursor}`))
+        .then(response => response.json())
+        .then(data => {
+            if (data.points.length > 0) {
+                appendHistoryPoints(data.points);
+            }
+            if (data.cursor.since_id) {
+                historyCursor = data.cursor.since_id;
+            }
+        })
+        .catch(error => console.error('Error fetching session history:', error))
+        .finally(() => {
+            historyLoading = false;
+        });
+}
+
 // セッション履歴の更新
 function updateSessionHistory() {
-    fetch('/api/sessions/history')
+    if (historyLoading) {
+        return;
+    }
+    if (historyInitialized && historyCursor) {
+        fetchHistoryDelta();
+        return;
+    }
+    historyLoading = true;
+
+    fetch(withDevice('/api/sessions/history'))
         .then(response => response.json())
         .then(data => {
-            // デバッグ出力を追加
-            console.log('Received history data:', data);
-            
             // データが空の場合は更新しない
             if (!data || data.length === 0) {
-                console.log('No history data available');
                 return;
             }
 
@@ -317,17 +434,21 @@ function updateSessionHistory() {
 
             // グラフを更新
             Plotly.react('session-history-plot', traces, layout);
-            console.log('Updated session history plot');
+            historyInitialized = true;
+            historyCursor = data[data.length - 1].id;
         })
         .catch(error => {
             console.error('Error fetching session history:', error);
             console.error('Stack trace:', error.stack);
+        })
+        .finally(() => {
+            historyLoading = false;
         });
 }
 
 // デイリーサマリーの更新
 function updateDailySummary() {
-    fetch('/api/sessions/daily')
+    fetch(withDevice('/api/sessions/daily', deviceId))
         .then(response => response.json())
         .then(data => {
             const traces = [{
@@ -349,7 +470,7 @@ function updateDailySummary() {
 
 // 累積データの更新
 function updateCumulativeStats() {
-    fetch('/api/sessions/cumulative')
+    fetch(withDevice('/api/sessions/cumulative', deviceId))
         .then(response => response.json())
         .then(data => {
             document.getElementById('total-time').textContent = 
@@ -371,6 +492,10 @@ function resetDisplays() {
     document.getElementById('current-distance').textContent = '0.00 km';
     document.getElementById('current-calories').textContent = '0 kcal';
     document.getElementById('current-time').textContent = '00:00:00';
+
+    historyInitialized = false;
+    historyCursor = null;
+    Plotly.react('session-history-plot', [], {});
 }
 
 // 初期化と定期更新の設定
@@ -379,8 +504,14 @@ window.addEventListener('load', () => {
     initializeHistoryChart();
     initializeDailySummaryChart();
     
+    // リアルタイムデータはSSEで受信（非対応の場合は1秒ごとのポーリング）
+    if (window.EventSource) {
+        connectStream();
+    } else {
+        setInterval(updateRealTimeData, 1000);
+    }
+
     // 定期更新の設定
-    setInterval(updateRealTimeData, 1000);     // リアルタイムデータ（1秒）
     setInterval(updateDailySummary, 60000);    // デイリーサマリー（1分）
     setInterval(updateCumulativeStats, 60000); // 累積データ（1分）
     
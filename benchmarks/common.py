@@ -0,0 +1,60 @@
+"""ベンチマークスクリプト共通の処理（DB接続先の設定、レイテンシの集計）"""
+
+import math
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+DEFAULT_DATABASE = os.path.join(tempfile.gettempdir(), "fit2go_benchmark.db")
+
+
+def add_database_argument(parser):
+    parser.add_argument(
+        "--database-url",
+        default="sqlite:///" + DEFAULT_DATABASE,
+        help=f"既定は sqlite:///{DEFAULT_DATABASE}（seed.pyとload.pyで共有）",
+    )
+
+
+def create_benchmark_app(database_url):
+    """DATABASE_URLを設定してからappを作成する
+
+    configはimport時に環境変数を読むため、appのimportはここで行う。
+    """
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from app import create_app
+
+    return create_app()
+
+
+def percentile(sorted_values, fraction):
+    """ソート済みの値の百分位（最近傍法）"""
+    if not sorted_values:
+        return float("nan")
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def format_report(results, elapsed):
+    """エンドポイントごとの件数・スループット・p50/p95/p99（ミリ秒）の表を返す
+
+    resultsはエンドポイント名 -> (レイテンシ秒のリスト, エラー件数)
+    """
+    lines = [
+        f"{'endpoint':<22}{'requests':>9}{'errors':>8}{'req/s':>9}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    ]
+    for name in sorted(results):
+        latencies, errors = results[name]
+        latencies = sorted(latencies)
+        lines.append(
+            f"{name:<22}{len(latencies):>9}{errors:>8}{len(latencies) / elapsed:>9.1f}"
+            f"{percentile(latencies, 0.50) * 1000:>10.1f}"
+            f"{percentile(latencies, 0.95) * 1000:>10.1f}"
+            f"{percentile(latencies, 0.99) * 1000:>10.1f}"
+        )
+    return "\n".join(lines)
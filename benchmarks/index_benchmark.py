@@ -0,0 +1,187 @@
+"""ホットパスのクエリに対するインデックスの効果を計測するベンチマーク
+
+合成データ（既定で200万データポイント）をSQLiteまたはPostgreSQLに投入し、
+インデックス無し／有りのそれぞれでクエリプランと実行時間を表示する。
+
+    python benchmarks/index_benchmark.py
+    python benchmarks/index_benchmark.py --database-url postgresql://localhost/fit2go_bench
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.models import DataPoint, FitnessSession, db  # noqa: E402
+
+TABLES = [FitnessSession.__table__, DataPoint.__table__]
+
+# 計測対象のクエリ（requestsのホットパスと同じ形）
+QUERIES = {
+    "history (session_id + timestamp range)": (
+        "SELECT * FROM data_points WHERE session_id = :session_id "
+        "AND timestamp >= :since AND timestamp <= :until ORDER BY timestamp"
+    ),
+    "session points (export / Google Fit)": (
+        "SELECT * FROM data_points WHERE session_id = :session_id ORDER BY timestamp"
+    ),
+    "daily stats (timestamp range)": (
+        "SELECT count(*), avg(speed_kmh), avg(rpm) FROM data_points "
+        "WHERE timestamp >= :day_start AND timestamp < :day_end"
+    ),
+    "active session lookup (device_id + end_time IS NULL)": (
+        "SELECT * FROM fitness_sessions WHERE device_id = :device_id "
+        "AND end_time IS NULL LIMIT 1"
+    ),
+    "calendar / download (start_time range)": (
+        "SELECT * FROM fitness_sessions WHERE start_time BETWEEN :day_start AND :day_end"
+    ),
+}
+
+
+def seed(engine, points, devices, session_minutes, batch_size=50000):
+    """1Hzの合成データを投入し、クエリのパラメータを返す"""
+    session_length = session_minutes * 60
+    session_count = max(devices, points // session_length)
+    start = datetime(2024, 1, 1, 6, 0, 0)
+
+    sessions = []
+    for index in range(session_count):
+        device = f"bench-{index % devices:03d}"
+        started = start + timedelta(hours=8 * (index // devices))
+        active = index >= session_count - devices  # 各デバイスの最後のセッションは進行中
+        sessions.append(
+            {
+                "id": index + 1,
+                "device_id": device,
+                "start_time": started,
+                "end_time": None if active else started + timedelta(seconds=session_length),
+                "total_time_seconds": session_length,
+                "total_distance_km": 10.0,
+                "total_calories_kcal": 200.0,
+                "average_speed_kmh": 20.0,
+                "average_rpm": 70.0,
+                "average_mets": 5.0,
+            }
+        )
+
+    with engine.begin() as conn:
+        conn.execute(insert(FitnessSession.__table__), sessions)
+
+        rows = []
+        inserted = 0
+        for session in sessions:
+            for second in range(session_length):
+                if inserted >= points:
+                    break
+                rows.append(
+                    {
+                        "session_id": session["id"],
+                        "timestamp": session["start_time"] + timedelta(seconds=second),
+                        "speed_kmh": random.uniform(0, 40),
+                        "rpm": random.uniform(0, 120),
+                        "distance_km": second * 0.005,
+                        "calories_kcal": second * 0.1,
+                        "time_seconds": second,
+                        "mets": random.uniform(1, 8),
+                    }
+                )
+                inserted += 1
+                if len(rows) >= batch_size:
+                    conn.execute(insert(DataPoint.__table__), rows)
+                    rows = []
+        if rows:
+            conn.execute(insert(DataPoint.__table__), rows)
+
+    target = sessions[len(sessions) // 2]
+    day_start = target["start_time"].replace(hour=0, minute=0, second=0)
+    return {
+        "session_id": target["id"],
+        "since": target["start_time"] + timedelta(minutes=10),
+        "until": target["start_time"] + timedelta(minutes=40),
+        "day_start": day_start,
+        "day_end": day_start + timedelta(days=1),
+        "device_id": target["device_id"],
+    }, inserted
+
+
+def explain(conn, sql, params):
+    if conn.dialect.name == "sqlite":
+        rows = conn.execute(text("EXPLAIN QUERY PLAN " + sql), params).fetchall()
+        return [row[-1] for row in rows]
+    rows = conn.execute(text("EXPLAIN " + sql), params).fetchall()
+    return [row[0] for row in rows]
+
+
+def measure(engine, params, repeat):
+    results = {}
+    with engine.connect() as conn:
+        for name, sql in QUERIES.items():
+            plan = explain(conn, sql, params)
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                conn.execute(text(sql), params).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (plan, statistics.median(timings))
+    return results
+
+
+def set_indexes(engine, create):
+    with engine.begin() as conn:
+        for table in TABLES:
+            for index in table.indexes:
+                if create:
+                    index.create(conn, checkfirst=True)
+                else:
+                    index.drop(conn, checkfirst=True)
+        conn.execute(text("ANALYZE"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="既定は一時ディレクトリのSQLite")
+    parser.add_argument("--points", type=int, default=2_000_000)
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--session-minutes", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    url = args.database_url
+    if not url:
+        url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "index_benchmark.db")
+    engine = create_engine(url)
+
+    db.metadata.drop_all(engine, tables=list(reversed(TABLES)))
+    db.metadata.create_all(engine, tables=TABLES)
+    set_indexes(engine, create=False)
+
+    print(f"Seeding {args.points:,} data points into {engine.url.render_as_string()} ...")
+    started = time.perf_counter()
+    params, inserted = seed(engine, args.points, args.devices, args.session_minutes)
+    print(f"Seeded {inserted:,} rows in {time.perf_counter() - started:.1f}s\n")
+
+    before = measure(engine, params, args.repeat)
+    set_indexes(engine, create=True)
+    after = measure(engine, params, args.repeat)
+
+    for name in QUERIES:
+        plan_before, ms_before = before[name]
+        plan_after, ms_after = after[name]
+        speedup = ms_before / ms_after if ms_after else float("inf")
+        print(f"== {name}")
+        print(f"   before: {ms_before:9.2f} ms  | " + " / ".join(plan_before))
+        print(f"   after:  {ms_after:9.2f} ms  | " + " / ".join(plan_after))
+        print(f"   speedup: {speedup:.1f}x\n")
+
+
+if __name__ == "__main__":
+    main()
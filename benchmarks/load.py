@@ -0,0 +1,245 @@
+"""M5Stackの送信とダッシュボードの読み出しを同時に流す負荷テスト
+
+seed.pyで投入したDBに対して、次の負荷を--duration秒間かけ、エンドポイントごとの
+スループットとp50/p95/p99レイテンシを表示する。
+
+- ライブ送信: --live-devices台がそれぞれ--rate Hzで /api/data に送信
+- SDカード取り込み: --upload-interval秒ごとに1セッションを /api/upload に送信
+- ダッシュボード: --readers個のスレッドがcurrent/history/daily/cumulative/
+  calendar/downloadを待ち時間無しで順に読み出す
+
+既定ではFlaskのテストクライアントでプロセス内のappを呼び出す。--base-urlを
+指定すると、ローカルで起動したgunicornなどにHTTPで送信する。
+
+    python benchmarks/load.py --duration 30
+    gunicorn --worker-class gthread --threads 8 'app:create_app()' &
+    python benchmarks/load.py --base-url http://127.0.0.1:8000
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from common import add_database_argument, create_benchmark_app, format_report
+
+DEFAULT_API_TOKEN = "dev-token-please-change-in-production"
+
+
+class TestClientTarget:
+    """Flaskのテストクライアントで送信（スレッドごとにクライアントを作る）"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, json=None, headers=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=json, headers=headers)
+        response.get_data()  # ストリーミングのレスポンスも最後まで読む
+        return response.status_code
+
+
+class HttpTarget:
+    """ローカルのHTTPサーバーに送信"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, path, json=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if json is not None:
+            body = _dumps(json)
+            headers["Content-Type"] = "application/json"
+        request = urllib.request.Request(
+            self.base_url + path, data=body, method=method, headers=headers
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+def _dumps(value):
+    return json.dumps(value).encode("utf-8")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, name, target, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            status = target.request(method, path, **kwargs)
+        except Exception:
+            status = None
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            if status is None or status >= 400:
+                self.errors[name] += 1
+
+    def results(self):
+        return {name: (latencies, self.errors[name]) for name, latencies in self.latencies.items()}
+
+
+def live_device(target, recorder, stop, headers, device_id, rate):
+    """1台のM5Stackが--rate Hzでサンプルを送る"""
+    interval = 1.0 / rate
+    second = 0
+    next_send = time.perf_counter()
+    while not stop.is_set():
+        speed = max(0.0, random.gauss(20, 4))
+        packet = {
+            "device_id": device_id,
+            "timestamp_ms": int(time.time() * 1000),
+            "speed_kmh": speed,
+            "rpm": speed * 3,
+            "mets": speed / 5,
+            "session_time_s": second,
+            "session_dist_km": second * 20 / 3600,
+            "session_cal_kcal": second * 0.1,
+            "total_time_s": 100000 + second,
+            "total_dist_km": 5000 + second * 20 / 3600,
+            "total_cal_kcal": 90000 + second * 0.1,
+        }
+        recorder.call(
+            "POST /api/data", target, "POST", "/api/data", json=packet, headers=headers
+        )
+        second += 1
+        next_send += interval
+        stop.wait(max(0.0, next_send - time.perf_counter()))
+
+
+def uploader(target, recorder, stop, headers, interval, minutes):
+    """SDカードに溜まった1セッション分を定期的にアップロードする"""
+    # 過去の重複しない時刻を使い、重複検出でスキップされないようにする
+    started = datetime.now().replace(microsecond=0) - timedelta(days=365)
+    while not stop.is_set():
+        points = [
+            {
+                "timestamp": (started + timedelta(seconds=second)).isoformat(),
+                "speed_kmh": 18.0,
+                "rpm": 54.0,
+                "distance_km": second * 18 / 3600,
+                "calories_kcal": second * 0.1,
+                "time_seconds": second,
+                "mets": 3.6,
+            }
+            for second in range(minutes * 60)
+        ]
+        payload = {
+            "device_id": "bench-upload",
+            "sessions": [
+                {
+                    "start_time": started.isoformat(),
+                    "end_time": (started + timedelta(seconds=minutes * 60 - 1)).isoformat(),
+                    "total_time_seconds": minutes * 60,
+                    "data_points": points,
+                }
+            ],
+        }
+        recorder.call("POST /api/upload", target, "POST", "/api/upload", json=payload, headers=headers)
+        started += timedelta(minutes=minutes)
+        stop.wait(interval)
+
+
+def read_endpoints(headers):
+    today = datetime.now().date()
+    month_start = today.replace(day=1)
+    week_ago = today - timedelta(days=7)
+    return [
+        ("GET current", "/api/sessions/current", None),
+        ("GET history", "/api/sessions/history", None),
+        ("GET daily", f"/api/sessions/daily?date={today}", None),
+        ("GET cumulative", "/api/sessions/cumulative", None),
+        (
+            "GET calendar",
+            f"/api/calendar/fit2go?start={month_start}T00:00:00&end={today}T23:59:59",
+            None,
+        ),
+        ("GET download", f"/api/download?format=json&start_date={week_ago}&end_date={today}", headers),
+    ]
+
+
+def reader(target, recorder, stop, endpoints):
+    """ダッシュボードのポーリングを待ち時間無しで繰り返す"""
+    while not stop.is_set():
+        name, path, headers = random.choice(endpoints)
+        recorder.call(name, target, "GET", path, headers=headers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_database_argument(parser)
+    parser.add_argument("--base-url", help="指定するとテストクライアントではなくHTTPで送信")
+    parser.add_argument("--api-token", default=DEFAULT_API_TOKEN)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--live-devices", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=1.0, help="1台あたりの送信頻度 (Hz)")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--upload-interval", type=float, default=5.0)
+    parser.add_argument("--upload-minutes", type=int, default=30)
+    args = parser.parse_args()
+
+    if args.base_url:
+        target = HttpTarget(args.base_url)
+        print(f"Target: {args.base_url}")
+    else:
+        target = TestClientTarget(create_benchmark_app(args.database_url))
+        print(f"Target: in-process test client ({args.database_url})")
+
+    headers = {"X-API-Token": args.api_token}
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(
+            target=live_device,
+            args=(target, recorder, stop, headers, f"live-{index:03d}", args.rate),
+        )
+        for index in range(args.live_devices)
+    ]
+    threads.append(
+        threading.Thread(
+            target=uploader,
+            args=(target, recorder, stop, headers, args.upload_interval, args.upload_minutes),
+        )
+    )
+    endpoints = read_endpoints(headers)
+    threads += [
+        threading.Thread(target=reader, args=(target, recorder, stop, endpoints))
+        for _ in range(args.readers)
+    ]
+
+    print(
+        f"Running {args.duration:.0f}s: {args.live_devices} live devices at {args.rate} Hz, "
+        f"{args.readers} dashboard readers, upload every {args.upload_interval}s\n"
+    )
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(format_report(recorder.results(), elapsed))
+
+
+if __name__ == "__main__":
+    main()
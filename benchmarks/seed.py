@@ -0,0 +1,114 @@
+"""ベンチマーク用の合成データをSQLiteまたはPostgreSQLに投入する
+
+デバイスごとに1日1セッション（1Hzのデータポイント）を過去--days日分作成し、
+最後にロールアップを作り直す。既存のテーブルは削除して作り直す。
+
+    python benchmarks/seed.py --devices 5 --days 90
+    python benchmarks/seed.py --database-url postgresql://localhost/fit2go_bench
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from common import add_database_argument, create_benchmark_app
+from sqlalchemy import insert
+
+
+def device_ids(count):
+    return [f"bench-{index:03d}" for index in range(count)]
+
+
+def seed(devices, days, session_minutes, batch_size=20000):
+    """1Hzのセッションを投入し、(セッション数, データポイント数)を返す"""
+    from app.models import DataPoint, FitnessSession, db
+
+    session_length = session_minutes * 60
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    session_count = 0
+    point_count = 0
+    rows = []
+
+    def flush():
+        if rows:
+            db.session.execute(insert(DataPoint), rows)
+            rows.clear()
+
+    for day in range(days, 0, -1):
+        date = today - timedelta(days=day - 1)
+        for device_id in device_ids(devices):
+            started = date + timedelta(hours=random.randint(7, 19), minutes=random.randint(0, 59))
+            if started + timedelta(seconds=session_length) > datetime.now():
+                continue  # 当日分は現在時刻より前に収まるセッションのみ
+
+            speed = random.uniform(12, 28)
+            session = FitnessSession(
+                device_id=device_id,
+                start_time=started,
+                end_time=started + timedelta(seconds=session_length - 1),
+                total_time_seconds=session_length,
+                total_distance_km=speed * session_length / 3600,
+                total_calories_kcal=session_length * 0.1,
+                average_speed_kmh=speed,
+                average_rpm=speed * 3,
+                average_mets=speed / 5,
+            )
+            db.session.add(session)
+            db.session.flush()
+            session_count += 1
+
+            for second in range(session_length):
+                current = max(0.0, random.gauss(speed, 3))
+                rows.append(
+                    {
+                        "session_id": session.id,
+                        "timestamp": started + timedelta(seconds=second),
+                        "speed_kmh": current,
+                        "rpm": current * 3,
+                        "distance_km": speed * second / 3600,
+                        "calories_kcal": second * 0.1,
+                        "time_seconds": second,
+                        "mets": current / 5,
+                    }
+                )
+                if len(rows) >= batch_size:
+                    flush()
+            point_count += session_length
+        flush()
+        db.session.commit()
+
+    return session_count, point_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_database_argument(parser)
+    parser.add_argument("--devices", type=int, default=3)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--session-minutes", type=int, default=45)
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.random_seed)
+    app = create_benchmark_app(args.database_url)
+    with app.app_context():
+        from app.models import db
+        from app.services.rollups import rebuild_rollups
+
+        db.drop_all()
+        db.create_all()
+
+        print(f"Seeding {args.devices} devices x {args.days} days into {args.database_url} ...")
+        started = time.perf_counter()
+        sessions, points = seed(args.devices, args.days, args.session_minutes)
+        print(f"Seeded {sessions:,} sessions / {points:,} data points in {time.perf_counter() - started:.1f}s")
+
+        today = datetime.now().date()
+        started = time.perf_counter()
+        rebuild_rollups(today - timedelta(days=args.days), today)
+        print(f"Rebuilt rollups in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
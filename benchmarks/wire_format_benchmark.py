@@ -0,0 +1,140 @@
+"""/api/data のJSONとバイナリフレーム（application/x-fit2go-frames）を比較するベンチマーク
+
+1Hzの合成サンプルについて、リクエストボディのサイズ、パースにかかるCPU時間、
+Flaskのテストクライアント経由でのスループット（SQLite）を表示する。
+
+    python benchmarks/wire_format_benchmark.py
+    python benchmarks/wire_format_benchmark.py --samples 7200 --batch 30
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# configはimport時に環境変数を読むため、appをimportする前に設定する
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(), "wire_format_benchmark.db"
+)
+
+from app import create_app  # noqa: E402
+from app.models import db  # noqa: E402
+from app.services.frames import (  # noqa: E402
+    FRAMES_MIMETYPE,
+    decode_frames,
+    encode_frames,
+)
+from app.services.ingest import point_values  # noqa: E402
+
+DEVICE_ID = "bench-device"
+
+
+def make_packets(count):
+    start_ms = int(time.time() * 1000)
+    packets = []
+    for second in range(count):
+        packets.append(
+            {
+                "device_id": DEVICE_ID,
+                "timestamp_ms": start_ms + second * 1000,
+                "speed_kmh": round(random.uniform(0, 40), 2),
+                "rpm": round(random.uniform(0, 120), 1),
+                "session_time_s": second,
+                "session_dist_km": round(second * 0.005, 3),
+                "session_cal_kcal": round(second * 0.1, 1),
+                "mets": round(random.uniform(1, 8), 2),
+                "total_time_s": 36000 + second,
+                "total_dist_km": round(500 + second * 0.005, 3),
+                "total_cal_kcal": round(20000 + second * 0.1, 1),
+            }
+        )
+    return packets
+
+
+def batches(packets, size):
+    return [packets[i : i + size] for i in range(0, len(packets), size)]
+
+
+def measure_parse(json_bodies, frame_bodies, repeat):
+    """ボディのデコードからDataPoint列値の組み立てまでのCPU時間（繰り返しのうち最短）"""
+    results = {}
+    for name, bodies, decode in (
+        ("json", json_bodies, lambda body: [json.loads(body)]),
+        ("frames", frame_bodies, lambda body: decode_frames(body)[1]),
+    ):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for body in bodies:
+                for packet in decode(body):
+                    point_values(packet)
+            best = min(best, time.perf_counter() - started)
+        results[name] = best
+    return results
+
+
+def measure_requests(app, name, bodies, content_type, samples):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    client = app.test_client()
+    headers = {"Content-Type": content_type}
+
+    started = time.perf_counter()
+    for body in bodies:
+        response = client.post("/api/data", data=body, headers=headers)
+        if response.status_code >= 300:
+            raise SystemExit(f"{name}: {response.status_code} {response.get_data(as_text=True)}")
+    elapsed = time.perf_counter() - started
+    return len(bodies) / elapsed, samples / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=3600)
+    parser.add_argument("--batch", type=int, default=10, help="1リクエストあたりのサンプル数（frames）")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    packets = make_packets(args.samples)
+    json_bodies = [json.dumps(packet).encode("utf-8") for packet in packets]
+    frame_bodies = [encode_frames(DEVICE_ID, batch) for batch in batches(packets, args.batch)]
+    single_frame_bodies = [encode_frames(DEVICE_ID, [packet]) for packet in packets]
+
+    json_bytes = sum(map(len, json_bodies))
+    frame_bytes = sum(map(len, frame_bodies))
+    print(f"{args.samples:,} samples, frames batched by {args.batch}\n")
+    print("== body size")
+    print(f"   json:   {json_bytes:>10,} bytes  ({json_bytes / args.samples:.1f} bytes/sample)")
+    print(f"   frames: {frame_bytes:>10,} bytes  ({frame_bytes / args.samples:.1f} bytes/sample)")
+    print(f"   ratio:  {json_bytes / frame_bytes:.1f}x smaller\n")
+
+    parse = measure_parse(json_bodies, frame_bodies, args.repeat)
+    print("== parse CPU (decode + point_values)")
+    for name, seconds in parse.items():
+        print(f"   {name:6}: {seconds * 1000:9.2f} ms  ({args.samples / seconds:,.0f} samples/s)")
+    print()
+
+    app = create_app()
+    print("== end-to-end via test client (direct ingest, SQLite)")
+    for name, bodies, content_type in (
+        ("json", json_bodies, "application/json"),
+        ("frames x1", single_frame_bodies, FRAMES_MIMETYPE),
+        (f"frames x{args.batch}", frame_bodies, FRAMES_MIMETYPE),
+    ):
+        requests_per_second, samples_per_second = measure_requests(
+            app, name, bodies, content_type, args.samples
+        )
+        print(
+            f"   {name:10}: {len(bodies):>6,} requests  "
+            f"{requests_per_second:8.0f} req/s  {samples_per_second:8.0f} samples/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -35,10 +36,100 @@ class Config:
             raise ValueError("API_TOKEN must be set in production")
         API_TOKEN = "dev-token-please-change-in-production"
 
+    # Logging configuration
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    # DEBUGログを呼び出し箇所ごとに間引く割合（1.0で全件）と1秒あたりの上限（0で無制限）
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", 1.0))
+    LOG_DEBUG_RATE_LIMIT = int(os.environ.get("LOG_DEBUG_RATE_LIMIT", 10))
+
+    # Request / SQL instrumentation (/metrics, Server-Timingヘッダー)
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+
+    # Ingest configuration
+    # "direct": 1パケットごとにコミット / "buffered": まとめてコミット
+    INGEST_MODE = os.environ.get("INGEST_MODE", "direct")
+    INGEST_BUFFER_MAX_SIZE = int(os.environ.get("INGEST_BUFFER_MAX_SIZE", 500))
+    INGEST_FLUSH_INTERVAL_SECONDS = float(
+        os.environ.get("INGEST_FLUSH_INTERVAL_SECONDS", 2.0)
+    )
+    # バッファに溜められるサンプル数の上限（超えると503を返す）
+    INGEST_BUFFER_MAX_PENDING = int(os.environ.get("INGEST_BUFFER_MAX_PENDING", 10000))
+    # 書き込みに続けて失敗したセッションのサンプルを破棄するまでの回数
+    INGEST_FLUSH_MAX_RETRIES = int(os.environ.get("INGEST_FLUSH_MAX_RETRIES", 5))
+
+    # Raw packet archive
+    # 受信パケットをraw_packetsテーブルに圧縮して保存する
+    RAW_ARCHIVE_ENABLED = os.environ.get("RAW_ARCHIVE_ENABLED", "false").lower() in ("1", "true", "yes")
+    # flask sessions purge-raw で削除するまでの日数
+    RAW_ARCHIVE_RETENTION_DAYS = int(os.environ.get("RAW_ARCHIVE_RETENTION_DAYS", 30))
+    # セッションのraw_data（最後のパケット）を更新する最短の間隔
+    RAW_SUMMARY_INTERVAL_SECONDS = int(os.environ.get("RAW_SUMMARY_INTERVAL_SECONDS", 30))
+
+    # Data point archive
+    # 終了からこの時間が経ったセッションを flask sessions compact で列形式に圧縮する
+    SESSION_COMPACT_AFTER_HOURS = int(os.environ.get("SESSION_COMPACT_AFTER_HOURS", 24))
+
+    # Session detail API
+    # GET /api/sessions/<id>が1回に返すデータポイント数（limit未指定時）と上限
+    SESSION_POINTS_PAGE_SIZE = int(os.environ.get("SESSION_POINTS_PAGE_SIZE", 1000))
+    SESSION_POINTS_MAX_PAGE_SIZE = int(os.environ.get("SESSION_POINTS_MAX_PAGE_SIZE", 10000))
+
+    # Session statistics
+    # この速度（km/h）以上のサンプル間の時間を移動時間として集計する
+    SESSION_MOVING_SPEED_KMH = float(os.environ.get("SESSION_MOVING_SPEED_KMH", 1.0))
+
+    # Session idle timeout
+    # 最後の受信からこの秒数を超えたセッションを終了する（0で無効）
+    SESSION_IDLE_TIMEOUT_SECONDS = int(os.environ.get("SESSION_IDLE_TIMEOUT_SECONDS", 600))
+    # バックグラウンドで終了判定を行う間隔（0でスレッドを起動しない。flask sessions sweepで実行）
+    SESSION_SWEEP_INTERVAL_SECONDS = int(os.environ.get("SESSION_SWEEP_INTERVAL_SECONDS", 60))
+    SESSION_IDLE_AUTO_SYNC = os.environ.get("SESSION_IDLE_AUTO_SYNC", "false").lower() in ("1", "true", "yes")
+
+    # Sync job queue (Google Fit / Health Connect)
+    # プロセス内で同期ジョブを実行するスレッド数（0でflask sync workerを別途起動）
+    SYNC_WORKER_THREADS = int(os.environ.get("SYNC_WORKER_THREADS", 2))
+    SYNC_POLL_INTERVAL_SECONDS = float(os.environ.get("SYNC_POLL_INTERVAL_SECONDS", 5))
+    SYNC_JOB_MAX_ATTEMPTS = int(os.environ.get("SYNC_JOB_MAX_ATTEMPTS", 5))
+    # 再試行の間隔（失敗するたびに倍にする）
+    SYNC_RETRY_BACKOFF_SECONDS = int(os.environ.get("SYNC_RETRY_BACKOFF_SECONDS", 30))
+    # runningのままこの秒数を超えたジョブは中断したとみなして再実行する
+    SYNC_JOB_LOCK_TIMEOUT_SECONDS = int(os.environ.get("SYNC_JOB_LOCK_TIMEOUT_SECONDS", 600))
+
+    # Live session state cache ("memory" or "redis")
+    LIVE_STATE_BACKEND = os.environ.get("LIVE_STATE_BACKEND", "memory")
+    LIVE_STATE_REDIS_URL = os.environ.get("LIVE_STATE_REDIS_URL", "redis://localhost:6379/0")
+    LIVE_STATE_TTL_SECONDS = int(os.environ.get("LIVE_STATE_TTL_SECONDS", 60))
+    LIVE_STATE_STALE_SECONDS = int(os.environ.get("LIVE_STATE_STALE_SECONDS", 5))
+    # キャッシュに無くDBから組み立てた結果（セッション無しを含む）を保持する秒数（0で無効）
+    LIVE_STATE_FALLBACK_TTL_SECONDS = int(os.environ.get("LIVE_STATE_FALLBACK_TTL_SECONDS", 5))
+
+    # Server-Sent Events (/api/stream)
+    # ワーカー間の配信に使うUnixソケットのディレクトリ（空文字で無効）
+    STREAM_FANOUT_DIR = os.environ.get(
+        "STREAM_FANOUT_DIR", os.path.join(tempfile.gettempdir(), "fit2go-stream")
+    )
+    STREAM_HEARTBEAT_SECONDS = int(os.environ.get("STREAM_HEARTBEAT_SECONDS", 15))
+    STREAM_RETRY_MS = int(os.environ.get("STREAM_RETRY_MS", 3000))
+    STREAM_HISTORY_SIZE = int(os.environ.get("STREAM_HISTORY_SIZE", 600))
+
     # Google Fit OAuth 2.0 configuration
     GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID", "your-client-id")
     GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET", "your-client-secret")
     GOOGLE_REDIRECT_URI = os.environ.get("GOOGLE_REDIRECT_URI", "http://localhost:5000/google-fit/callback")
+    APP_ID = os.environ.get("APP_ID", "fit2go-dashboard")
+    # サーバー側に保存する認証情報の暗号鍵（Fernet鍵。未設定の場合はSECRET_KEYから導出）
+    CREDENTIALS_ENCRYPTION_KEY = os.environ.get("CREDENTIALS_ENCRYPTION_KEY")
+
+    # Google Fit upload
+    # Fitness REST APIのURL（空文字で既定のURL。ローカルのスタブで試す場合に設定）
+    GOOGLE_FIT_API_ENDPOINT = os.environ.get("GOOGLE_FIT_API_ENDPOINT", "")
+    # データ型ごとにこの秒数の時間枠でチャンクに分けてアップロードする
+    GOOGLE_FIT_CHUNK_SECONDS = int(os.environ.get("GOOGLE_FIT_CHUNK_SECONDS", 900))
+    GOOGLE_FIT_UPLOAD_THREADS = int(os.environ.get("GOOGLE_FIT_UPLOAD_THREADS", 4))
+    # アクセストークンの期限がこの秒数以内ならアップロード前に更新する
+    GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS = int(
+        os.environ.get("GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS", 300)
+    )
 
 
 class DevelopmentConfig(Config):
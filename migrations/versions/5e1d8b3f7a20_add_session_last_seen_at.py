@@ -0,0 +1,26 @@
+"""add last_seen_at to fitness_sessions
+
+Revision ID: 5e1d8b3f7a20
+Revises: d2b7e6a41c05
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e1d8b3f7a20'
+down_revision = 'd2b7e6a41c05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('fitness_sessions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_seen_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('fitness_sessions', schema=None) as batch_op:
+        batch_op.drop_column('last_seen_at')
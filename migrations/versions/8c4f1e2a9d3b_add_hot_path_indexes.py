@@ -0,0 +1,42 @@
+"""add indexes for hot query paths
+
+Revision ID: 8c4f1e2a9d3b
+Revises: 3a72493857b1
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4f1e2a9d3b'
+down_revision = '3a72493857b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('data_points', schema=None) as batch_op:
+        batch_op.create_index('ix_data_points_session_id_timestamp', ['session_id', 'timestamp'], unique=False)
+        batch_op.create_index('ix_data_points_timestamp', ['timestamp'], unique=False)
+
+    with op.batch_alter_table('fitness_sessions', schema=None) as batch_op:
+        batch_op.create_index('ix_fitness_sessions_start_time', ['start_time'], unique=False)
+        batch_op.create_index(
+            'ix_fitness_sessions_active_device_id',
+            ['device_id'],
+            unique=False,
+            postgresql_where=sa.text('end_time IS NULL'),
+            sqlite_where=sa.text('end_time IS NULL'),
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('fitness_sessions', schema=None) as batch_op:
+        batch_op.drop_index('ix_fitness_sessions_active_device_id')
+        batch_op.drop_index('ix_fitness_sessions_start_time')
+
+    with op.batch_alter_table('data_points', schema=None) as batch_op:
+        batch_op.drop_index('ix_data_points_timestamp')
+        batch_op.drop_index('ix_data_points_session_id_timestamp')
@@ -0,0 +1,187 @@
+"""backfill rollup tables
+
+Revision ID: b41f6c2d9e87
+Revises: 2526a17f400e
+Create Date: 2026-10-18 17:05:00.000000
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41f6c2d9e87'
+down_revision = '2526a17f400e'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+SUM_COLUMNS = (
+    'total_time_seconds',
+    'total_distance_km',
+    'total_calories_kcal',
+    'speed_sum',
+    'rpm_sum',
+    'mets_sum',
+    'sample_count',
+)
+
+fitness_sessions = sa.table(
+    'fitness_sessions',
+    sa.column('id', sa.Integer),
+    sa.column('device_id', sa.String),
+    sa.column('start_time', sa.DateTime),
+    sa.column('total_time_seconds', sa.Integer),
+    sa.column('total_distance_km', sa.Float),
+    sa.column('total_calories_kcal', sa.Float),
+)
+data_points = sa.table(
+    'data_points',
+    sa.column('id', sa.Integer),
+    sa.column('session_id', sa.Integer),
+    sa.column('timestamp', sa.DateTime),
+    sa.column('speed_kmh', sa.Float),
+    sa.column('rpm', sa.Float),
+    sa.column('mets', sa.Float),
+    sa.column('time_seconds', sa.Integer),
+    sa.column('distance_km', sa.Float),
+    sa.column('calories_kcal', sa.Float),
+)
+session_archives = sa.table('session_archives', sa.column('session_id', sa.Integer))
+
+
+def _rollup_table(name):
+    return sa.table(
+        name,
+        sa.column('device_id', sa.String),
+        sa.column('bucket_start', sa.DateTime),
+        *[sa.column(column, sa.Float) for column in SUM_COLUMNS],
+    )
+
+
+hourly_rollups = _rollup_table('hourly_rollups')
+daily_rollups = _rollup_table('daily_rollups')
+
+TRUNCATE = (
+    (hourly_rollups, lambda ts: ts.replace(minute=0, second=0, microsecond=0)),
+    (daily_rollups, lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0)),
+)
+
+
+def _delta(current, previous):
+    # app/services/rollups.pyの_deltaと同じ（カウンタがリセットされた場合は現在値）
+    current = current or 0
+    if previous is None:
+        return current
+    delta = current - previous
+    return delta if delta >= 0 else current
+
+
+def _add(buckets, device_id, timestamp, increments):
+    for table, truncate in TRUNCATE:
+        bucket = buckets.setdefault(
+            (table.name, device_id, truncate(timestamp)), dict.fromkeys(SUM_COLUMNS, 0)
+        )
+        for column, value in increments.items():
+            bucket[column] += value
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    # 取り込み時の更新やflask rollups rebuildで既に埋まっている場合は何もしない
+    for table in (hourly_rollups, daily_rollups):
+        if connection.execute(sa.select(sa.func.count()).select_from(table)).scalar():
+            return
+
+    buckets = {}
+
+    # データポイントのあるセッションは、取り込み時と同じくサンプルごとの増分を加算する
+    rows = connection.execution_options(stream_results=True).execute(
+        sa.select(
+            data_points.c.session_id,
+            fitness_sessions.c.device_id,
+            data_points.c.timestamp,
+            data_points.c.speed_kmh,
+            data_points.c.rpm,
+            data_points.c.mets,
+            data_points.c.time_seconds,
+            data_points.c.distance_km,
+            data_points.c.calories_kcal,
+        )
+        .join(fitness_sessions, data_points.c.session_id == fitness_sessions.c.id)
+        .order_by(data_points.c.session_id, data_points.c.timestamp, data_points.c.id)
+    )
+    previous = None
+    for row in rows:
+        if previous is not None and previous.session_id != row.session_id:
+            previous = None
+        _add(
+            buckets,
+            row.device_id,
+            row.timestamp,
+            {
+                'total_time_seconds': int(
+                    _delta(row.time_seconds, previous.time_seconds if previous else None)
+                ),
+                'total_distance_km': _delta(
+                    row.distance_km, previous.distance_km if previous else None
+                ),
+                'total_calories_kcal': _delta(
+                    row.calories_kcal, previous.calories_kcal if previous else None
+                ),
+                'speed_sum': row.speed_kmh or 0.0,
+                'rpm_sum': row.rpm or 0.0,
+                'mets_sum': row.mets or 0.0,
+                'sample_count': 1,
+            },
+        )
+        previous = row
+
+    # データポイントの無い（ヘッダーだけを取り込んだ）セッションは、セッションの合計を開始時刻に加算する
+    has_points = sa.select(data_points.c.id).where(
+        data_points.c.session_id == fitness_sessions.c.id
+    ).exists()
+    is_archived = sa.select(session_archives.c.session_id).where(
+        session_archives.c.session_id == fitness_sessions.c.id
+    ).exists()
+    for session in connection.execute(
+        sa.select(fitness_sessions).where(~has_points, ~is_archived)
+    ):
+        _add(
+            buckets,
+            session.device_id,
+            session.start_time,
+            {
+                'total_time_seconds': int(session.total_time_seconds or 0),
+                'total_distance_km': session.total_distance_km or 0.0,
+                'total_calories_kcal': session.total_calories_kcal or 0.0,
+            },
+        )
+
+    for table in (hourly_rollups, daily_rollups):
+        values = [
+            dict(sums, device_id=device_id, bucket_start=bucket_start)
+            for (name, device_id, bucket_start), sums in buckets.items()
+            if name == table.name
+        ]
+        if values:
+            op.bulk_insert(table, values)
+
+    # 圧縮済みのセッションはアプリのコードで復元する必要があるため、ここでは加算しない
+    archived = connection.execute(
+        sa.select(sa.func.count()).select_from(session_archives)
+    ).scalar()
+    if archived:
+        logger.warning(
+            'Skipped %d compacted session(s); run `flask rollups rebuild` for their dates',
+            archived,
+        )
+
+
+def downgrade():
+    # 埋めた行と取り込み時に加算した行は区別できないため、ロールアップはそのまま残す
+    pass
@@ -0,0 +1,43 @@
+"""add hourly and daily rollup tables
+
+Revision ID: d2b7e6a41c05
+Revises: 8c4f1e2a9d3b
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b7e6a41c05'
+down_revision = '8c4f1e2a9d3b'
+branch_labels = None
+depends_on = None
+
+
+def _create_rollup_table(name):
+    op.create_table(name,
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('device_id', sa.String(length=50), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('total_time_seconds', sa.Integer(), nullable=False),
+    sa.Column('total_distance_km', sa.Float(), nullable=False),
+    sa.Column('total_calories_kcal', sa.Float(), nullable=False),
+    sa.Column('speed_sum', sa.Float(), nullable=False),
+    sa.Column('rpm_sum', sa.Float(), nullable=False),
+    sa.Column('mets_sum', sa.Float(), nullable=False),
+    sa.Column('sample_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('device_id', 'bucket_start', name=f'uq_{name}_device_bucket')
+    )
+
+
+def upgrade():
+    _create_rollup_table('hourly_rollups')
+    _create_rollup_table('daily_rollups')
+
+
+def downgrade():
+    op.drop_table('daily_rollups')
+    op.drop_table('hourly_rollups')